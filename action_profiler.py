@@ -0,0 +1,112 @@
+"""
+تسجيل أداء إجراءات الواجهة عند الطلب: arm(n) يغلف الاستدعاءات الـ n التالية لأي
+ui_action بمحلل أداء ويحفظ الناتج في مجلد profiles/ باسم الإجراء وحجم البيانات.
+
+- cProfile (افتراضي): ملف .prof يفتح بـ snakeviz أو يحول إلى flame graph.
+- pyinstrument (اختياري إن كان مثبتًا): ملف .html تفاعلي.
+"""
+import contextlib
+import cProfile
+import datetime
+import os
+import re
+import threading
+
+from sqlalchemy import text
+
+from database_setup import engine
+from query_stats import query_stats
+
+try:
+    from pyinstrument import Profiler as _PyinstrumentProfiler
+except ImportError: # pyinstrument اختياري
+    _PyinstrumentProfiler = None
+
+PROFILES_DIR = "profiles"
+HAS_PYINSTRUMENT = _PyinstrumentProfiler is not None
+
+
+def _dataset_size():
+    with engine.connect() as conn:
+        sessions, transactions = conn.execute(text(
+            "SELECT (SELECT COUNT(*) FROM cash_sessions), (SELECT COUNT(*) FROM transactions)"
+        )).one()
+    return sessions, transactions
+
+
+def _slug(value):
+    return re.sub(r"[^\w.-]+", "_", value).strip("_") or "action"
+
+
+class ActionProfiler:
+    def __init__(self, output_dir=PROFILES_DIR):
+        self.output_dir = output_dir
+        self._lock = threading.Lock()
+        self._remaining = 0
+        self._use_pyinstrument = False
+        self._active = False
+        self.saved = [] # مسارات الملفات المحفوظة
+
+    @property
+    def remaining(self):
+        return self._remaining
+
+    def arm(self, count=5, use_pyinstrument=False):
+        if use_pyinstrument and not HAS_PYINSTRUMENT:
+            raise RuntimeError("pyinstrument غير مثبت")
+        with self._lock:
+            self._remaining = count
+            self._use_pyinstrument = use_pyinstrument
+        query_stats.add_action_hook(self._hook)
+
+    def disarm(self):
+        with self._lock:
+            self._remaining = 0
+
+    def _hook(self, name, qualname):
+        # نحلل الإجراء الخارجي فقط في الخيط الرئيسي؛ المحللات لا تتداخل
+        if threading.current_thread() is not threading.main_thread():
+            return None
+        with self._lock:
+            if self._remaining <= 0 or self._active:
+                return None
+            self._remaining -= 1
+            self._active = True
+            use_pyinstrument = self._use_pyinstrument
+        return self._profile(name, qualname, use_pyinstrument)
+
+    @contextlib.contextmanager
+    def _profile(self, name, qualname, use_pyinstrument):
+        profiler = _PyinstrumentProfiler() if use_pyinstrument else cProfile.Profile()
+        started = datetime.datetime.now()
+        try:
+            if use_pyinstrument: profiler.start()
+            else: profiler.enable()
+            yield
+        finally:
+            if use_pyinstrument: profiler.stop()
+            else: profiler.disable()
+            try:
+                self.saved.append(self._save(profiler, qualname or name, started, use_pyinstrument))
+            except Exception as e:
+                print(f"Warning: could not save profile for '{name}': {e}")
+            finally:
+                with self._lock:
+                    self._active = False
+
+    def _save(self, profiler, action, started, use_pyinstrument):
+        os.makedirs(self.output_dir, exist_ok=True)
+        sessions, transactions = _dataset_size()
+        base = f"{started:%Y%m%d_%H%M%S}_{_slug(action)}_s{sessions}_t{transactions}"
+        if use_pyinstrument:
+            path = os.path.join(self.output_dir, base + ".html")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(profiler.output_html())
+        else:
+            path = os.path.join(self.output_dir, base + ".prof")
+            profiler.dump_stats(path)
+        print(f"Profile saved: {path}")
+        return path
+
+
+action_profiler = ActionProfiler()
@@ -1,3 +1,4 @@
+import os
 import sys
 import datetime
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
@@ -6,14 +7,31 @@ from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout,
                              QDialogButtonBox, QHBoxLayout, QFrame,
                              QFormLayout, QListWidget, QListWidgetItem, QStackedWidget,
                              QComboBox, QSizePolicy, QStyle, QSplitter, QTextEdit,
-                             QCheckBox, QMenu, QDateEdit)
+                             QCheckBox, QMenu, QDateEdit, QFileDialog, QSpinBox)
 from PyQt6.QtGui import (QColor, QMouseEvent, QDoubleValidator, QIcon, QFont, 
-                         QPainter, QPen, QBrush, QAction)
-from PyQt6.QtCore import Qt, QPoint, QSize, QDate, QRect
+                         QPainter, QPen, QBrush, QAction, QShortcut, QKeySequence)
+from PyQt6.QtCore import Qt, QPoint, QSize, QDate, QRect, QObject, QTimer, pyqtSignal
 
 # استيراد النماذج وقاعدة البيانات
-from database_setup import User, SessionLocal, CashSession, Transaction, FlexiTransaction, init_db
-from sqlalchemy import extract, func
+from database_setup import User, SessionLocal, CashSession, Transaction, FlexiTransaction, init_db, business_today
+from search_index import search_transactions, highlight_snippet
+from unit_of_work import session_scope, session_stats, read_snapshot, snapshot_stats, dispose_read_engine
+from dto import UserDTO, fetch_session
+from read_models import (fetch_session_rows, fetch_session_page, fetch_session_totals, fetch_daily_expenses,
+                         date_range_criteria, month_criteria)
+from query_stats import ui_action, query_stats
+from stall_watchdog import read_stall_log
+from action_profiler import action_profiler, HAS_PYINSTRUMENT
+from backup_service import start_backup_service, list_backups, verify_backup, BackupError
+from write_queue import write_queue
+from read_api import stop_read_api
+from anomaly import anomaly_detector, describe as describe_anomalies
+from session_bulk import delete_sessions, reassign_sessions, close_stale_sessions, STALE_SESSION_HOURS
+from pdf_reports import get_pdf_renderer
+
+# -- إضافة --: جسر إشارات Qt لنتيجة النسخ الاحتياطي (تصل من خيط النسخ إلى خيط الواجهة)
+class BackupBridge(QObject):
+    finished = pyqtSignal(object, object, bool) # BackupResult أو None، رسالة الخطأ أو None، استعادة؟
 
 # --- Custom Bar Chart Widget ---
 class BarChartWidget(QWidget):
@@ -186,7 +204,7 @@ class PasswordConfirmDialog(CustomDialog):
 
 class EditSessionDialog(CustomDialog):
     def __init__(self, session: CashSession, parent=None):
-        super().__init__(f"تعديل جلسة العامل: {session.user.username if session.user else 'محذوف'}", parent)
+        super().__init__(f"تعديل جلسة العامل: {session.username or 'محذوف'}", parent)
         self.setMinimumWidth(450); self.session = session
         layout = self.content_layout; form_layout = QFormLayout()
         
@@ -219,12 +237,28 @@ class EditSessionDialog(CustomDialog):
             return {"start_balance": start_balance, "end_balance": end_balance, "start_flexi": start_flexi, "end_flexi": end_flexi}
         except ValueError: return None
 
+# -- إضافة --: اختيار العامل الذي تنقل إليه الجلسات المحددة
+class ReassignSessionsDialog(CustomDialog):
+    def __init__(self, count, users, parent=None):
+        super().__init__("نقل الجلسات إلى عامل آخر", parent)
+        self.setMinimumWidth(400)
+        layout = self.content_layout
+        layout.addWidget(QLabel(f"نقل {count} جلسة محددة إلى العامل:"))
+        self.user_combo = QComboBox()
+        for user_id, username in users: self.user_combo.addItem(username, user_id)
+        layout.addWidget(self.user_combo)
+        self.buttons = QDialogButtonBox(QDialogButtonBox.StandardButton.Ok | QDialogButtonBox.StandardButton.Cancel)
+        self.buttons.accepted.connect(self.accept); self.buttons.rejected.connect(self.reject)
+        layout.addWidget(self.buttons)
+    def get_user(self): return self.user_combo.currentData(), self.user_combo.currentText()
+
 # --- Session Details Dialog ---
 class SessionDetailsDialog(CustomDialog):
     def __init__(self, session_id, parent=None):
-        self.db_session = SessionLocal()
-        self.session = self.db_session.query(CashSession).get(session_id)
-        super().__init__(f"تفاصيل الجلسة - {self.session.user.username if self.session.user else 'محذوف'}", parent)
+        self.session_id = session_id
+        with session_scope() as db:
+            self.session = fetch_session(db, session_id)
+        super().__init__(f"تفاصيل الجلسة - {self.session.username or 'محذوف'}", parent)
         self.setMinimumSize(800, 600)
         self.setup_details_ui()
         self.load_session_data()
@@ -265,8 +299,10 @@ class SessionDetailsDialog(CustomDialog):
         splitter.setSizes([500, 300])
         self.content_layout.addWidget(splitter)
 
+    @ui_action("تفاصيل الجلسة", max_statements=3)
     def load_session_data(self):
-        self.db_session.refresh(self.session)
+        with session_scope() as db:
+            self.session = fetch_session(db, self.session_id)
         self.notes_editor.setText(self.session.notes or "")
         self.expenses_table.setRowCount(0)
         transactions = sorted(self.session.transactions, key=lambda t: t.timestamp, reverse=True)
@@ -295,39 +331,37 @@ class SessionDetailsDialog(CustomDialog):
         if not selected_items:
             QMessageBox.warning(self, "خطأ", "الرجاء تحديد مصروف أولاً.")
             return None
-        transaction_id = selected_items[0].data(Qt.ItemDataRole.UserRole)
-        return self.db_session.query(Transaction).get(transaction_id)
+        return selected_items[0].data(Qt.ItemDataRole.UserRole)
         
     def edit_expense(self):
         # Implementation similar to AddTransactionDialog would be needed here
         # For brevity, let's assume a simplified modification logic
         QMessageBox.information(self, "ميزة", "سيتم تنفيذ ميزة تعديل المصروف هنا.")
 
+    @ui_action("حذف مصروف (المشرف)")
     def delete_expense(self):
-        transaction = self.get_selected_transaction()
-        if transaction:
+        transaction_id = self.get_selected_transaction()
+        if transaction_id:
             reply = QMessageBox.question(self, 'تأكيد الحذف', f"هل أنت متأكد من حذف هذا المصروف؟",
                                          QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No, QMessageBox.StandardButton.No)
             if reply == QMessageBox.StandardButton.Yes:
-                self.db_session.delete(transaction)
-                self.db_session.commit()
+                with session_scope() as db:
+                    transaction = db.get(Transaction, transaction_id)
+                    if transaction is not None: db.delete(transaction)
                 self.load_session_data()
 
+    @ui_action("حفظ ملاحظات الجلسة (المشرف)")
     def save_notes(self):
-        self.session.notes = self.notes_editor.toPlainText()
-        self.db_session.commit()
+        with session_scope() as db:
+            session = db.get(CashSession, self.session_id)
+            if session is not None: session.notes = self.notes_editor.toPlainText()
         QMessageBox.information(self, "نجاح", "تم حفظ الملاحظات.")
-        
-    def closeEvent(self, event):
-        self.db_session.close()
-        super().closeEvent(event)
 
 # --- Main Admin Dashboard ---
 class AdminDashboard(QMainWindow):
     def __init__(self, user: User):
         super().__init__()
         self.user = user
-        self.db_session = SessionLocal()
         self.show_timestamps = False # Default setting
         self.setWindowTitle(f"لوحة تحكم المشرف - مرحباً {self.user.username}")
         self.setGeometry(100, 100, 1400, 850)
@@ -338,6 +372,21 @@ class AdminDashboard(QMainWindow):
         self.icon_users = self.style().standardIcon(QStyle.StandardPixmap.SP_DirHomeIcon)
         self.icon_dashboard = self.style().standardIcon(QStyle.StandardPixmap.SP_DriveNetIcon)
         self.icon_settings = self.style().standardIcon(QStyle.StandardPixmap.SP_FileDialogDetailedView)
+        self.icon_search = self.style().standardIcon(QStyle.StandardPixmap.SP_FileDialogContentsView)
+        self.search_page_size = 25
+        self.profile_page_size = 50
+        self.profile_criteria, self.profile_cursor, self.profile_total = (), None, 0
+        self.search_page = 0
+        self.search_total = 0
+        self.diagnostics_rows = []
+        self.backup_service = start_backup_service()
+        self.backup_bridge = BackupBridge(self)
+        self.backup_bridge.finished.connect(self.on_backup_finished)
+        self.backup_listener = self.backup_bridge.finished.emit
+        self.backup_service.add_listener(self.backup_listener)
+        self.pdf_renderer = get_pdf_renderer()
+        self.pdf_renderer.batch_finished.connect(self.on_statements_exported)
+        self.pdf_batches = set()
 
         self.setup_ui()
         self.apply_styles()
@@ -366,6 +415,7 @@ class AdminDashboard(QMainWindow):
         QListWidgetItem(self.icon_dashboard, "لوحة المعلومات", self.nav_list)
         QListWidgetItem(self.icon_users, "إدارة العمال", self.nav_list)
         QListWidgetItem(self.icon_report, "تقرير الجلسات", self.nav_list)
+        QListWidgetItem(self.icon_search, "البحث", self.nav_list)
         
         separator = QFrame(); separator.setFrameShape(QFrame.Shape.HLine); separator.setObjectName("NavSeparator")
         users_title = QLabel("العمال"); users_title.setObjectName("NavGroupTitle")
@@ -387,6 +437,7 @@ class AdminDashboard(QMainWindow):
         self.create_sessions_report_page()    # Index 2
         self.create_settings_page()           # Index 3
         self.create_user_profile_page()       # Index 4
+        self.create_search_page()             # Index 5
 
     def create_dashboard_page(self):
         page = QWidget(); layout = QVBoxLayout(page); layout.setContentsMargins(25, 25, 25, 25); layout.setSpacing(20)
@@ -444,8 +495,8 @@ class AdminDashboard(QMainWindow):
         header_layout.addStretch()
 
         self.report_user_filter = QComboBox()
-        self.report_date_start = QDateEdit(QDate.currentDate().addMonths(-1))
-        self.report_date_end = QDateEdit(QDate.currentDate())
+        self.report_date_start = QDateEdit(QDate(business_today()).addMonths(-1))
+        self.report_date_end = QDateEdit(QDate(business_today()))
         self.report_date_start.setCalendarPopup(True)
         self.report_date_end.setCalendarPopup(True)
         self.report_user_filter.currentIndexChanged.connect(self.load_sessions_report)
@@ -475,7 +526,20 @@ class AdminDashboard(QMainWindow):
         header.setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
         for i in range(1, 11): header.setSectionResizeMode(i, QHeaderView.ResizeMode.ResizeToContents)
         self.reports_table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
-        layout.addWidget(self.reports_table); self.pages.addWidget(page)
+        # -- إضافة --: تحديد عدة جلسات (Ctrl/Shift) لعمليات المشرف المجمعة
+        self.reports_table.setSelectionBehavior(QTableWidget.SelectionBehavior.SelectRows)
+        self.reports_table.setSelectionMode(QTableWidget.SelectionMode.ExtendedSelection)
+        self.reports_table.itemSelectionChanged.connect(self.update_bulk_actions)
+        bulk_layout = QHBoxLayout()
+        self.bulk_selection_label = QLabel()
+        self.bulk_delete_btn = QPushButton("حذف المحدد"); self.bulk_delete_btn.clicked.connect(self.bulk_delete_sessions)
+        self.bulk_reassign_btn = QPushButton("نقل المحدد إلى عامل..."); self.bulk_reassign_btn.clicked.connect(self.bulk_reassign_sessions)
+        self.bulk_close_btn = QPushButton("إغلاق المفتوحة المتروكة"); self.bulk_close_btn.clicked.connect(self.bulk_close_stale_sessions)
+        self.bulk_close_btn.setToolTip(f"يغلق الجلسات المحددة المفتوحة منذ أكثر من {STALE_SESSION_HOURS:g} ساعة، دون أرصدة نهاية")
+        bulk_layout.addWidget(self.bulk_selection_label); bulk_layout.addStretch()
+        bulk_layout.addWidget(self.bulk_close_btn); bulk_layout.addWidget(self.bulk_reassign_btn); bulk_layout.addWidget(self.bulk_delete_btn)
+        layout.addWidget(self.reports_table); layout.addLayout(bulk_layout); self.pages.addWidget(page)
+        self.update_bulk_actions()
     
     def create_user_profile_page(self):
         page = QWidget()
@@ -487,7 +551,7 @@ class AdminDashboard(QMainWindow):
         profile_page_layout.addWidget(self.user_profile_widget)
         header_layout = QHBoxLayout()
         self.profile_title = QLabel("ملف العامل"); self.profile_title.setObjectName("PageTitle")
-        current_date = QDate.currentDate()
+        current_date = QDate(business_today())
         self.year_filter = QComboBox()
         for year in range(current_date.year() - 5, current_date.year() + 1): self.year_filter.addItem(str(year))
         self.year_filter.setCurrentText(str(current_date.year()))
@@ -498,7 +562,13 @@ class AdminDashboard(QMainWindow):
         header_layout.addWidget(self.profile_title); header_layout.addStretch()
         header_layout.addWidget(QLabel("الشهر:")); header_layout.addWidget(self.month_filter)
         header_layout.addWidget(QLabel("السنة:")); header_layout.addWidget(self.year_filter)
+        # -- إضافة --: كشوف PDF للشهر المحدد (تولد في الخلفية)
+        self.statement_pdf_btn = QPushButton("كشف PDF"); self.statement_pdf_btn.clicked.connect(self.export_user_statement)
+        self.all_statements_pdf_btn = QPushButton("كشوف جميع العمال PDF"); self.all_statements_pdf_btn.clicked.connect(self.export_all_statements)
+        header_layout.addWidget(self.statement_pdf_btn); header_layout.addWidget(self.all_statements_pdf_btn)
         self.user_profile_layout.addLayout(header_layout)
+        self.pdf_status_label = QLabel(""); self.pdf_status_label.setObjectName("SectionHint")
+        self.user_profile_layout.addWidget(self.pdf_status_label)
         stats_layout = QHBoxLayout(); stats_layout.setSpacing(20)
         self.profile_card_sessions = StatCard("عدد الجلسات", self.style().standardIcon(QStyle.StandardPixmap.SP_FileDialogListView))
         self.profile_card_expenses = StatCard("مجموع المصاريف", self.style().standardIcon(QStyle.StandardPixmap.SP_ArrowDown))
@@ -537,8 +607,12 @@ class AdminDashboard(QMainWindow):
         header.setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
         header.setSectionResizeMode(1, QHeaderView.ResizeMode.Stretch)
         for i in range(2, 10): header.setSectionResizeMode(i, QHeaderView.ResizeMode.ResizeToContents)
+        # -- إضافة --: الجلسات تحمل صفحة صفحة عند التمرير إلى أسفل الجدول
+        self.user_sessions_table.verticalScrollBar().valueChanged.connect(self.fill_user_sessions_viewport)
+        self.user_sessions_status = QLabel()
         sessions_layout.addWidget(sessions_title)
         sessions_layout.addWidget(self.user_sessions_table)
+        sessions_layout.addWidget(self.user_sessions_status)
 
         splitter.addWidget(chart_widget)
         splitter.addWidget(sessions_widget)
@@ -548,15 +622,269 @@ class AdminDashboard(QMainWindow):
         self.pages.addWidget(page)
         self.user_profile_widget.hide()
         
+    def create_search_page(self):
+        page = QWidget(); layout = QVBoxLayout(page); layout.setContentsMargins(25, 25, 25, 25); layout.setSpacing(15)
+        title = QLabel("البحث في المصاريف والفليكسي والملاحظات"); title.setObjectName("PageTitle")
+
+        search_bar = QHBoxLayout()
+        self.search_input = QLineEdit(); self.search_input.setPlaceholderText("اكتب كلمة للبحث، مثلاً: قهوة")
+        self.search_input.returnPressed.connect(self.run_search)
+        search_btn = QPushButton("بحث"); search_btn.clicked.connect(self.run_search)
+        search_bar.addWidget(self.search_input); search_bar.addWidget(search_btn)
+
+        self.search_results_table = QTableWidget(); self.search_results_table.setColumnCount(5)
+        self.search_results_table.setHorizontalHeaderLabels(["العامل", "تاريخ الجلسة", "النوع", "المبلغ", "المقتطف"])
+        header = self.search_results_table.horizontalHeader()
+        for i in range(4): header.setSectionResizeMode(i, QHeaderView.ResizeMode.ResizeToContents)
+        header.setSectionResizeMode(4, QHeaderView.ResizeMode.Stretch)
+        self.search_results_table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+        self.search_results_table.setSelectionBehavior(QTableWidget.SelectionBehavior.SelectRows)
+        self.search_results_table.cellDoubleClicked.connect(self.open_search_result)
+
+        pager_layout = QHBoxLayout()
+        self.search_prev_btn = QPushButton("السابق"); self.search_prev_btn.clicked.connect(lambda: self.change_search_page(-1))
+        self.search_next_btn = QPushButton("التالي"); self.search_next_btn.clicked.connect(lambda: self.change_search_page(1))
+        self.search_status_label = QLabel("")
+        pager_layout.addWidget(self.search_prev_btn); pager_layout.addStretch(); pager_layout.addWidget(self.search_status_label); pager_layout.addStretch(); pager_layout.addWidget(self.search_next_btn)
+        self.search_prev_btn.setEnabled(False); self.search_next_btn.setEnabled(False)
+
+        layout.addWidget(title); layout.addLayout(search_bar); layout.addWidget(self.search_results_table); layout.addLayout(pager_layout)
+        self.pages.addWidget(page)
+
     def create_settings_page(self):
         page = QWidget(); layout = QVBoxLayout(page); layout.setContentsMargins(25, 25, 25, 25); layout.setSpacing(15)
         title = QLabel("الإعدادات"); title.setObjectName("PageTitle")
         self.timestamps_checkbox = QCheckBox("إظهار وقت الفتح والإغلاق في الجداول")
         self.timestamps_checkbox.setChecked(self.show_timestamps)
         self.timestamps_checkbox.stateChanged.connect(self.toggle_timestamp_visibility)
-        layout.addWidget(title); layout.addWidget(self.timestamps_checkbox); layout.addStretch()
+
+        # -- إضافة --: مراقبة جلسات قاعدة البيانات (الجلسات المفتوحة وحجم خريطة الهوية)
+        db_stats_layout = QHBoxLayout()
+        self.db_stats_label = QLabel(); self.db_stats_label.setObjectName("SectionTitle")
+        refresh_stats_btn = QPushButton("تحديث"); refresh_stats_btn.clicked.connect(self.refresh_db_stats)
+        db_stats_layout.addWidget(self.db_stats_label); db_stats_layout.addStretch(); db_stats_layout.addWidget(refresh_stats_btn)
+        self.snapshot_stats_label = QLabel(); self.snapshot_stats_label.setWordWrap(True)
+
+        # -- إضافة --: قسم تشخيص مخفي (Ctrl+Shift+D) لقياس استعلامات SQL لكل إجراء
+        self.diagnostics_panel = self.create_diagnostics_panel()
+        self.diagnostics_panel.hide()
+        QShortcut(QKeySequence("Ctrl+Shift+D"), self).activated.connect(self.toggle_diagnostics_panel)
+        QShortcut(QKeySequence("Ctrl+Shift+P"), self).activated.connect(self.arm_action_profiler)
+
+        # -- إضافة --: عارض سجل تجمد الواجهة (stall_log.txt)
+        stall_header = QHBoxLayout()
+        stall_title = QLabel("سجل تجمد الواجهة"); stall_title.setObjectName("SectionTitle")
+        refresh_stall_btn = QPushButton("تحديث"); refresh_stall_btn.clicked.connect(self.refresh_stall_log)
+        stall_header.addWidget(stall_title); stall_header.addStretch(); stall_header.addWidget(refresh_stall_btn)
+        self.stall_log_view = QTextEdit(); self.stall_log_view.setReadOnly(True)
+        self.stall_log_view.setLayoutDirection(Qt.LayoutDirection.LeftToRight)
+        self.stall_log_view.setFont(QFont("Consolas", 9)); self.stall_log_view.setMinimumHeight(160)
+
+        # -- إضافة --: النسخ الاحتياطي (نسخ فوري في الخلفية، قائمة النسخ، واستعادة)
+        backup_header = QHBoxLayout()
+        backup_title = QLabel("النسخ الاحتياطي"); backup_title.setObjectName("SectionTitle")
+        self.backup_now_btn = QPushButton("نسخ احتياطي الآن"); self.backup_now_btn.clicked.connect(self.start_backup)
+        self.restore_btn = QPushButton("استعادة النسخة المحددة"); self.restore_btn.clicked.connect(self.restore_selected_backup)
+        backup_header.addWidget(backup_title); backup_header.addStretch()
+        backup_header.addWidget(self.backup_now_btn); backup_header.addWidget(self.restore_btn)
+        self.backup_status_label = QLabel()
+        self.backups_list = QListWidget(); self.backups_list.setMaximumHeight(120)
+        self.backups_list.setLayoutDirection(Qt.LayoutDirection.LeftToRight)
+
+        layout.addWidget(title); layout.addWidget(self.timestamps_checkbox); layout.addLayout(db_stats_layout); layout.addWidget(self.snapshot_stats_label)
+        layout.addLayout(backup_header); layout.addWidget(self.backup_status_label); layout.addWidget(self.backups_list)
+        layout.addLayout(stall_header); layout.addWidget(self.stall_log_view)
+        layout.addWidget(self.diagnostics_panel, 1); layout.addStretch()
         self.pages.addWidget(page)
 
+    def create_diagnostics_panel(self):
+        panel = QFrame(); layout = QVBoxLayout(panel); layout.setContentsMargins(0, 0, 0, 0)
+        title = QLabel("التشخيص: استعلامات SQL لكل إجراء"); title.setObjectName("SectionTitle")
+
+        controls = QHBoxLayout()
+        self.query_stats_checkbox = QCheckBox("تفعيل القياس")
+        self.query_stats_checkbox.setChecked(query_stats.enabled)
+        self.query_stats_checkbox.toggled.connect(self.toggle_query_stats)
+        refresh_btn = QPushButton("تحديث"); refresh_btn.clicked.connect(self.refresh_diagnostics)
+        reset_btn = QPushButton("تصفير"); reset_btn.clicked.connect(self.reset_diagnostics)
+        export_btn = QPushButton("تصدير JSON"); export_btn.clicked.connect(self.export_diagnostics)
+        controls.addWidget(self.query_stats_checkbox); controls.addStretch()
+        controls.addWidget(refresh_btn); controls.addWidget(reset_btn); controls.addWidget(export_btn)
+
+        self.diagnostics_table = QTableWidget(); self.diagnostics_table.setColumnCount(7)
+        self.diagnostics_table.setHorizontalHeaderLabels(["الإجراء", "الاستدعاءات", "الاستعلامات", "لكل استدعاء", "الزمن الكلي (ms)", "الأقصى (ms)", "توزيع الزمن"])
+        self.diagnostics_table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.ResizeToContents)
+        self.diagnostics_table.horizontalHeader().setStretchLastSection(True)
+        self.diagnostics_table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+        self.diagnostics_table.setSelectionBehavior(QTableWidget.SelectionBehavior.SelectRows)
+        self.diagnostics_table.itemSelectionChanged.connect(self.show_action_statements)
+
+        # -- إضافة --: تسجيل أداء (cProfile/pyinstrument) للإجراءات التالية
+        profiler_layout = QHBoxLayout()
+        self.profile_count_spin = QSpinBox(); self.profile_count_spin.setRange(1, 50); self.profile_count_spin.setValue(5)
+        self.profile_pyinstrument_checkbox = QCheckBox("pyinstrument (HTML)")
+        self.profile_pyinstrument_checkbox.setEnabled(HAS_PYINSTRUMENT)
+        arm_profiler_btn = QPushButton("تسجيل أداء الإجراءات التالية"); arm_profiler_btn.clicked.connect(self.arm_action_profiler)
+        self.profiler_status_label = QLabel()
+        profiler_layout.addWidget(QLabel("العدد:")); profiler_layout.addWidget(self.profile_count_spin)
+        profiler_layout.addWidget(self.profile_pyinstrument_checkbox); profiler_layout.addWidget(arm_profiler_btn)
+        profiler_layout.addWidget(self.profiler_status_label); profiler_layout.addStretch()
+
+        self.statements_table = QTableWidget(); self.statements_table.setColumnCount(3)
+        self.statements_table.setHorizontalHeaderLabels(["العدد", "الزمن الكلي (ms)", "الاستعلام"])
+        self.statements_table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.ResizeToContents)
+        self.statements_table.horizontalHeader().setStretchLastSection(True)
+        self.statements_table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+
+        splitter = QSplitter(Qt.Orientation.Vertical)
+        splitter.addWidget(self.diagnostics_table); splitter.addWidget(self.statements_table)
+        layout.addWidget(title); layout.addLayout(controls); layout.addLayout(profiler_layout); layout.addWidget(splitter)
+        return panel
+
+    def toggle_diagnostics_panel(self):
+        if self.diagnostics_panel.isVisible():
+            self.diagnostics_panel.hide()
+            return
+        self.show_settings_page()
+        self.diagnostics_panel.show()
+        self.refresh_diagnostics()
+
+    def arm_action_profiler(self):
+        count = self.profile_count_spin.value()
+        action_profiler.arm(count, use_pyinstrument=self.profile_pyinstrument_checkbox.isChecked())
+        self.refresh_profiler_status()
+        QMessageBox.information(self, "تسجيل الأداء", f"سيتم تسجيل أداء الإجراءات الـ {count} التالية في مجلد {action_profiler.output_dir}.")
+
+    def refresh_profiler_status(self):
+        last = action_profiler.saved[-1] if action_profiler.saved else "-"
+        self.profiler_status_label.setText(f"المتبقي: {action_profiler.remaining} — آخر ملف: {last}")
+
+    def toggle_query_stats(self, checked):
+        if checked: query_stats.enable()
+        else: query_stats.disable()
+
+    def refresh_diagnostics(self):
+        self.diagnostics_rows = query_stats.snapshot(top=20)
+        self.diagnostics_table.setRowCount(0)
+        for row, data in enumerate(self.diagnostics_rows):
+            self.diagnostics_table.insertRow(row)
+            histogram = "  ".join(f"{label}: {count}" for label, count in data["histogram"].items() if count)
+            per_call = "-" if data["statements_per_call"] is None else f"{data['statements_per_call']:.1f}"
+            values = [data["action"], str(data["calls"]), str(data["statements"]), per_call,
+                      f"{data['total_ms']:.1f}", f"{data['max_ms']:.1f}", histogram]
+            for col, value in enumerate(values):
+                self.diagnostics_table.setItem(row, col, QTableWidgetItem(value))
+        self.statements_table.setRowCount(0)
+        self.refresh_profiler_status()
+        self.refresh_db_stats()
+
+    def show_action_statements(self):
+        self.statements_table.setRowCount(0)
+        row = self.diagnostics_table.currentRow()
+        if row < 0 or row >= len(self.diagnostics_rows): return
+        for i, statement in enumerate(self.diagnostics_rows[row]["top_statements"]):
+            self.statements_table.insertRow(i)
+            self.statements_table.setItem(i, 0, QTableWidgetItem(str(statement["count"])))
+            self.statements_table.setItem(i, 1, QTableWidgetItem(f"{statement['total_ms']:.1f}"))
+            self.statements_table.setItem(i, 2, QTableWidgetItem(statement["sql"]))
+
+    def reset_diagnostics(self):
+        query_stats.reset()
+        self.refresh_diagnostics()
+
+    def export_diagnostics(self):
+        default_name = f"query_stats_{datetime.datetime.now():%Y%m%d_%H%M%S}.json"
+        path, _ = QFileDialog.getSaveFileName(self, "تصدير إحصائيات الاستعلامات", default_name, "JSON (*.json)")
+        if not path: return
+        try:
+            query_stats.dump_json(path)
+            QMessageBox.information(self, "نجاح", f"تم حفظ الإحصائيات في:\n{path}")
+        except OSError as e:
+            QMessageBox.critical(self, "خطأ", f"تعذر حفظ الملف: {e}")
+
+    def refresh_stall_log(self):
+        text = read_stall_log()
+        self.stall_log_view.setPlainText(text if text else "لم يتم تسجيل أي تجمد.")
+        self.stall_log_view.moveCursor(self.stall_log_view.textCursor().MoveOperation.End)
+
+    def refresh_backups(self):
+        self.backups_list.clear()
+        for path in list_backups(self.backup_service.backup_dir):
+            item = QListWidgetItem(os.path.basename(path)); item.setData(Qt.ItemDataRole.UserRole, path)
+            self.backups_list.addItem(item)
+        service = self.backup_service
+        if service.running: status = "جاري النسخ في الخلفية..."
+        elif service.last_error: status = f"فشل آخر نسخ: {service.last_error}"
+        elif service.last_result:
+            result = service.last_result
+            status = f"آخر نسخة: {result.created_at:%Y-%m-%d %H:%M} — {result.size / 1024:,.0f} KB — سليمة"
+        else: status = "لم يتم أي نسخ في هذا التشغيل."
+        self.backup_status_label.setText(status)
+        self.backup_now_btn.setEnabled(not service.running)
+        self.restore_btn.setEnabled(not service.running)
+
+    def start_backup(self):
+        self.backup_service.run_now()
+        self.backup_status_label.setText("جاري النسخ في الخلفية...")
+        self.backup_now_btn.setEnabled(False)
+
+    def on_backup_finished(self, result, error, restored):
+        if restored:
+            self.on_restore_finished(result, error); return
+        self.refresh_backups()
+        if error and self.pages.currentIndex() == 3:
+            QMessageBox.warning(self, "النسخ الاحتياطي", f"فشل النسخ الاحتياطي:\n{error}")
+
+    def restore_selected_backup(self):
+        item = self.backups_list.currentItem()
+        if item is None:
+            QMessageBox.warning(self, "خطأ", "الرجاء تحديد نسخة أولاً."); return
+        path = item.data(Qt.ItemDataRole.UserRole)
+        if not self.confirm_admin_password(): return
+        try:
+            verify_backup(path)
+        except BackupError as e:
+            QMessageBox.critical(self, "نسخة تالفة", f"لا يمكن استعادة هذه النسخة:\n{e}"); return
+        reply = QMessageBox.question(self, "تأكيد الاستعادة",
+            f"سيتم استبدال كل البيانات الحالية بمحتوى النسخة:\n{os.path.basename(path)}\n"
+            "تحفظ نسخة من الحالة الحالية قبل ذلك، ثم يغلق التطبيق لإعادة تشغيله. متابعة؟",
+            QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No, QMessageBox.StandardButton.No)
+        if reply != QMessageBox.StandardButton.Yes: return
+        # -- تعديل --: الاستعادة (وحفظ طابور الكتابة قبلها) في خيط النسخ، والنتيجة تصل عبر BackupBridge
+        self.backup_service.request_restore(path, prepare=self.prepare_restore)
+        self.backup_status_label.setText("جاري الاستعادة في الخلفية...")
+        self.backup_now_btn.setEnabled(False); self.restore_btn.setEnabled(False)
+
+    @staticmethod
+    def prepare_restore():
+        # من خيط النسخ قبل استبدال الملف: لا عمليات معلقة ولا اتصالات قراءة على المحتوى القديم
+        if not write_queue.flush(timeout=10.0):
+            raise BackupError("pending writes could not be saved before restore")
+        dispose_read_engine()
+        stop_read_api()
+
+    def on_restore_finished(self, safety, error):
+        if error:
+            self.refresh_backups()
+            QMessageBox.critical(self, "خطأ", f"فشلت الاستعادة، لم تتغير البيانات:\n{error}"); return
+        QMessageBox.information(self, "تمت الاستعادة",
+            f"تمت استعادة النسخة بنجاح. الحالة السابقة محفوظة في:\n{safety.path}\nسيتم إغلاق التطبيق الآن، أعد تشغيله.")
+        QApplication.quit()
+
+    def refresh_db_stats(self):
+        stats = session_stats()
+        self.db_stats_label.setText(
+            f"جلسات قاعدة البيانات المفتوحة: {stats['open_sessions']} — "
+            f"المفتوحة منذ التشغيل: {stats['opened_total']} — "
+            f"حجم خريطة الهوية (آخر/أقصى): {stats['last_identity_map']}/{stats['peak_identity_map']}")
+        # -- إضافة --: لقطات القراءة للتقارير وزمن انتظار قفل القراءة
+        snapshots = snapshot_stats()
+        self.snapshot_stats_label.setText(
+            f"لقطات قراءة التقارير: {snapshots['snapshots']} (مفتوحة الآن: {snapshots['open_snapshots']}) — "
+            f"انتظار القفل (متوسط/آخر/أقصى): {snapshots['avg_wait_ms']:.1f}/{snapshots['last_wait_ms']:.1f}/"
+            f"{snapshots['max_wait_ms']:.1f} مللي ثانية — أطول لقطة: {snapshots['max_hold_ms']:.0f} مللي ثانية — "
+            f"أخطاء الانشغال: {snapshots['busy_errors']}")
+
     def apply_styles(self):
         self.setStyleSheet("""
             QMainWindow { background-color: #f4f7fc; font-family: 'Segoe UI', Arial; }
@@ -623,8 +951,9 @@ class AdminDashboard(QMainWindow):
         self.user_sessions_table.setColumnHidden(0, not self.show_timestamps)
         self.user_sessions_table.setColumnHidden(1, not self.show_timestamps)
 
+    @ui_action("لوحة المعلومات", max_statements=1)
     def load_dashboard_data(self):
-        today = datetime.date.today()
+        today = business_today()
         period = self.dash_date_filter.currentText()
 
         if period == "الشهر الحالي":
@@ -643,46 +972,64 @@ class AdminDashboard(QMainWindow):
         else:
             return
 
-        sessions = self.db_session.query(CashSession).filter(
-            func.date(CashSession.start_time) >= start_date,
-            func.date(CashSession.start_time) <= end_date
-        ).all()
-        
-        total_sessions = len(sessions)
-        total_expenses = sum(s.total_expense for s in sessions)
-        total_flexi_additions = sum(s.total_flexi_additions for s in sessions)
-        # -- تعديل --: حساب صافي الفرق النقدي الإجمالي والفليكسي المستهلك
-        net_cash_difference = sum(s.net_cash_difference for s in sessions if s.end_balance is not None)
-        flexi_consumed_total = sum(s.flexi_consumed for s in sessions if s.end_flexi is not None)
+        # -- تعديل --: المجاميع تحسب في SQL بدل تحميل كل الجلسات
+        with read_snapshot() as db:
+            totals = fetch_session_totals(db, *date_range_criteria(start_date, end_date))
 
-        self.dash_card_sessions.set_value(str(total_sessions))
-        self.dash_card_expenses.set_value(f"{total_expenses:,.2f}")
-        self.dash_card_flexi_additions.set_value(f"{total_flexi_additions:,.2f}")
-        self.dash_card_net_cash.set_value(f"{net_cash_difference:+,.2f}")
-        self.dash_card_flexi_consumed.set_value(f"{flexi_consumed_total:,.2f}")
+        self.dash_card_sessions.set_value(str(totals.sessions))
+        self.dash_card_expenses.set_value(f"{totals.total_expense:,.2f}")
+        self.dash_card_flexi_additions.set_value(f"{totals.total_flexi_additions:,.2f}")
+        self.dash_card_net_cash.set_value(f"{totals.net_cash_difference:+,.2f}")
+        self.dash_card_flexi_consumed.set_value(f"{totals.flexi_consumed:,.2f}")
 
 
+    @ui_action("ملف العامل", max_statements=5)
     def load_user_profile_data(self, user, year, month):
         self.profile_title.setText(f"ملف العامل: {user.username}")
-        sessions = self.db_session.query(CashSession).filter(CashSession.user_id == user.id, extract('year', CashSession.start_time) == year, extract('month', CashSession.start_time) == month).order_by(CashSession.start_time.desc()).all()
-        session_count, total_expenses, total_flexi_additions = len(sessions), sum(s.total_expense for s in sessions), sum(s.total_flexi_additions for s in sessions)
-        # -- تعديل --: حساب صافي الفرق النقدي والفليكسي المستهلك
-        net_cash_difference = sum(s.net_cash_difference for s in sessions if s.end_balance is not None)
-        flexi_consumed_total = sum(s.flexi_consumed for s in sessions if s.end_flexi is not None)
-        
-        self.profile_card_sessions.set_value(f"{session_count}")
-        self.profile_card_expenses.set_value(f"{total_expenses:,.2f}")
-        self.profile_card_flexi_additions.set_value(f"{total_flexi_additions:,.2f}")
-        self.profile_card_net_cash.set_value(f"{net_cash_difference:+,.2f}")
-        self.profile_card_flexi_consumed.set_value(f"{flexi_consumed_total:,.2f}")
-        
-        expense_by_day = {day: 0 for day in range(1, 32)}
-        for session in sessions: expense_by_day[session.start_time.day] += session.total_expense
-        self.expenses_chart.set_data({k: v for k, v in expense_by_day.items() if v > 0})
+        criteria = month_criteria(year, month, user.id)
+        # الصفحة والمجاميع والرسم من نفس اللقطة: الأرقام متسقة حتى لو أغلق كاشير جلسة أثناء التحميل
+        with read_snapshot() as db:
+            sessions, cursor = fetch_session_page(db, *criteria, page_size=self.profile_page_size)
+            totals = fetch_session_totals(db, *criteria)
+            expense_by_day = fetch_daily_expenses(db, *criteria)
+            anomaly_detector.refresh(db)
+        
+        self.profile_card_sessions.set_value(f"{totals.sessions}")
+        self.profile_card_expenses.set_value(f"{totals.total_expense:,.2f}")
+        self.profile_card_flexi_additions.set_value(f"{totals.total_flexi_additions:,.2f}")
+        self.profile_card_net_cash.set_value(f"{totals.net_cash_difference:+,.2f}")
+        self.profile_card_flexi_consumed.set_value(f"{totals.flexi_consumed:,.2f}")
         
+        self.expenses_chart.set_data(expense_by_day)
+        
+        # البطاقات من الاستعلام التجميعي، والجدول يعرض الصفحة الأولى فقط
+        self.profile_criteria, self.profile_cursor, self.profile_total = criteria, cursor, totals.sessions
         self.user_sessions_table.setRowCount(0)
-        for row, session in enumerate(sessions):
-            self.user_sessions_table.insertRow(row)
+        self.append_user_sessions(sessions)
+        self.toggle_timestamp_visibility(self.show_timestamps)
+        self.user_sessions_table.verticalScrollBar().setValue(0)
+        QTimer.singleShot(0, self.fill_user_sessions_viewport)
+
+    @ui_action("صفحة جلسات العامل", max_statements=1)
+    def load_more_user_sessions(self):
+        with read_snapshot() as db:
+            sessions, self.profile_cursor = fetch_session_page(db, *self.profile_criteria, after=self.profile_cursor,
+                                                               page_size=self.profile_page_size)
+        self.append_user_sessions(sessions)
+        QTimer.singleShot(0, self.fill_user_sessions_viewport)
+
+    def fill_user_sessions_viewport(self, *_):
+        # الصفحة التالية عند الاقتراب من أسفل الجدول (أو إذا لم تملأ الصفوف الجدول بعد)
+        if self.profile_cursor is None or not self.user_sessions_table.isVisible():
+            return
+        scroll_bar = self.user_sessions_table.verticalScrollBar()
+        if scroll_bar.value() >= scroll_bar.maximum() - scroll_bar.pageStep() // 2:
+            self.load_more_user_sessions()
+
+    def append_user_sessions(self, sessions):
+        first_row = self.user_sessions_table.rowCount()
+        self.user_sessions_table.setRowCount(first_row + len(sessions))
+        for row, session in enumerate(sessions, first_row):
             self.user_sessions_table.setItem(row, 0, QTableWidgetItem(session.start_time.strftime("%Y-%m-%d %H:%M")))
             self.user_sessions_table.setItem(row, 1, QTableWidgetItem(session.end_time.strftime("%Y-%m-%d %H:%M") if session.end_time else "N/A"))
             self.user_sessions_table.setItem(row, 2, QTableWidgetItem(f"{session.start_balance:,.2f}"))
@@ -699,15 +1046,20 @@ class AdminDashboard(QMainWindow):
             self.user_sessions_table.setItem(row, 7, QTableWidgetItem(f"{session.end_flexi:,.2f}" if session.end_flexi is not None else "N/A"))
             
             self.user_sessions_table.setItem(row, 8, QTableWidgetItem("مغلقة" if session.status == 'closed' else "مفتوحة"))
+            self.mark_anomalous_row(self.user_sessions_table, row, session.id)
             self.add_user_session_actions(row, session)
-        self.toggle_timestamp_visibility(self.show_timestamps)
+        loaded = self.user_sessions_table.rowCount()
+        more = "، مرر للأسفل لتحميل المزيد" if self.profile_cursor is not None else ""
+        self.user_sessions_status.setText(f"عرض {loaded} من {self.profile_total} جلسة{more}")
 
+    @ui_action("قائمة العمال", max_statements=1)
     def populate_user_list(self):
         self.user_nav_list.clear()
         self.report_user_filter.clear()
         self.report_user_filter.addItem("جميع العمال", 0)
 
-        users = self.db_session.query(User).filter(User.role == 'user').order_by(User.username).all()
+        with session_scope() as db:
+            users = [UserDTO.from_orm(u) for u in db.query(User).filter(User.role == 'user').order_by(User.username)]
         for user in users:
             item = QListWidgetItem(self.icon_user, user.username)
             item.setData(Qt.ItemDataRole.UserRole, user.id); self.user_nav_list.addItem(item)
@@ -730,6 +1082,10 @@ class AdminDashboard(QMainWindow):
             # Ensure profile page is hidden
             if self.pages.widget(4) is self.user_profile_widget.parent():
                  self.user_profile_placeholder.show(); self.user_profile_widget.hide()
+        elif index == 3: # البحث
+            self.pages.setCurrentIndex(5)
+            self.user_profile_placeholder.show(); self.user_profile_widget.hide()
+            self.search_input.setFocus()
 
 
     def show_settings_page(self):
@@ -737,12 +1093,17 @@ class AdminDashboard(QMainWindow):
         self.user_nav_list.clearSelection()
         self.pages.setCurrentIndex(3) # Index of settings page is now 3
         self.user_profile_placeholder.show(); self.user_profile_widget.hide()
+        self.refresh_db_stats()
+        self.refresh_stall_log()
+        self.refresh_backups()
 
 
     def select_user_profile(self, item):
         self.nav_list.clearSelection()
         user_id = item.data(Qt.ItemDataRole.UserRole)
-        self.current_selected_user = self.db_session.query(User).get(user_id)
+        with session_scope() as db:
+            user = db.get(User, user_id)
+            self.current_selected_user = UserDTO.from_orm(user) if user else None
         if self.current_selected_user:
             self.pages.setCurrentIndex(4) # The profile page is index 4
             self.update_profile_view()
@@ -753,6 +1114,27 @@ class AdminDashboard(QMainWindow):
             year = int(self.year_filter.currentText()); month = self.month_filter.currentData()
             self.load_user_profile_data(self.current_selected_user, year, month)
 
+    def export_user_statement(self):
+        if getattr(self, 'current_selected_user', None):
+            self.start_statements_export([self.current_selected_user.id])
+
+    def export_all_statements(self):
+        self.start_statements_export(None)
+
+    def start_statements_export(self, user_ids):
+        year = int(self.year_filter.currentText()); month = self.month_filter.currentData()
+        self.pdf_batches.add(self.pdf_renderer.monthly_statements(year, month, user_ids))
+        self.pdf_status_label.setText(f"جارٍ إنشاء الكشوف لشهر {year}-{month:02d}...")
+
+    def on_statements_exported(self, batch_id, directory, paths, errors):
+        if batch_id not in self.pdf_batches:
+            return
+        self.pdf_batches.discard(batch_id)
+        message = f"تم حفظ {len(paths)} كشف في {os.path.abspath(directory)}"
+        if errors:
+            message += f" — فشل {len(errors)}: " + "; ".join(errors)
+        self.pdf_status_label.setText(message)
+
     def confirm_admin_password(self):
         dialog = PasswordConfirmDialog(self)
         if dialog.exec():
@@ -761,9 +1143,11 @@ class AdminDashboard(QMainWindow):
             else: QMessageBox.warning(self, "خطأ", "كلمة المرور غير صحيحة.")
         return False
     
+    @ui_action("إدارة العمال", max_statements=1)
     def load_users(self):
         self.users_table.setRowCount(0)
-        users = self.db_session.query(User).all()
+        with session_scope() as db:
+            users = [UserDTO.from_orm(u) for u in db.query(User)]
         for row, user in enumerate(users):
             self.users_table.insertRow(row)
             self.users_table.setItem(row, 0, QTableWidgetItem(str(user.id)))
@@ -779,62 +1163,64 @@ class AdminDashboard(QMainWindow):
         if user.role == 'admin': edit_btn.setEnabled(False); delete_btn.setEnabled(False)
         layout.addWidget(edit_btn); layout.addWidget(delete_btn); self.users_table.setCellWidget(row, 3, buttons_widget)
 
-    def handle_edit_user(self, user_to_edit: User):
+    @ui_action("تعديل عامل")
+    def handle_edit_user(self, user_to_edit: UserDTO):
         dialog = UserDialog(self, user=user_to_edit)
         if dialog.exec():
             data = dialog.get_data()
-            if data and self.db_session.query(User).filter(User.username == data["username"], User.id != user_to_edit.id).first():
-                QMessageBox.warning(self, "خطأ", "اسم المستخدم هذا موجود بالفعل."); return
             try:
-                user_to_edit.username = data["username"]
-                if data["password"]: user_to_edit.set_password(data["password"])
-                self.db_session.commit(); QMessageBox.information(self, "نجاح", f"تم تعديل بيانات {data['username']} بنجاح.")
+                with session_scope() as db:
+                    if data and db.query(User).filter(User.username == data["username"], User.id != user_to_edit.id).first():
+                        QMessageBox.warning(self, "خطأ", "اسم المستخدم هذا موجود بالفعل."); return
+                    user = db.get(User, user_to_edit.id)
+                    user.username = data["username"]
+                    if data["password"]: user.set_password(data["password"])
+                QMessageBox.information(self, "نجاح", f"تم تعديل بيانات {data['username']} بنجاح.")
                 self.load_users(); self.populate_user_list()
-            except Exception as e: self.db_session.rollback(); QMessageBox.critical(self, "خطأ", f"فشل تعديل المستخدم: {e}")
+            except Exception as e: QMessageBox.critical(self, "خطأ", f"فشل تعديل المستخدم: {e}")
 
-    def handle_delete_user(self, user_to_delete: User):
+    @ui_action("حذف عامل")
+    def handle_delete_user(self, user_to_delete: UserDTO):
         reply = QMessageBox.question(self, 'تأكيد الحذف', f"هل أنت متأكد من حذف '{user_to_delete.username}'؟\nسيتم حذف جميع جلساته.", QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No, QMessageBox.StandardButton.No)
         if reply == QMessageBox.StandardButton.Yes:
             try:
-                self.db_session.delete(user_to_delete); self.db_session.commit(); QMessageBox.information(self, "نجاح", "تم حذف العامل بنجاح.")
+                with session_scope() as db:
+                    user = db.get(User, user_to_delete.id)
+                    if user is not None: db.delete(user)
+                QMessageBox.information(self, "نجاح", "تم حذف العامل بنجاح.")
                 self.load_users(); self.populate_user_list()
-            except Exception as e: self.db_session.rollback(); QMessageBox.critical(self, "خطأ", f"فشل حذف المستخدم: {e}")
+            except Exception as e: QMessageBox.critical(self, "خطأ", f"فشل حذف المستخدم: {e}")
 
+    @ui_action("إضافة عامل")
     def add_new_user(self):
         dialog = UserDialog(self)
         if dialog.exec():
             data = dialog.get_data()
-            if data and self.db_session.query(User).filter_by(username=data["username"]).first():
-                QMessageBox.warning(self, "خطأ", "اسم المستخدم هذا موجود بالفعل."); return
             try:
-                new_user = User(username=data["username"], role='user'); new_user.set_password(data["password"])
-                self.db_session.add(new_user); self.db_session.commit(); QMessageBox.information(self, "نجاح", f"تمت إضافة {data['username']} بنجاح.")
+                with session_scope() as db:
+                    if data and db.query(User).filter_by(username=data["username"]).first():
+                        QMessageBox.warning(self, "خطأ", "اسم المستخدم هذا موجود بالفعل."); return
+                    new_user = User(username=data["username"], role='user'); new_user.set_password(data["password"])
+                    db.add(new_user)
+                QMessageBox.information(self, "نجاح", f"تمت إضافة {data['username']} بنجاح.")
                 self.load_users(); self.populate_user_list()
-            except Exception as e: self.db_session.rollback(); QMessageBox.critical(self, "خطأ", f"فشل في إضافة المستخدم: {e}")
+            except Exception as e: QMessageBox.critical(self, "خطأ", f"فشل في إضافة المستخدم: {e}")
             if not data: QMessageBox.warning(self, "خطأ", "الرجاء إدخال اسم مستخدم وكلمة مرور.")
     
+    @ui_action("تقرير الجلسات", max_statements=3)
     def load_sessions_report(self):
-        query = self.db_session.query(CashSession)
-        
-        selected_user_id = self.report_user_filter.currentData()
-        if selected_user_id and selected_user_id > 0:
-            query = query.filter(CashSession.user_id == selected_user_id)
-
-        start_date = self.report_date_start.date().toPyDate()
-        end_date = self.report_date_end.date().toPyDate()
-        query = query.filter(
-            func.date(CashSession.start_time) >= start_date,
-            func.date(CashSession.start_time) <= end_date
-        )
-
-        sessions = query.order_by(CashSession.start_time.desc()).all()
+        with read_snapshot() as db:
+            sessions = fetch_session_rows(db, *self.sessions_report_criteria())
+            anomaly_detector.refresh(db)
         
+        # الفرز أثناء الإدراج ينقل الصفوف قبل اكتمال تعبئتها
+        self.reports_table.setSortingEnabled(False)
         self.reports_table.setRowCount(0)
         for row, session in enumerate(sessions):
             self.reports_table.insertRow(row)
-            username = session.user.username if session.user else "(مستخدم محذوف)"
-            username_item = QTableWidgetItem(username);
-            if not session.user: username_item.setForeground(QColor("#6c757d"))
+            username = session.username or "(مستخدم محذوف)"
+            username_item = QTableWidgetItem(username); username_item.setData(Qt.ItemDataRole.UserRole, session.id)
+            if not session.username: username_item.setForeground(QColor("#6c757d"))
             
             # -- تعديل --: حساب الفرق النقدي والفليكسي المستهلك
             diff_cash = session.net_cash_difference
@@ -855,9 +1241,68 @@ class AdminDashboard(QMainWindow):
             self.reports_table.setItem(row, 7, QTableWidgetItem(f"{session.total_flexi_additions:,.2f}"))
             self.reports_table.setItem(row, 8, QTableWidgetItem(f"{session.end_flexi:,.2f}" if session.end_flexi is not None else "N/A"))
             self.reports_table.setItem(row, 9, QTableWidgetItem("مغلقة" if session.status == 'closed' else "مفتوحة"))
+            self.mark_anomalous_row(self.reports_table, row, session.id)
             self.add_session_action_buttons(row, session, self.reports_table)
+        self.reports_table.setSortingEnabled(True)
         self.toggle_timestamp_visibility(self.show_timestamps)
 
+    # -- إضافة --: تمييز الجلسات غير المعتادة (anomaly) بخلفية وتلميح يشرح السبب
+    def mark_anomalous_row(self, table_widget, row, session_id):
+        anomalies = anomaly_detector.flags_for(session_id)
+        if not anomalies:
+            return
+        tooltip = describe_anomalies(anomalies)
+        for column in range(table_widget.columnCount() - 1):
+            item = table_widget.item(row, column)
+            if item is not None:
+                item.setBackground(QColor(255, 193, 7, 60))
+                item.setToolTip(tooltip)
+
+    def sessions_report_criteria(self):
+        selected_user_id = self.report_user_filter.currentData()
+        return date_range_criteria(self.report_date_start.date().toPyDate(), self.report_date_end.date().toPyDate(),
+                                   selected_user_id if selected_user_id and selected_user_id > 0 else None)
+
+    def run_search(self):
+        self.search_page = 0
+        self.load_search_results()
+
+    def change_search_page(self, step):
+        self.search_page = max(0, self.search_page + step)
+        self.load_search_results()
+
+    @ui_action("البحث", max_statements=2)
+    def load_search_results(self):
+        try:
+            with read_snapshot() as db:
+                rows, self.search_total = search_transactions(db, self.search_input.text(), self.search_page, self.search_page_size)
+        except Exception as e:
+            QMessageBox.warning(self, "خطأ", f"تعذر تنفيذ البحث: {e}"); return
+
+        kind_labels = {"expense": "مصروف", "income": "دخل", "flexi": "فليكسي", "notes": "ملاحظات"}
+        self.search_results_table.setRowCount(0)
+        for row, result in enumerate(rows):
+            self.search_results_table.insertRow(row)
+            username_item = QTableWidgetItem(result.username or "(مستخدم محذوف)")
+            username_item.setData(Qt.ItemDataRole.UserRole, result.session_id)
+            start_time = result.start_time
+            if isinstance(start_time, str): start_time = datetime.datetime.fromisoformat(start_time)
+            self.search_results_table.setItem(row, 0, username_item)
+            self.search_results_table.setItem(row, 1, QTableWidgetItem(start_time.strftime("%Y-%m-%d %H:%M") if start_time else "N/A"))
+            self.search_results_table.setItem(row, 2, QTableWidgetItem(kind_labels.get(result.kind, result.kind)))
+            self.search_results_table.setItem(row, 3, QTableWidgetItem(f"{result.amount:,.2f}" if result.amount is not None else ""))
+            snippet_label = QLabel(highlight_snippet(result.snippet)); snippet_label.setTextFormat(Qt.TextFormat.RichText)
+            self.search_results_table.setCellWidget(row, 4, snippet_label)
+
+        page_count = max(1, -(-self.search_total // self.search_page_size))
+        self.search_status_label.setText(f"{self.search_total} نتيجة — الصفحة {self.search_page + 1} من {page_count}" if self.search_total else "لا توجد نتائج")
+        self.search_prev_btn.setEnabled(self.search_page > 0)
+        self.search_next_btn.setEnabled(self.search_page + 1 < page_count)
+
+    def open_search_result(self, row, column):
+        item = self.search_results_table.item(row, 0)
+        if item: self.show_session_details(item.data(Qt.ItemDataRole.UserRole))
+
     def add_user_session_actions(self, row, session):
         self.add_session_action_buttons(row, session, self.user_sessions_table, has_details=True)
 
@@ -869,7 +1314,7 @@ class AdminDashboard(QMainWindow):
             layout.addWidget(details_btn)
         edit_btn = QPushButton("تعديل"); edit_btn.setProperty("class", "ActionButton EditButton"); edit_btn.clicked.connect(lambda _, s=session: self.handle_edit_session(s))
         delete_btn = QPushButton("حذف"); delete_btn.setProperty("class", "ActionButton DeleteButton"); delete_btn.clicked.connect(lambda _, s=session: self.handle_delete_session(s))
-        if not session.user: edit_btn.setEnabled(False); delete_btn.setEnabled(False)
+        if not session.username: edit_btn.setEnabled(False); delete_btn.setEnabled(False)
         layout.addWidget(edit_btn); layout.addWidget(delete_btn)
         table_widget.setCellWidget(row, table_widget.columnCount() - 1, buttons_widget)
 
@@ -878,29 +1323,105 @@ class AdminDashboard(QMainWindow):
         dialog.exec()
         self.update_profile_view() # Refresh data after dialog closes
 
-    def handle_edit_session(self, session_to_edit: CashSession):
+    @ui_action("تعديل جلسة")
+    def handle_edit_session(self, session_to_edit):
         if self.confirm_admin_password():
             dialog = EditSessionDialog(session_to_edit, self)
             if dialog.exec():
                 data = dialog.get_data()
                 if data is not None:
-                    session_to_edit.start_balance = data['start_balance']
-                    session_to_edit.end_balance = data['end_balance']
-                    session_to_edit.start_flexi = data['start_flexi']
-                    session_to_edit.end_flexi = data['end_flexi']
-                    self.db_session.commit(); QMessageBox.information(self, "نجاح", "تم تعديل الجلسة بنجاح.")
+                    with session_scope() as db:
+                        session = db.get(CashSession, session_to_edit.id)
+                        session.start_balance = data['start_balance']
+                        session.end_balance = data['end_balance']
+                        session.start_flexi = data['start_flexi']
+                        session.end_flexi = data['end_flexi']
+                    QMessageBox.information(self, "نجاح", "تم تعديل الجلسة بنجاح.")
                     self.load_sessions_report(); self.update_profile_view()
                 else: QMessageBox.warning(self, "خطأ", "الرجاء إدخال قيم صحيحة.")
 
-    def handle_delete_session(self, session_to_delete: CashSession):
+    @ui_action("حذف جلسة")
+    def handle_delete_session(self, session_to_delete):
         if self.confirm_admin_password():
             reply = QMessageBox.question(self, 'تأكيد الحذف', "هل أنت متأكد من حذف هذه الجلسة؟", QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No, QMessageBox.StandardButton.No)
             if reply == QMessageBox.StandardButton.Yes:
-                self.db_session.delete(session_to_delete); self.db_session.commit(); QMessageBox.information(self, "نجاح", "تم حذف الجلسة بنجاح.")
+                with session_scope() as db:
+                    session = db.get(CashSession, session_to_delete.id)
+                    if session is not None: db.delete(session)
+                anomaly_detector.invalidate()
+                QMessageBox.information(self, "نجاح", "تم حذف الجلسة بنجاح.")
                 self.load_sessions_report(); self.update_profile_view()
 
+    # -- إضافة --: العمليات المجمعة على الجلسات المحددة (تأكيد واحد، معاملة واحدة، تحديث واحد)
+    def selected_session_ids(self):
+        rows = self.reports_table.selectionModel().selectedRows()
+        return [self.reports_table.item(index.row(), 0).data(Qt.ItemDataRole.UserRole) for index in rows]
+
+    def update_bulk_actions(self):
+        count = len(self.reports_table.selectionModel().selectedRows())
+        self.bulk_selection_label.setText(f"محدد: {count} جلسة" if count else "حدد جلسات (Ctrl/Shift) للعمليات المجمعة")
+        for button in (self.bulk_delete_btn, self.bulk_reassign_btn, self.bulk_close_btn): button.setEnabled(count > 0)
+
+    def confirm_bulk_action(self, question):
+        if not self.confirm_admin_password(): return False
+        reply = QMessageBox.question(self, 'تأكيد', question, QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No, QMessageBox.StandardButton.No)
+        return reply == QMessageBox.StandardButton.Yes
+
+    @ui_action("حذف جلسات محددة", max_statements=3)
+    def bulk_delete_sessions(self):
+        session_ids = self.selected_session_ids()
+        if not session_ids or not self.confirm_bulk_action(f"هل أنت متأكد من حذف {len(session_ids)} جلسة مع كل عملياتها؟"): return
+        try:
+            with session_scope() as db:
+                deleted = delete_sessions(db, session_ids)
+        except Exception as e:
+            QMessageBox.critical(self, "خطأ", f"فشل حذف الجلسات، لم تتغير البيانات:\n{e}"); return
+        anomaly_detector.invalidate()
+        QMessageBox.information(self, "نجاح", f"تم حذف {deleted} جلسة.")
+        self.refresh_after_bulk_action()
+
+    @ui_action("نقل جلسات محددة", max_statements=2)
+    def bulk_reassign_sessions(self):
+        session_ids = self.selected_session_ids()
+        users = [(self.report_user_filter.itemData(i), self.report_user_filter.itemText(i))
+                 for i in range(1, self.report_user_filter.count())] # بدون "جميع العمال"
+        if not session_ids or not self.confirm_admin_password(): return
+        dialog = ReassignSessionsDialog(len(session_ids), users, self)
+        if not dialog.exec(): return
+        user_id, username = dialog.get_user()
+        if user_id is None: return
+        try:
+            with session_scope() as db:
+                moved = reassign_sessions(db, session_ids, user_id)
+        except Exception as e:
+            QMessageBox.critical(self, "خطأ", f"فشل نقل الجلسات، لم تتغير البيانات:\n{e}"); return
+        anomaly_detector.invalidate() # سلاسل العاملين تغيرت
+        QMessageBox.information(self, "نجاح", f"تم نقل {moved} جلسة إلى {username}.")
+        self.refresh_after_bulk_action()
+
+    @ui_action("إغلاق جلسات متروكة", max_statements=1)
+    def bulk_close_stale_sessions(self):
+        session_ids = self.selected_session_ids()
+        if not session_ids or not self.confirm_bulk_action(
+                f"إغلاق الجلسات المفتوحة منذ أكثر من {STALE_SESSION_HOURS:g} ساعة من بين {len(session_ids)} جلسة محددة؟\n"
+                "تغلق بدون أرصدة نهاية (بدون جرد)."): return
+        try:
+            with session_scope() as db:
+                closed = close_stale_sessions(db, session_ids)
+        except Exception as e:
+            QMessageBox.critical(self, "خطأ", f"فشل إغلاق الجلسات، لم تتغير البيانات:\n{e}"); return
+        QMessageBox.information(self, "نجاح", f"تم إغلاق {closed} جلسة متروكة." if closed else "لا توجد بين المحدد جلسات مفتوحة متروكة.")
+        self.refresh_after_bulk_action()
+
+    def refresh_after_bulk_action(self):
+        # نفس ما يحدثه تعديل/حذف جلسة واحدة، مع بطاقات لوحة المعلومات
+        self.load_sessions_report(); self.update_profile_view()
+        self.load_dashboard_data()
+
     def closeEvent(self, event):
-        self.db_session.close(); event.accept()
+        self.backup_service.remove_listener(self.backup_listener)
+        self.pdf_renderer.batch_finished.disconnect(self.on_statements_exported)
+        event.accept()
 
 if __name__ == '__main__':
     init_db()
@@ -0,0 +1,163 @@
+"""
+كشف الشذوذ في الجلسات المغلقة لكل عامل: الفرق النقدي، المصاريف، والفليكسي المستهلك.
+
+لكل عامل ولكل مقياس سلسلة زمنية؛ كل جلسة تقارن بآخر WINDOW جلسة قبلها للعامل نفسه:
+    - z-score متدحرج: (القيمة - المتوسط) / الانحراف المعياري
+    - درجة متينة (MAD): 0.6745 * (القيمة - الوسيط) / الوسيط المطلق للانحرافات
+الجلسة توسم إذا تجاوزت إحدى الدرجتين حدها، بعد MIN_HISTORY جلسة على الأقل للعامل.
+
+الحساب بمصفوفات numpy (نوافذ منزلقة) إن كانت مثبتة، وإلا بنفس المعادلات في بايثون.
+التحديث تدريجي: refresh(db) يقرأ لقطات الإغلاق الأحدث من آخر علامة مائية فقط، ويعيد
+حساب العمال الذين أغلقوا أو عدلوا جلسات منذ آخر تحديث دون غيرهم.
+"""
+import collections
+import statistics
+import threading
+import warnings
+
+from read_models import fetch_closed_session_metrics, fetch_closings_after
+
+try:
+    import numpy as np
+    from numpy.lib.stride_tricks import sliding_window_view
+except ImportError: # numpy اختياري
+    np = None
+
+HAS_NUMPY = np is not None
+METRICS = ("net_cash_difference", "total_expense", "flexi_consumed")
+METRIC_LABELS = {
+    "net_cash_difference": "الفرق (النقد)",
+    "total_expense": "المصاريف",
+    "flexi_consumed": "الفليكسي المستهلك",
+}
+WINDOW = 30
+MIN_HISTORY = 8
+Z_LIMIT = 3.0
+ROBUST_LIMIT = 3.5
+MAD_SCALE = 0.6745
+
+Anomaly = collections.namedtuple("Anomaly", "metric value zscore robust")
+
+
+def _scores_numpy(values, window=WINDOW, min_history=MIN_HISTORY):
+    x = np.asarray(values, dtype=float)
+    n = len(x)
+    # الصف i من النوافذ = القيم السابقة للجلسة i (حتى window قيمة، والباقي nan)
+    padded = np.concatenate((np.full(window, np.nan), x[:-1]))
+    windows = sliding_window_view(padded, window)
+    with warnings.catch_warnings(), np.errstate(invalid="ignore", divide="ignore"):
+        warnings.simplefilter("ignore", RuntimeWarning) # صفوف بلا تاريخ (كلها nan)
+        history = np.count_nonzero(~np.isnan(windows), axis=1)
+        mean = np.nanmean(windows, axis=1)
+        std = np.nanstd(windows, axis=1)
+        median = np.nanmedian(windows, axis=1)
+        mad = np.nanmedian(np.abs(windows - median[:, None]), axis=1)
+        z = np.where(std > 0, (x - mean) / std, 0.0)
+        robust = np.where(mad > 0, MAD_SCALE * (x - median) / mad, 0.0)
+    enough = history >= min_history
+    z = np.where(enough, z, 0.0)
+    robust = np.where(enough, robust, 0.0)
+    return z.tolist()[:n], robust.tolist()[:n]
+
+
+def _scores_python(values, window=WINDOW, min_history=MIN_HISTORY):
+    z_scores, robust_scores = [], []
+    for i, value in enumerate(values):
+        history = values[max(0, i - window):i]
+        if len(history) < min_history:
+            z_scores.append(0.0); robust_scores.append(0.0)
+            continue
+        mean = statistics.fmean(history)
+        std = statistics.pstdev(history, mean)
+        median = statistics.median(history)
+        mad = statistics.median(abs(v - median) for v in history)
+        z_scores.append((value - mean) / std if std > 0 else 0.0)
+        robust_scores.append(MAD_SCALE * (value - median) / mad if mad > 0 else 0.0)
+    return z_scores, robust_scores
+
+
+def rolling_scores(values, window=WINDOW, min_history=MIN_HISTORY):
+    """
+    (z-scores، الدرجات المتينة) لكل قيمة مقارنة بالقيم السابقة لها في النافذة.
+    """
+    if not values:
+        return [], []
+    if HAS_NUMPY:
+        return _scores_numpy(values, window, min_history)
+    return _scores_python(values, window, min_history)
+
+
+def user_anomalies(rows, window=WINDOW, min_history=MIN_HISTORY):
+    """
+    {معرف الجلسة: [Anomaly...]} لجلسات عامل واحد مرتبة زمنيًا.
+    """
+    flags = {}
+    for metric in METRICS:
+        values = [getattr(row, metric) for row in rows]
+        z_scores, robust_scores = rolling_scores(values, window, min_history)
+        for row, value, z, robust in zip(rows, values, z_scores, robust_scores):
+            if abs(z) >= Z_LIMIT or abs(robust) >= ROBUST_LIMIT:
+                flags.setdefault(row.id, []).append(Anomaly(metric, value, z, robust))
+    return flags
+
+
+def describe(anomalies):
+    """
+    نص التلميح لجلسة موسومة.
+    """
+    lines = ["جلسة غير معتادة مقارنة بجلسات العامل السابقة:"]
+    for a in anomalies:
+        lines.append(f"- {METRIC_LABELS[a.metric]}: {a.value:+,.2f} (z={a.zscore:+.1f}، MAD={a.robust:+.1f})")
+    return "\n".join(lines)
+
+
+class AnomalyDetector:
+    def __init__(self, window=WINDOW, min_history=MIN_HISTORY):
+        self.window = window
+        self.min_history = min_history
+        self._lock = threading.Lock()
+        self._flags_by_user = {} # العامل -> {الجلسة: [Anomaly]}
+        self._flags = {}         # الجلسة -> [Anomaly] (كل العمال)
+        self._watermark = None   # أكبر معرف لقطة إغلاق محسوب
+        self.recomputed_users = 0
+
+    def invalidate(self):
+        # بعد حذف جلسات (لا تترك لقطات جديدة): إعادة حساب كاملة في التحديث القادم
+        with self._lock:
+            self._watermark = None
+
+    def refresh(self, db):
+        """
+        يحدث الوسوم من لقطات الإغلاق الجديدة فقط (استعلام واحد إذا لم يتغير شيء، واثنان إذا تغير).
+        """
+        with self._lock:
+            watermark = self._watermark
+        changed = fetch_closings_after(db, watermark or 0)
+        if watermark is not None and not changed:
+            return
+        user_ids = None if watermark is None else list(changed)
+        rows_by_user = collections.defaultdict(list)
+        for row in fetch_closed_session_metrics(db, user_ids):
+            rows_by_user[row.user_id].append(row)
+        flags_by_user = {user_id: user_anomalies(rows, self.window, self.min_history)
+                         for user_id, rows in rows_by_user.items()}
+        with self._lock:
+            if user_ids is None:
+                self._flags_by_user = flags_by_user
+            else:
+                for user_id in user_ids:
+                    self._flags_by_user[user_id] = flags_by_user.get(user_id, {})
+            self._flags = {session_id: anomalies for flags in self._flags_by_user.values()
+                           for session_id, anomalies in flags.items()}
+            self._watermark = max([watermark or 0, *changed.values()])
+            self.recomputed_users += len(flags_by_user)
+
+    def flags_for(self, session_id):
+        return self._flags.get(session_id)
+
+    @property
+    def flagged_count(self):
+        return len(self._flags)
+
+
+anomaly_detector = AnomalyDetector()
@@ -0,0 +1,274 @@
+"""
+نسخ احتياطي لقاعدة البيانات أثناء التشغيل عبر واجهة النسخ في SQLite (sqlite3.Connection.backup).
+
+النسخ يتم على دفعات من الصفحات (PAGES_PER_STEP) في خيط خلفي مع استراحة قصيرة بين
+الدفعات، داخل معاملة قراءة واحدة: في وضع WAL (database_setup) تنسخ لقطة متسقة من
+القاعدة بينما يستمر الكاشير في الكتابة دون انتظار. كل نسخة تفحص بـ PRAGMA integrity_check ثم تضغط
+(gzip) في مجلد backups/ ويحتفظ بآخر KEEP نسخة فقط.
+
+    CASH_BACKUP_INTERVAL_MIN   الفاصل بين النسخ المجدولة بالدقائق (افتراضيًا 60، و 0 للتعطيل)
+    CASH_BACKUP_KEEP           عدد النسخ المحتفظ بها (افتراضيًا 10)
+
+الاستعادة (restore_backup) تفك النسخة وتفحصها، تأخذ نسخة أمان من القاعدة الحالية،
+ثم تكتب النسخة فوق القاعدة بنفس واجهة النسخ (تحت أقفال SQLite، لا نسخ ملفات). من الواجهة
+تطلب عبر BackupService.request_restore فتنفذ في خيط النسخ وتصل نتيجتها للمستمعين.
+"""
+import collections
+import datetime
+import glob
+import gzip
+import os
+import shutil
+import sqlite3
+import threading
+import time
+
+from database_setup import engine, DB_FILENAME
+
+BACKUP_DIR = "backups"
+BACKUP_SUFFIX = ".db.gz"
+PAGES_PER_STEP = 256
+STEP_SLEEP_SECONDS = 0.05
+DEFAULT_INTERVAL_MIN = int(os.environ.get("CASH_BACKUP_INTERVAL_MIN", "60"))
+DEFAULT_KEEP = int(os.environ.get("CASH_BACKUP_KEEP", "10"))
+
+BackupResult = collections.namedtuple("BackupResult", "path created_at size seconds")
+
+
+class BackupError(Exception):
+    pass
+
+
+def _integrity_check(path):
+    conn = sqlite3.connect(path)
+    try:
+        result = conn.execute("PRAGMA integrity_check").fetchone()[0]
+    finally:
+        conn.close()
+    if result != "ok":
+        raise BackupError(f"integrity_check failed for {path}: {result}")
+
+
+def _copy_database(source_path, target_path, pages=PAGES_PER_STEP, sleep=STEP_SLEEP_SECONDS):
+    source = sqlite3.connect(source_path, isolation_level=None)
+    target = sqlite3.connect(target_path)
+    try:
+        # معاملة قراءة مفتوحة طوال الدفعات: في وضع WAL تبقى اللقطة ثابتة فلا يعاد النسخ من
+        # البداية عند كل كتابة من الكاشير، والكتابة تستمر دون انتظار
+        source.execute("BEGIN")
+        source.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+        source.backup(target, pages=pages, sleep=sleep)
+        source.execute("COMMIT")
+    finally:
+        target.close()
+        source.close()
+
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def list_backups(backup_dir=BACKUP_DIR):
+    """
+    النسخ الموجودة، الأحدث أولًا.
+    """
+    paths = glob.glob(os.path.join(backup_dir, "*" + BACKUP_SUFFIX))
+    return sorted(paths, key=os.path.getmtime, reverse=True)
+
+
+def rotate_backups(backup_dir=BACKUP_DIR, keep=DEFAULT_KEEP):
+    removed = []
+    for path in list_backups(backup_dir)[keep:]:
+        _remove_quietly(path)
+        removed.append(path)
+    return removed
+
+
+def backup_now(db_path=DB_FILENAME, backup_dir=BACKUP_DIR, keep=DEFAULT_KEEP, tag=None):
+    """
+    ينشئ نسخة مضغوطة ومفحوصة ويعيد BackupResult.
+    """
+    started = time.monotonic()
+    created_at = datetime.datetime.now()
+    os.makedirs(backup_dir, exist_ok=True)
+    name = f"cash_register_{created_at:%Y%m%d_%H%M%S}" + (f"_{tag}" if tag else "")
+    final_path = os.path.join(backup_dir, name + BACKUP_SUFFIX)
+    counter = 1
+    while os.path.exists(final_path): # أكثر من نسخة في نفس الثانية
+        counter += 1
+        final_path = os.path.join(backup_dir, f"{name}_{counter}{BACKUP_SUFFIX}")
+    raw_path = final_path[:-len(BACKUP_SUFFIX)] + ".partial.db"
+    try:
+        _copy_database(db_path, raw_path)
+        _integrity_check(raw_path)
+        with open(raw_path, "rb") as src, gzip.open(final_path + ".partial", "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        os.replace(final_path + ".partial", final_path)
+    finally:
+        _remove_quietly(raw_path)
+        _remove_quietly(final_path + ".partial")
+    rotate_backups(backup_dir, keep)
+    result = BackupResult(final_path, created_at, os.path.getsize(final_path), time.monotonic() - started)
+    print(f"Backup saved: {final_path} ({result.size} bytes, {result.seconds:.2f}s)")
+    return result
+
+
+def _extract(backup_path, target_path):
+    with gzip.open(backup_path, "rb") as src, open(target_path, "wb") as dst:
+        shutil.copyfileobj(src, dst)
+
+
+def verify_backup(backup_path):
+    """
+    يفك النسخة في ملف مؤقت ويفحصها؛ يرفع BackupError إذا كانت تالفة.
+    """
+    temp_path = backup_path + ".verify.db"
+    try:
+        _extract(backup_path, temp_path)
+        _integrity_check(temp_path)
+    except (OSError, EOFError, sqlite3.DatabaseError) as e:
+        raise BackupError(f"cannot read backup {backup_path}: {e}") from e
+    finally:
+        _remove_quietly(temp_path)
+
+
+def restore_backup(backup_path, db_path=DB_FILENAME, db_engine=engine, backup_dir=BACKUP_DIR, prepare=None):
+    """
+    يستبدل محتوى القاعدة بالنسخة المحددة بعد فحصها، مع نسخة أمان "pre_restore" قبلها.
+    prepare() إن وجدت تستدعى بعد الفحص وقبل نسخة الأمان (حفظ المعلق وإغلاق اتصالات القراءة).
+    يجب إعادة تشغيل التطبيق بعدها (الذاكرة المؤقتة في الواجهات تخص القاعدة القديمة).
+    """
+    temp_path = backup_path + ".restore.db"
+    try:
+        try:
+            _extract(backup_path, temp_path)
+            _integrity_check(temp_path)
+        except (OSError, EOFError, sqlite3.DatabaseError) as e:
+            raise BackupError(f"cannot read backup {backup_path}: {e}") from e
+        if prepare is not None:
+            prepare()
+        safety = backup_now(db_path, backup_dir, keep=DEFAULT_KEEP + 1, tag="pre_restore")
+        db_engine.dispose() # لا تبقى اتصالات مجمعة على المحتوى القديم
+        source = sqlite3.connect(temp_path)
+        target = sqlite3.connect(db_path)
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
+    finally:
+        _remove_quietly(temp_path)
+    print(f"Database restored from {backup_path} (previous state saved to {safety.path})")
+    return safety
+
+
+class BackupService:
+    """
+    نسخ مجدول في خيط خلفي؛ run_now() يطلب نسخة فورية دون انتظارها.
+    """
+    def __init__(self, interval_min=DEFAULT_INTERVAL_MIN, db_path=DB_FILENAME,
+                 backup_dir=BACKUP_DIR, keep=DEFAULT_KEEP):
+        self.interval = interval_min * 60
+        self.db_path = db_path
+        self.backup_dir = backup_dir
+        self.keep = keep
+        self._lock = threading.Lock() # نسخة واحدة في كل مرة (المجدولة أو اليدوية)
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._listeners = []
+        self._restore_request = None # (المسار، prepare) تنفذه حلقة الخيط قبل أي نسخ
+        self.running = False
+        self.last_result = None
+        self.last_error = None
+
+    def add_listener(self, callback):
+        # callback(result, error, restored) من خيط النسخ؛ بعد الاستعادة result هي نسخة الأمان
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="BackupService", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def run_now(self):
+        self.start()
+        self._wake.set()
+
+    def request_restore(self, backup_path, prepare=None):
+        """
+        يطلب الاستعادة في خيط النسخ دون انتظارها (لا تحجز الواجهة).
+        """
+        self._restore_request = (backup_path, prepare)
+        self.run_now()
+
+    def _run(self):
+        while not self._stop.is_set():
+            # بدون جدولة ننتظر الطلبات اليدوية فقط
+            self._wake.wait(self.interval if self.interval > 0 else None)
+            if self._stop.is_set():
+                break
+            self._wake.clear()
+            request, self._restore_request = self._restore_request, None
+            if request is not None:
+                self._restore_in_thread(*request)
+            else:
+                self.backup()
+
+    def _notify(self, result, error, restored):
+        for callback in list(self._listeners):
+            callback(result, error, restored)
+
+    def backup(self):
+        with self._lock:
+            self.running = True
+            result, error = None, None
+            try:
+                result = backup_now(self.db_path, self.backup_dir, self.keep)
+                self.last_result, self.last_error = result, None
+            except Exception as e:
+                error = str(e)
+                self.last_error = error
+                print(f"Backup failed: {e}")
+            finally:
+                self.running = False
+        self._notify(result, error, False)
+        return result
+
+    def restore(self, backup_path, prepare=None):
+        with self._lock:
+            return restore_backup(backup_path, self.db_path, backup_dir=self.backup_dir, prepare=prepare)
+
+    def _restore_in_thread(self, backup_path, prepare):
+        result, error = None, None
+        self.running = True
+        try:
+            result = self.restore(backup_path, prepare)
+        except Exception as e:
+            error = str(e)
+            print(f"Restore failed: {e}")
+        finally:
+            self.running = False
+        self._notify(result, error, True)
+
+
+backup_service = None
+
+
+def start_backup_service(interval_min=DEFAULT_INTERVAL_MIN):
+    global backup_service
+    if backup_service is None:
+        backup_service = BackupService(interval_min)
+        backup_service.start()
+    return backup_service
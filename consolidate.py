@@ -0,0 +1,146 @@
+"""
+تقرير موحد لعدة فروع (ملف cash_register.db لكل فرع) دون فتح كل ملف في لوحة المشرف.
+
+    python -m consolidate branches/*.db --period last-month
+    python -m consolidate a.db b.db --from 2024-01-01 --to 2024-12-31 --report users --format csv -o users.csv
+
+كل ملف يعالج في عملية مستقلة (ProcessPoolExecutor) على محرك قراءة فقط، ويعيد مجاميع جزئية
+صغيرة (نفس استعلامات load_dashboard_data وملف العامل في read_models)، ثم تدمج في العملية
+الرئيسية: المجاميع كلها قابلة للجمع (عدد الجلسات ومجاميع المبالغ)، فالدمج جمع حقل بحقل
+وملخصات العمال تدمج حسب (اسم العامل، الشهر) عبر الفروع.
+"""
+import argparse
+import concurrent.futures
+import datetime
+import os
+import sys
+import time
+
+from sqlalchemy.orm import Session
+
+from database_setup import create_read_engine, business_today
+from read_models import (fetch_session_totals, fetch_user_monthly_summaries, date_range_criteria,
+                         SessionTotals, UserMonthSummary)
+from reporting import period_range, PERIODS, write_json, write_csv
+
+REPORTS = ("totals", "users")
+BRANCH_FIELDS = ("branch",) + SessionTotals._fields
+
+
+def branch_partials(db_path, start_date, end_date):
+    """
+    المجاميع الجزئية لفرع واحد (تعمل داخل عملية العامل؛ تعيد قيمًا بسيطة قابلة للنقل).
+    """
+    started = time.monotonic()
+    if not os.path.exists(db_path):
+        raise FileNotFoundError(f"database file not found: {db_path}")
+    read_engine = create_read_engine(db_path, pool_size=1)
+    try:
+        with Session(read_engine) as db:
+            criteria = date_range_criteria(start_date, end_date)
+            totals = tuple(fetch_session_totals(db, *criteria))
+            users = [tuple(row) for row in fetch_user_monthly_summaries(db, *criteria)]
+    finally:
+        read_engine.dispose()
+    return {"branch": db_path, "totals": totals, "users": users, "seconds": time.monotonic() - started}
+
+
+def _add(a, b):
+    return tuple(x + y for x, y in zip(a, b))
+
+
+def merge_partials(partials):
+    """
+    يدمج مجاميع الفروع: (المجموع الكلي، ملخصات العمال المدمجة، صفوف الفروع).
+    """
+    total = (0,) + (0.0,) * (len(SessionTotals._fields) - 1)
+    users = {}
+    branches = []
+    for partial in partials:
+        totals = SessionTotals._make(partial["totals"])
+        total = _add(total, totals)
+        branches.append({"branch": partial["branch"], **totals._asdict()})
+        for row in partial["users"]:
+            key, values = row[:2], row[2:]
+            users[key] = _add(users[key], values) if key in users else tuple(values)
+    merged_users = [UserMonthSummary._make(key + values) for key, values in sorted(users.items())]
+    return SessionTotals._make(total), merged_users, branches
+
+
+def collect_partials(paths, start_date, end_date, workers=None):
+    """
+    يحسب مجاميع كل الفروع بالتوازي. يعيد (المجاميع، الأخطاء {الملف: الرسالة}).
+    """
+    workers = workers or min(len(paths), os.cpu_count() or 1)
+    partials, errors = [], {}
+    if workers <= 1:
+        for path in paths:
+            try:
+                partials.append(branch_partials(path, start_date, end_date))
+            except Exception as e:
+                errors[path] = str(e)
+        return partials, errors
+    with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+        futures = {pool.submit(branch_partials, path, start_date, end_date): path for path in paths}
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                partials.append(future.result())
+            except Exception as e:
+                errors[futures[future]] = str(e)
+    partials.sort(key=lambda p: paths.index(p["branch"])) # ترتيب الفروع كما في سطر الأوامر
+    return partials, errors
+
+
+def _parse_date(value):
+    try:
+        return datetime.date.fromisoformat(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"تاريخ غير صالح (YYYY-MM-DD): {value}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="تقرير موحد لعدة ملفات قواعد بيانات (فروع)")
+    parser.add_argument("databases", nargs="+", help="ملفات قواعد بيانات الفروع")
+    parser.add_argument("--report", choices=REPORTS, default="totals",
+                        help="لملف CSV: مجاميع الفروع أو ملخص العمال المدمج (JSON يتضمن الاثنين)")
+    parser.add_argument("--period", choices=PERIODS, default="current-month")
+    parser.add_argument("--from", dest="start", type=_parse_date, help="بداية الفترة YYYY-MM-DD (بدل --period)")
+    parser.add_argument("--to", dest="end", type=_parse_date, help="نهاية الفترة YYYY-MM-DD (افتراضيًا اليوم)")
+    parser.add_argument("--format", choices=("json", "csv"), default="json")
+    parser.add_argument("-o", "--output", help="ملف الناتج (افتراضيًا المخرج القياسي)")
+    parser.add_argument("--workers", type=int, help="عدد العمليات (افتراضيًا عدد الأنوية)")
+    args = parser.parse_args(argv)
+
+    if args.start:
+        start_date, end_date = args.start, args.end or business_today()
+    else:
+        start_date, end_date = period_range(args.period)
+    paths = list(dict.fromkeys(args.databases))
+
+    started = time.monotonic()
+    partials, errors = collect_partials(paths, start_date, end_date, args.workers)
+    for path, message in errors.items():
+        print(f"Error: {path}: {message}", file=sys.stderr)
+    total, users, branches = merge_partials(partials)
+    print(f"Consolidated {len(partials)} of {len(paths)} branch(es) in {time.monotonic() - started:.2f}s",
+          file=sys.stderr)
+
+    out = open(args.output, "w", encoding="utf-8", newline="") if args.output else sys.stdout
+    try:
+        if args.format == "json":
+            meta = {"report": "consolidated", "from": start_date.isoformat(), "to": end_date.isoformat(),
+                    "generated_at": datetime.datetime.now().isoformat(timespec="seconds"),
+                    "totals": total._asdict(), "branches": branches, "errors": errors}
+            write_json([row._asdict() for row in users], out, meta)
+        elif args.report == "totals":
+            write_csv(branches + [{"branch": "ALL", **total._asdict()}], out, BRANCH_FIELDS)
+        else:
+            write_csv([row._asdict() for row in users], out, UserMonthSummary._fields)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,13 +1,21 @@
+import os
 import sys
+import time
 import datetime
 from datetime import timezone
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
                              QLabel, QPushButton, QTableWidget, QTableWidgetItem, QDialog,
                              QLineEdit, QDialogButtonBox, QListWidget,
                              QListWidgetItem, QTextEdit, QSplitter, QHeaderView,
-                             QStyle, QFrame, QSizePolicy, QMenu, QFormLayout, QCheckBox)
-from PyQt6.QtGui import QColor, QDoubleValidator, QMouseEvent, QFont, QAction
-from PyQt6.QtCore import Qt, QSize, QPoint
+                             QStyle, QFrame, QSizePolicy, QMenu, QFormLayout, QCheckBox,
+                             QComboBox, QCompleter)
+from PyQt6.QtGui import QColor, QDoubleValidator, QMouseEvent, QFont, QAction, QShortcut, QKeySequence
+from PyQt6.QtCore import Qt, QSize, QPoint, QObject, QEvent, QStringListModel, QTimer, pyqtSignal
+
+from query_stats import ui_action
+from theme import set_dynamic_property
+from session_ledger import SessionLedger
+from receipt_printer import receipt_printer
 
 
 # Safe stub for AddTransactionDialog to satisfy linters (replace with real dialog in project)
@@ -87,6 +95,7 @@ if "AddTransactionDialog" not in globals():
             self.desc_input.setPlaceholderText("وصف المصروف، مثلاً: أدوات مكتبية")
             self.desc_input.setFixedHeight(36)
             self.desc_input.setStyleSheet("font-size:11.5pt; padding:6px;")
+            self.desc_completer = DescriptionCompleter(self.desc_input, "expense")
             self.content_layout.addWidget(desc_label)
             self.content_layout.addWidget(self.desc_input)
 
@@ -125,12 +134,26 @@ except Exception:
 # حاول استيراد نماذج قاعدة البيانات الحقيقية، وإن لم تتوفر استعمل بيانات وهمية للاختبار
 try:
     from database_setup import User, CashSession, Transaction, SessionLocal, FlexiTransaction
-    # If using SQLAlchemy, we may want to eager-load relationships
-    try:
-        from sqlalchemy.orm import joinedload
-    except Exception:
-        joinedload = None
+    HAS_DATABASE = True
 except Exception:
+    HAS_DATABASE = False
+
+# -- تعديل --: وحدات طبقة البيانات تستورد خارج البديل الوهمي، فخطأ فيها يظهر مباشرة
+# بدل أن يستبدل قاعدة البيانات الحقيقية ببيانات وهمية
+if HAS_DATABASE:
+    from database_setup import intern_description
+    from unit_of_work import session_scope
+    from dto import fetch_session
+    from read_models import fetch_user_session_rows, fetch_session_status
+    from session_bulk import close_session
+    from description_index import description_index
+    from flexi_forecast import flexi_forecaster
+    from pdf_reports import get_pdf_renderer
+    from action_profiler import action_profiler
+    from write_queue import write_queue, expense_write, flexi_write, overlay_pending
+else:
+    import contextlib
+    action_profiler = None
     from dataclasses import dataclass, field
     @dataclass
     class Transaction:
@@ -166,6 +189,7 @@ except Exception:
         start_balance: float = 0.0
         start_flexi: float = 0.0
         total_expense: float = 0.0
+        total_flexi_paid: float = 0.0
         total_flexi_additions: float = 0.0
         status: str = "closed"
         end_time: datetime.datetime | None = None
@@ -247,6 +271,100 @@ except Exception:
         def rollback(self): pass
         def close(self): pass
 
+    _mock_db = SessionLocal()
+
+    @contextlib.contextmanager
+    def session_scope():
+        yield _mock_db
+
+    def fetch_session(db, session_id):
+        return next((s for s in db._sessions if s.id == session_id), None)
+
+    def fetch_user_session_rows(db, user_id):
+        return db.query(CashSession).filter_by(user_id=user_id).all()
+
+    def fetch_session_status(db, session_id):
+        return next((s.status for s in db._sessions if s.id == session_id), None)
+
+    def close_session(db, session_id, end_balance, end_flexi, end_time):
+        session = fetch_session(db, session_id)
+        if session is None or session.status != 'open':
+            return None
+        session.status, session.end_balance, session.end_flexi, session.end_time = 'closed', end_balance, end_flexi, end_time
+        return session
+
+    # نفس قيم write_queue الحقيقية حتى تعمل الإيصالات والدفتر بنفس الحقول
+    def expense_write(session_id, amount, description):
+        return {"op_id": str(id(object())), "kind": "expense",
+                "values": {"session_id": session_id, "type": "expense", "amount": amount,
+                           "description": description, "timestamp": datetime.datetime.now(timezone.utc).isoformat()}}
+
+    def flexi_write(session_id, user_id, amount, description, is_paid):
+        return {"op_id": str(id(object())), "kind": "flexi",
+                "values": {"session_id": session_id, "user_id": user_id, "amount": amount,
+                           "description": description, "timestamp": datetime.datetime.now(timezone.utc).isoformat(),
+                           "is_paid": bool(is_paid)}}
+
+    def overlay_pending(session, records):
+        return session
+
+    class _EmptyDescriptionIndex:
+        loaded = True
+        def load(self, db): pass
+        def record_use(self, kind, text): pass
+        def complete(self, kind, prefix, limit=10): return []
+
+    description_index = _EmptyDescriptionIndex()
+
+    class _NoFlexiForecast:
+        def refresh(self, db): pass
+        def forecast(self, user_id, start): return None
+
+    flexi_forecaster = _NoFlexiForecast()
+    get_pdf_renderer = None
+
+    class _ImmediateWriteQueue:
+        # بدون قاعدة بيانات: كل عملية تعتبر محفوظة فورًا
+        def __init__(self): self._listeners = []
+        def add_listener(self, on_committed, on_failed): self._listeners.append((on_committed, on_failed))
+        def remove_listener(self, on_committed, on_failed): pass
+        def submit(self, record):
+            for on_committed, _ in self._listeners: on_committed([record])
+            return record["op_id"]
+        def pending(self): return []
+        def flush(self, timeout=5.0): return True
+
+    write_queue = _ImmediateWriteQueue()
+
+# مهلة انتظار حفظ طابور الكتابة قبل إغلاق الصندوق أو النافذة، وفترة فحصه
+WRITE_DRAIN_TIMEOUT_S = 10.0
+WRITE_DRAIN_POLL_MS = 50
+
+# -- إضافة --: جسر إشارات Qt لنتائج طابور الكتابة (تصل من الخيط العامل إلى خيط الواجهة)
+class WriteQueueBridge(QObject):
+    committed = pyqtSignal(list)
+    failed = pyqtSignal(dict, str)
+
+# -- إضافة --: إكمال تلقائي للأوصاف من فهرس البادئات (الأكثر استعمالًا أولًا)
+class DescriptionCompleter(QCompleter):
+    def __init__(self, line_edit, kind):
+        super().__init__(line_edit)
+        self.kind = kind
+        self.suggestions = QStringListModel(self)
+        self.setModel(self.suggestions)
+        # القائمة مرتبة ومصفاة مسبقًا من الفهرس، فلا يعيد QCompleter تصفيتها
+        self.setCompletionMode(QCompleter.CompletionMode.UnfilteredPopupCompletion)
+        line_edit.setCompleter(self)
+        line_edit.textEdited.connect(self.update_suggestions)
+
+    def update_suggestions(self, text):
+        matches = description_index.complete(self.kind, text) if text.strip() else []
+        self.suggestions.setStringList(matches)
+        if matches:
+            self.complete()
+        else:
+            self.popup().hide()
+
 # --- Custom Dialog Base Class ---
 class CustomDialog(QDialog):
     def __init__(self, title, parent=None):
@@ -400,12 +518,14 @@ class SummaryCard(QFrame):
 
 
 class SessionHistoryItem(QWidget):
-    def __init__(self, session: CashSession):
+    # -- تعديل --: التنسيق كله في ورقة أنماط النافذة (apply_styles)؛ الحالات عبر خصائص ديناميكية
+    def __init__(self, session, list_item=None):
         super().__init__()
         self.setObjectName("HistoryItem")
         self.setAttribute(Qt.WidgetAttribute.WA_StyledBackground, True)
         self.setAutoFillBackground(False)
         self.session = session
+        self.list_item = list_item
 
         # Make the widget expand horizontally inside the list
         self.setSizePolicy(QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Minimum)
@@ -431,10 +551,8 @@ class SessionHistoryItem(QWidget):
         date_time_layout.setSpacing(2)
         self.date_label = QLabel(session.start_time.strftime('%d/%m/%Y') if session.start_time else "غير متوفر")
         self.date_label.setObjectName("HistoryItemDate")
-        self.date_label.setStyleSheet("font-weight:600;")
         self.time_label = QLabel(session.start_time.strftime('%H:%M') if session.start_time else "")
         self.time_label.setObjectName("HistoryItemTime")
-        self.time_label.setStyleSheet("color: rgba(0,0,0,0.55); font-size:12px;")
         date_time_layout.addWidget(self.date_label)
         date_time_layout.addWidget(self.time_label)
         self.card_layout.addLayout(date_time_layout)
@@ -453,8 +571,6 @@ class SessionHistoryItem(QWidget):
         
         self.note_label = QLabel(note_preview)
         self.note_label.setObjectName("HistoryItemNote")
-        # Making the note label more prominent
-        self.note_label.setStyleSheet("color: #343a40; font-size:14px; font-weight: 500;") 
         middle_layout.addWidget(self.note_label)
 
         self.card_layout.addLayout(middle_layout, stretch=1)
@@ -474,21 +590,13 @@ class SessionHistoryItem(QWidget):
             profit_value = 0.0
         self.profit_label = QLabel(f"{profit_value:+.2f}")
         self.profit_label.setObjectName("HistoryItemProfit")
-        self.profit_label.setStyleSheet("font-weight:700; font-size:13px;")
-        if profit_value >= 0:
-            self.profit_label.setStyleSheet(self.profit_label.styleSheet() + "color: #198754;")
-        else:
-            self.profit_label.setStyleSheet(self.profit_label.styleSheet() + "color: #dc3545;")
+        self.profit_label.setProperty("positive", profit_value >= 0)
 
         # status badge (open/closed)
         status_text = "مفتوحة" if session.status == 'open' else "مغلقة"
         self.status_badge = QLabel(status_text)
         self.status_badge.setObjectName("StatusBadge")
-        # style depending on status
-        if session.status == 'open':
-            self.status_badge.setStyleSheet("padding:6px 10px; border-radius:12px; background-color: rgba(25,135,84,0.12); color:#198754; font-weight:600;")
-        else:
-            self.status_badge.setStyleSheet("padding:6px 10px; border-radius:12px; background-color: rgba(220,53,69,0.08); color:#dc3545; font-weight:600;")
+        self.status_badge.setProperty("status", 'open' if session.status == 'open' else 'closed')
 
         right_layout.addWidget(self.profit_label, alignment=Qt.AlignmentFlag.AlignRight)
         right_layout.addWidget(self.status_badge, alignment=Qt.AlignmentFlag.AlignRight)
@@ -499,7 +607,7 @@ class SessionHistoryItem(QWidget):
                 # حساب الربح الصافي الكلي
                 total_net_profit = (session.end_balance - session.start_balance - session.total_expense) + (session.total_flexi_additions - session.flexi_consumed)
                 total_profit_label = QLabel(f"<b>الربح الصافي:</b> {total_net_profit:,.2f}")
-                total_profit_label.setStyleSheet("font-size: 10px; color: #495057;")
+                total_profit_label.setObjectName("HistoryItemTotalProfit")
                 right_layout.addWidget(total_profit_label, alignment=Qt.AlignmentFlag.AlignRight)
             except Exception:
                 pass
@@ -512,68 +620,28 @@ class SessionHistoryItem(QWidget):
         self.setAttribute(Qt.WidgetAttribute.WA_Hover, True)
 
         # default unselected style
-        self.set_selected_state(False)
+        self.card.setProperty("selected", False)
+        self.card.setProperty("hovered", False)
 
     def set_selected_state(self, selected: bool):
-        """Apply selected/unselected visual style to the card frame."""
-        if selected:
-            self.card.setStyleSheet("""
-                QFrame#HistoryCard {
-                    border: 1px solid rgba(13,110,253,0.18);
-                    border-radius: 10px;
-                    background-color: rgba(13,110,253,0.03);
-                }
-            """)
-        else:
-            self.card.setStyleSheet("""
-                QFrame#HistoryCard {
-                    border: 1px solid rgba(0,0,0,0.06);
-                    border-radius: 10px;
-                    background-color: white;
-                }
-            """)
+        """Toggle the card's `selected` property; only this card is re-polished."""
+        set_dynamic_property(self.card, "selected", selected)
 
     def enterEvent(self, event):
         # subtle hover highlight
-        prev = self.card.styleSheet()
-        hover_style = """
-            QFrame#HistoryCard {
-                border: 1px solid rgba(13,110,253,0.22);
-                border-radius: 10px;
-                background-color: rgba(13,110,253,0.04);
-            }
-        """
-        self.card.setStyleSheet(hover_style)
+        set_dynamic_property(self.card, "hovered", True)
         super().enterEvent(event)
 
     def leaveEvent(self, event):
-        # restore based on selection state
-        # find if parent list has this as current
-        parent = self.parent()
-        is_selected = False
-        while parent is not None and not isinstance(parent, QListWidget):
-            parent = parent.parent()
-        if isinstance(parent, QListWidget):
-            for i in range(parent.count()):
-                it = parent.item(i)
-                if parent.itemWidget(it) is self and parent.currentItem() is it:
-                    is_selected = True
-                    break
-        self.set_selected_state(is_selected)
+        # selection is kept in its own property, so leaving only clears the hover
+        set_dynamic_property(self.card, "hovered", False)
         super().leaveEvent(event)
 
     def mousePressEvent(self, event):
         super().mousePressEvent(event)
         # when clicked, select the matching QListWidgetItem
-        parent = self.parent()
-        while parent is not None and not isinstance(parent, QListWidget):
-            parent = parent.parent()
-        if isinstance(parent, QListWidget):
-            for i in range(parent.count()):
-                it = parent.item(i)
-                if parent.itemWidget(it) is self:
-                    parent.setCurrentItem(it)
-                    break
+        if self.list_item is not None and self.list_item.listWidget() is not None:
+            self.list_item.listWidget().setCurrentItem(self.list_item)
 
 class AddFlexiDialog(CustomDialog):
     def __init__(self, parent=None):
@@ -591,6 +659,7 @@ class AddFlexiDialog(CustomDialog):
         desc_label = QLabel("ملاحظة (اختياري):")
         self.desc_input = QLineEdit()
         self.desc_input.setPlaceholderText("مثلاً: شحن فليكسي من حساب خاص")
+        self.desc_completer = DescriptionCompleter(self.desc_input, "flexi")
         
         # -- تعديل --: تغيير الحالة الافتراضية إلى غير محددة
         self.is_paid_checkbox = QCheckBox("تم الدفع نقدًا من الصندوق")
@@ -624,7 +693,7 @@ class AddFlexiDialog(CustomDialog):
             CustomMessageBox.show_warning(self, "خطأ", "الرجاء إدخال قيمة رقمية صحيحة.")
 
 class OpenCashDialog(CustomDialog):
-    def __init__(self, parent=None):
+    def __init__(self, parent=None, flexi_forecast=None):
         super().__init__("فتح صندوق جديد", parent)
         self.setMinimumWidth(400)
 
@@ -644,6 +713,19 @@ class OpenCashDialog(CustomDialog):
         layout.addWidget(self.balance_input)
         layout.addWidget(label_flexi)
         layout.addWidget(self.flexi_input)
+
+        # -- إضافة --: الاستهلاك المتوقع من تاريخ الجلسات (flexi_forecast) كإرشاد لرصيد البداية
+        if flexi_forecast is not None:
+            hint = (f"الاستهلاك المتوقع لهذه الجلسة (~{flexi_forecast.session_hours:.0f} ساعات): "
+                    f"{flexi_forecast.session_expected:,.2f} — الموصى به: {flexi_forecast.session_recommended:,.2f}")
+            if flexi_forecast.day_expected is not None:
+                hint += (f"\nالمتوقع لليوم كاملًا: {flexi_forecast.day_expected:,.2f}"
+                         f" — الموصى به: {flexi_forecast.day_recommended:,.2f}")
+            forecast_label = QLabel(hint)
+            forecast_label.setObjectName("ForecastHint")
+            forecast_label.setWordWrap(True)
+            forecast_label.setStyleSheet("color: #8b949e; font-size: 9pt;")
+            layout.addWidget(forecast_label)
         
         self.button_box = QDialogButtonBox(QDialogButtonBox.StandardButton.Ok | QDialogButtonBox.StandardButton.Cancel)
         self.button_box.accepted.connect(self.accept)
@@ -790,18 +872,149 @@ class ClosingReportDialog(CustomDialog):
         button_box = QDialogButtonBox(QDialogButtonBox.StandardButton.Ok)
         button_box.accepted.connect(self.accept)
 
+        # -- إضافة --: حفظ التقرير PDF في الخلفية (pdf_reports) دون انتظار
+        self.session_id = session.id
+        self.pdf_batch = None
+        if get_pdf_renderer is not None and session.id is not None:
+            self.pdf_button = button_box.addButton("حفظ PDF", QDialogButtonBox.ButtonRole.ActionRole)
+            self.pdf_button.clicked.connect(self.save_pdf)
+
         layout.addWidget(title_label)
         layout.addLayout(form_layout)
         layout.addWidget(button_box)
 
+    def save_pdf(self):
+        renderer = get_pdf_renderer()
+        renderer.batch_finished.connect(self.on_pdf_finished)
+        self.pdf_button.setEnabled(False)
+        self.pdf_button.setText("جارٍ الحفظ...")
+        self.pdf_batch = renderer.closing_report(self.session_id)
+
+    def on_pdf_finished(self, batch_id, directory, paths, errors):
+        if batch_id != self.pdf_batch:
+            return
+        get_pdf_renderer().batch_finished.disconnect(self.on_pdf_finished)
+        if paths:
+            self.pdf_button.setText("تم الحفظ")
+            self.pdf_button.setToolTip(os.path.abspath(paths[0]))
+        else:
+            self.pdf_button.setEnabled(True)
+            self.pdf_button.setText("حفظ PDF")
+            CustomMessageBox.show_warning(self, "خطأ", f"فشل حفظ التقرير: {'; '.join(errors)}")
+
 
 # --- Main window ---
+# -- إضافة --: شريط إدخال سريع بلوحة المفاتيح (بدون نوافذ حوار) للمصاريف والفليكسي
+class RapidEntryBar(QFrame):
+    """
+    المبلغ ثم Enter ثم الوصف ثم Enter يضيف السطر ويعيد المؤشر إلى المبلغ للسطر التالي.
+    مفتاح * في خانة المبلغ (لوحة الأرقام) يبدل بين مصروف وفليكسي، و Esc يمسح السطر.
+    """
+    entry_submitted = pyqtSignal(str, float, str, bool) # النوع، المبلغ، الوصف، مدفوع
+
+    KINDS = (("expense", "مصروف"), ("flexi", "فليكسي"))
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setObjectName("RapidEntryBar")
+        layout = QHBoxLayout(self)
+        layout.setContentsMargins(12, 8, 12, 8)
+        layout.setSpacing(10)
+
+        title = QLabel("إدخال سريع")
+        title.setObjectName("RapidEntryTitle")
+        self.kind_combo = QComboBox()
+        for key, label in self.KINDS:
+            self.kind_combo.addItem(label, key)
+        self.amount_input = QLineEdit()
+        self.amount_input.setPlaceholderText("المبلغ")
+        self.amount_input.setValidator(QDoubleValidator(0.00, 9999999999.99, 2))
+        self.amount_input.setFixedWidth(140)
+        self.desc_input = QLineEdit()
+        self.desc_input.setPlaceholderText("الوصف (Enter للإضافة)")
+        self.completer = DescriptionCompleter(self.desc_input, "expense")
+        self.paid_checkbox = QCheckBox("مدفوع")
+        self.status_label = QLabel()
+        self.status_label.setObjectName("RapidEntryStatus")
+
+        layout.addWidget(title)
+        layout.addWidget(self.kind_combo)
+        layout.addWidget(self.amount_input)
+        layout.addWidget(self.desc_input, stretch=1)
+        layout.addWidget(self.paid_checkbox)
+        layout.addWidget(self.status_label)
+
+        self.kind_combo.currentIndexChanged.connect(self.on_kind_changed)
+        self.amount_input.returnPressed.connect(self.desc_input.setFocus)
+        self.desc_input.returnPressed.connect(self.submit_entry)
+        self.amount_input.installEventFilter(self)
+        self.desc_input.installEventFilter(self)
+        self.on_kind_changed()
+
+    def kind(self):
+        return self.kind_combo.currentData()
+
+    def on_kind_changed(self):
+        self.paid_checkbox.setVisible(self.kind() == "flexi")
+        self.completer.kind = self.kind()
+
+    def set_pending_count(self, count):
+        self.status_label.setText(f"قيد الحفظ: {count}" if count else "")
+
+    def set_draining(self, count):
+        self.status_label.setText(f"جاري حفظ {count} عملية قبل الإغلاق...")
+
+    def eventFilter(self, obj, event):
+        if event.type() == QEvent.Type.KeyPress:
+            if obj is self.amount_input and event.key() == Qt.Key.Key_Asterisk:
+                self.kind_combo.setCurrentIndex((self.kind_combo.currentIndex() + 1) % self.kind_combo.count())
+                return True
+            if event.key() == Qt.Key.Key_Escape:
+                self.clear_entry()
+                return True
+        return super().eventFilter(obj, event)
+
+    def clear_entry(self):
+        self.amount_input.clear()
+        self.desc_input.clear()
+        self.amount_input.setFocus()
+
+    def submit_entry(self):
+        # Enter يقبل النص كما هو حتى لو كانت قائمة الاقتراحات ظاهرة
+        self.completer.popup().hide()
+        try:
+            amount = float(self.amount_input.text().strip().replace(",", "."))
+        except ValueError:
+            self.amount_input.setFocus()
+            return
+        if amount <= 0:
+            self.amount_input.setFocus()
+            return
+        description = self.desc_input.text().strip()
+        kind = self.kind()
+        self.entry_submitted.emit(kind, amount, description, self.paid_checkbox.isChecked())
+        self.clear_entry()
+
+
 class UserDashboard(QMainWindow):
     def __init__(self, user: User):
         super().__init__()
         self.user = user
-        self.db_session = SessionLocal()
         self.current_session = None
+        self.ledger = None # مجاميع الجلسة المفتوحة الجارية (SessionLedger)
+        self.pending_writes = {} # op_id -> عملية أرسلت لطابور الكتابة ولم تحفظ بعد
+        self.write_bridge = WriteQueueBridge(self)
+        self.write_bridge.committed.connect(self.on_writes_committed)
+        self.write_bridge.failed.connect(self.on_write_failed)
+        self.write_listener = (self.write_bridge.committed.emit, self.write_bridge.failed.emit)
+        write_queue.add_listener(*self.write_listener)
+        # انتظار تفريغ الطابور بمؤقت بدل flush() الذي يحجز خيط الواجهة
+        self.drain_timer = QTimer(self)
+        self.drain_timer.setInterval(WRITE_DRAIN_POLL_MS)
+        self.drain_timer.timeout.connect(self.poll_write_drain)
+        self.drain_deadline = 0.0
+        self.drain_callbacks = None # (عند الحفظ، عند انتهاء المهلة)
+        self.window_closing = False
         self.setWindowTitle(f"نظام إدارة الصندوق - {self.user.username}")
         self.setGeometry(80, 80, 1300, 760)
         self.setMinimumSize(1100, 650)
@@ -809,6 +1022,11 @@ class UserDashboard(QMainWindow):
         self.apply_styles()
         self.load_user_sessions_history()
         self.check_for_open_session()
+        # -- إضافة --: Ctrl+Shift+P يسجل أداء الإجراءات الخمسة التالية لإرسالها للدعم
+        QShortcut(QKeySequence("Ctrl+Shift+P"), self).activated.connect(self.arm_action_profiler)
+        # F2 ينقل المؤشر إلى شريط الإدخال السريع
+        QShortcut(QKeySequence("F2"), self).activated.connect(self.focus_rapid_entry)
+        self.load_description_index()
 
     def setup_ui(self):
         main_widget = QWidget()
@@ -906,6 +1124,10 @@ class UserDashboard(QMainWindow):
         tables_container = QWidget()
         tables_container.setObjectName("Container")
         tables_layout = QVBoxLayout(tables_container)
+
+        self.rapid_entry_bar = RapidEntryBar()
+        self.rapid_entry_bar.entry_submitted.connect(self.add_rapid_entry)
+        tables_layout.addWidget(self.rapid_entry_bar)
         
         # Expenses table
         table_label = QLabel("سجل المصاريف")
@@ -1031,22 +1253,22 @@ class UserDashboard(QMainWindow):
             QListWidget#SessionsList::item:selected { background-color: transparent; color: black; border: none; }
             
             QWidget#HistoryItem { background-color: transparent; }
-            #HistoryItemDate { font-size: 11pt; font-weight: 700; color: #212529; }
-            #HistoryItemTime { font-size: 9pt; color: #6c757d; }
-            #HistoryItemProfit { font-size: 12pt; font-weight: 800; }
+            QFrame#HistoryCard { border: 1px solid rgba(0,0,0,0.06); border-radius: 10px; background-color: white; }
+            QFrame#HistoryCard[selected="true"] { border: 1px solid rgba(13,110,253,0.18); background-color: rgba(13,110,253,0.03); }
+            QFrame#HistoryCard[hovered="true"] { border: 1px solid rgba(13,110,253,0.22); background-color: rgba(13,110,253,0.04); }
+            #HistoryItemDate { font-size: 11pt; font-weight: 600; color: #212529; }
+            #HistoryItemTime { font-size: 12px; color: rgba(0,0,0,0.55); }
+            #HistoryItemNote { color: #343a40; font-size: 14px; font-weight: 500; }
+            #HistoryItemProfit { font-size: 13px; font-weight: 700; }
             #HistoryItemProfit[positive="true"] { color: #198754; }
             #HistoryItemProfit[positive="false"] { color: #dc3545; }
-            
-            #HistoryItemStatus {
-                font-size: 9pt; font-weight: 800; padding: 4px 8px;
-                border-radius: 6px;
-            }
-            #HistoryItemStatus[status="open"] { background-color: #d1e7dd; color: #0f5132; }
-            #HistoryItemStatus[status="closed"] { background-color: #f8d7da; color: #842029; }
+            #HistoryItemTotalProfit { font-size: 10px; color: #495057; }
+
+            #StatusBadge { padding: 6px 10px; border-radius: 12px; font-weight: 600; }
+            #StatusBadge[status="open"] { background-color: rgba(25,135,84,0.12); color: #198754; }
+            #StatusBadge[status="closed"] { background-color: rgba(220,53,69,0.08); color: #dc3545; }
             
             #SelectionIndicator { background-color: #0d6efd; border-radius: 2px; }
-            
-            QWidget#HistoryItem[selected="true"] { background-color: #e3f2fd; }
 
             QPushButton {
                 border: none; padding: 12px 18px; font-size: 10pt;
@@ -1059,6 +1281,9 @@ class UserDashboard(QMainWindow):
             #SuccessButton:hover { background-color: #157347; }
             #DangerButton { background-color: #dc3545; color: white; }
             #DangerButton:hover { background-color: #bb2d3b; }
+            #RapidEntryBar { background-color: #ffffff; border: 1px solid #dee2e6; border-radius: 8px; }
+            #RapidEntryTitle { font-weight: 700; color: #495057; }
+            #RapidEntryStatus { color: #6c757d; font-size: 9pt; }
             #SecondaryButton { background-color: #6c757d; color: white; }
             #SecondaryButton:hover { background-color: #5a6268; }
 
@@ -1125,47 +1350,30 @@ class UserDashboard(QMainWindow):
         self.transactions_table.setAlternatingRowColors(True)
         self.flexi_transactions_table.setAlternatingRowColors(True)
 
+    @ui_action("سجل الجلسات", max_statements=1)
     def load_user_sessions_history(self):
         self.sessions_history_list.clear()
         # Fix #6: Sessions Ordering - This was already correct.
-        # Try to eager-load transactions if SQLAlchemy is available; fallback to simple query for mock session
-        try:
-            if joinedload:
-                sessions = self.db_session.query(CashSession).options(joinedload(CashSession.transactions)).filter_by(user_id=self.user.id).order_by(CashSession.start_time.desc()).all()
-            else:
-                sessions = self.db_session.query(CashSession).filter_by(user_id=self.user.id).order_by(CashSession.start_time.desc()).all()
-        except Exception:
-            sessions = self.db_session.query(CashSession).filter_by(user_id=self.user.id).order_by(CashSession.start_time.desc()).all()
+        with session_scope() as db:
+            sessions = fetch_user_session_rows(db, self.user.id)
         
         for session in sessions:
             list_item = QListWidgetItem(self.sessions_history_list)
             list_item.setData(Qt.ItemDataRole.UserRole, session.id)
-            item_widget = SessionHistoryItem(session)
+            item_widget = SessionHistoryItem(session, list_item)
             list_item.setSizeHint(item_widget.sizeHint())
             self.sessions_history_list.setItemWidget(list_item, item_widget)
 
     def update_summary_display(self, session):
         if session:
             # Recalculate total_expense from transactions (only expense type)
-            transactions = getattr(session, 'transactions', None)
-            if not transactions:
-                try:
-                    transactions = self.db_session.query(Transaction).filter_by(session_id=session.id).all()
-                except Exception:
-                    transactions = []
-
+            transactions = getattr(session, 'transactions', None) or []
             total_expense = sum(getattr(t, 'amount', 0.0) for t in transactions if getattr(t, 'type', 'expense') == 'expense')
             self.start_balance_card.set_value(f"<b>{session.start_balance:,.2f}</b>")
             self.total_expense_card.set_value(f"<b>{total_expense:,.2f}</b>")
 
             # Flexi summary
-            flexi_additions = getattr(session, 'flexi_transactions', [])
-            if not flexi_additions:
-                try:
-                    flexi_additions = self.db_session.query(FlexiTransaction).filter_by(session_id=session.id).all()
-                except Exception:
-                    flexi_additions = []
-            
+            flexi_additions = getattr(session, 'flexi_transactions', None) or []
             total_flexi_additions = sum(t.amount for t in flexi_additions)
             
             # Use end_flexi if closed, otherwise calculate from start + additions
@@ -1187,8 +1395,11 @@ class UserDashboard(QMainWindow):
 
             # -- إضافة --: حساب الربح الصافي الكلي
             # (الرصيد الفعلي - رصيد البداية - المصاريف) + (إضافات الفليكسي - الفليكسي المستهلك)
-            total_net_profit = (session.end_balance - session.start_balance - session.total_expense) + (session.total_flexi_additions - session.flexi_consumed)
-            self.total_net_profit_card.set_value(f"<b>{total_net_profit:,.2f}</b>")
+            if session.end_balance is not None:
+                total_net_profit = (session.end_balance - session.start_balance - session.total_expense) + (session.total_flexi_additions - session.flexi_consumed)
+                self.total_net_profit_card.set_value(f"<b>{total_net_profit:,.2f}</b>")
+            else:
+                self.total_net_profit_card.set_value("<b>--</b>")
 
 
         else:
@@ -1199,6 +1410,7 @@ class UserDashboard(QMainWindow):
             self.flexi_consumed_card.set_value("<b>--</b>")
             self.total_net_profit_card.set_value("<b>--</b>")
 
+    @ui_action("اختيار جلسة من السجل", max_statements=3)
     def select_session_from_history(self, current_item, previous_item):
         # Fix #3: Selection Indicator - This logic was already correct.
         if previous_item:
@@ -1210,22 +1422,20 @@ class UserDashboard(QMainWindow):
             if isinstance(current_widget, SessionHistoryItem):
                 current_widget.set_selected_state(True)
             session_id = current_item.data(Qt.ItemDataRole.UserRole)
-            # Try to eager-load transactions if SQLAlchemy is available; fallback to simple query for mock session
-            try:
-                if joinedload:
-                    selected_session = self.db_session.query(CashSession).options(joinedload(CashSession.transactions), joinedload(CashSession.flexi_transactions)).filter_by(id=session_id).one()
-                else:
-                    selected_session = self.db_session.query(CashSession).filter_by(id=session_id).one()
-            except Exception:
-                selected_session = self.db_session.query(CashSession).filter_by(id=session_id).one()
+            with session_scope() as db:
+                selected_session = fetch_session(db, session_id)
             self.display_session_details(selected_session)
         else:
             self.display_session_details(None)
 
+    @ui_action("فحص الجلسة المفتوحة")
     def check_for_open_session(self):
-        open_session = self.db_session.query(CashSession).filter_by(user_id=self.user.id, status='open').first()
+        with session_scope() as db:
+            open_session = db.query(CashSession).filter_by(user_id=self.user.id, status='open').first()
+            open_session = fetch_session(db, open_session.id) if open_session else None
         if open_session:
             self.current_session = open_session
+            self.ledger = SessionLedger.from_session(open_session)
             for i in range(self.sessions_history_list.count()):
                 item = self.sessions_history_list.item(i)
                 if item.data(Qt.ItemDataRole.UserRole) == open_session.id:
@@ -1233,6 +1443,7 @@ class UserDashboard(QMainWindow):
                     break
         else:
             self.current_session = None
+            self.ledger = None
         self.update_ui_for_session_status()
 
     def display_session_details(self, session):
@@ -1263,8 +1474,12 @@ class UserDashboard(QMainWindow):
         self.notes_editor.setReadOnly(not is_open)
         self.save_notes_btn.setEnabled(is_open)
 
+    @ui_action("فتح الصندوق")
     def open_cash_session(self):
-        dialog = OpenCashDialog(self)
+        with session_scope() as db:
+            flexi_forecaster.refresh(db)
+        forecast = flexi_forecaster.forecast(self.user.id, datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None))
+        dialog = OpenCashDialog(self, forecast)
         if dialog.exec() == QDialog.DialogCode.Accepted:
             data = dialog.get_data()
             if data is None:
@@ -1272,62 +1487,110 @@ class UserDashboard(QMainWindow):
                 return
             new_session = CashSession(user_id=self.user.id, start_balance=data["start_balance"], start_flexi=data["start_flexi"], start_time=datetime.datetime.now(datetime.timezone.utc))
             try:
-                self.db_session.add(new_session)
-                self.db_session.commit()
+                with session_scope() as db:
+                    db.add(new_session)
             except IntegrityError as e:
-                self.db_session.rollback()
                 CustomMessageBox.show_critical(self, "خطأ في فتح الصندوق", "حدث خطأ عند إنشاء الجلسة. الرجاء إعادة المحاولة.")
                 print("IntegrityError عند فتح جلسة:", e)
                 return
 
-            self.db_session.refresh(new_session)
-            self.current_session = new_session
             self.load_user_sessions_history()
             self.check_for_open_session()
 
+    # -- إضافة --: المشرف قد يغلق الجلسة من لوحته (الجلسات المتروكة) والنافذة مفتوحة، فحالتها
+    # تقرأ من القاعدة قبل أي إدخال أو إغلاق؛ إن أغلقت تعرض النافذة الحالة الحالية بدون جلسة
+    def confirm_session_open(self):
+        with session_scope() as db:
+            status = fetch_session_status(db, self.current_session.id)
+        if status == 'open':
+            return True
+        CustomMessageBox.show_warning(self, "تنبيه", "تم إغلاق هذه الجلسة من لوحة المشرف. افتح جلسة جديدة للمتابعة.")
+        self.load_user_sessions_history()
+        self.check_for_open_session()
+        return False
+
+    @ui_action("إضافة مصروف")
     def add_expense(self):
         if not self.current_session or self.current_session.status != 'open':
             CustomMessageBox.show_warning(self, "تنبيه", "يجب فتح جلسة أولاً لإضافة مصروف.")
             return
+        if not self.confirm_session_open(): return
         dialog = AddTransactionDialog(self)
         if dialog.exec() == QDialog.DialogCode.Accepted:
             data = dialog.transaction_data
-            new_transaction = Transaction(session_id=self.current_session.id, type='expense', amount=data['amount'], description=data['description'], timestamp=datetime.datetime.now(datetime.timezone.utc))
-            try:
-                self.db_session.add(new_transaction)
-                self.db_session.commit()
-            except IntegrityError as e:
-                self.db_session.rollback()
-                CustomMessageBox.show_critical(self, "خطأ", "حدث خطأ عند إضافة المصروف. حاول مرة أخرى.")
-                print("IntegrityError عند إضافة مصروف:", e)
-                return
-
-            self.db_session.refresh(self.current_session)
-            self.load_transactions(self.current_session)
-            self.update_summary_display(self.current_session)
+            # -- تعديل --: الحفظ عبر طابور الكتابة، والصف يظهر فورًا كـ "قيد الحفظ"
+            self.submit_write(expense_write(self.current_session.id, data['amount'], data['description']))
             
+    @ui_action("إضافة فليكسي")
     def add_flexi(self):
         if not self.current_session or self.current_session.status != 'open':
             CustomMessageBox.show_warning(self, "تنبيه", "يجب فتح جلسة أولاً لإضافة فليكسي.")
             return
+        if not self.confirm_session_open(): return
         dialog = AddFlexiDialog(self)
         if dialog.exec() == QDialog.DialogCode.Accepted:
             data = dialog.flexi_data
             if data:
-                # -- تعديل --: إضافة خاصية is_paid
-                new_flexi_transaction = FlexiTransaction(session_id=self.current_session.id, amount=data['amount'], description=data['description'], user_id=self.user.id, timestamp=datetime.datetime.now(datetime.timezone.utc), is_paid=data['is_paid'])
-                try:
-                    self.db_session.add(new_flexi_transaction)
-                    self.db_session.commit()
-                except IntegrityError as e:
-                    self.db_session.rollback()
-                    CustomMessageBox.show_critical(self, "خطأ", "حدث خطأ عند إضافة الفليكسي. حاول مرة أخرى.")
-                    print("IntegrityError عند إضافة فليكسي:", e)
-                    return
-                
-                self.db_session.refresh(self.current_session)
-            self.load_flexi_transactions(self.current_session)
-            self.update_summary_display(self.current_session)
+                # -- تعديل --: إضافة خاصية is_paid، والحفظ عبر طابور الكتابة
+                self.submit_write(flexi_write(self.current_session.id, self.user.id, data['amount'], data['description'], data['is_paid']))
+
+    @ui_action("إدخال سريع")
+    def add_rapid_entry(self, kind, amount, description, is_paid):
+        if not self.current_session or self.current_session.status != 'open':
+            return
+        if not self.confirm_session_open(): return
+        if kind == "expense":
+            self.submit_write(expense_write(self.current_session.id, amount, description))
+        else:
+            self.submit_write(flexi_write(self.current_session.id, self.user.id, amount, description, is_paid))
+
+    def load_description_index(self):
+        # يحمل مرة واحدة؛ بعدها يحدث الفهرس تدريجيًا مع كل إدخال (submit_write)
+        if not description_index.loaded:
+            with session_scope() as db:
+                description_index.load(db)
+
+    def focus_rapid_entry(self):
+        if self.rapid_entry_bar.isEnabled():
+            self.rapid_entry_bar.amount_input.setFocus()
+            self.rapid_entry_bar.amount_input.selectAll()
+
+    def submit_write(self, record):
+        self.pending_writes[record["op_id"]] = record
+        write_queue.submit(record)
+        if self.ledger: self.ledger.apply_write(record)
+        description_index.record_use(record["kind"], record["values"].get("description"))
+        self.rapid_entry_bar.set_pending_count(len(self.pending_writes))
+        self.render_current_session()
+
+    def render_current_session(self):
+        """يعرض الجلسة الحالية مع العمليات غير المحفوظة بعد (بدون أي استعلام)."""
+        if not self.current_session: return
+        session = overlay_pending(self.current_session, list(self.pending_writes.values()))
+        self.load_transactions(session)
+        self.load_flexi_transactions(session)
+        self.update_summary_display(session)
+
+    def on_writes_committed(self, records):
+        mine = [r for r in records if self.pending_writes.pop(r["op_id"], None) is not None]
+        # -- إضافة --: وصل المصروف يطبع بعد حفظه فقط (يوضع في طابور الطابعة، الطباعة في خيط خلفي)
+        for record in mine:
+            if record["kind"] == "expense": receipt_printer.print_expense(self.user.username, record["values"])
+        if not self.drain_timer.isActive():
+            self.rapid_entry_bar.set_pending_count(len(self.pending_writes))
+        if mine and self.current_session:
+            # تحديث واحد لكل دفعة محفوظة، مع إبقاء العمليات التي لا تزال في الطابور
+            self.reload_current_session()
+            self.render_current_session()
+
+    def on_write_failed(self, record, message):
+        if self.pending_writes.pop(record["op_id"], None) is None: return
+        if self.ledger: self.ledger.discard_write(record)
+        self.rapid_entry_bar.set_pending_count(len(self.pending_writes))
+        self.render_current_session()
+        label = "المصروف" if record["kind"] == "expense" else "الفليكسي"
+        CustomMessageBox.show_critical(self, "خطأ", f"تعذر حفظ {label}، تمت إزالته من القائمة. حاول مرة أخرى.")
+        print(f"فشل حفظ عملية من طابور الكتابة ({record['kind']}):", message)
 
     def open_transaction_menu(self, position):
         if not self.current_session or self.current_session.status == 'closed':
@@ -1345,11 +1608,10 @@ class UserDashboard(QMainWindow):
         if not id_item:
             return
         transaction_id = id_item.data(Qt.ItemDataRole.UserRole)
+        if transaction_id is None: # صف متفائل لم يحفظ بعد
+            return
         action = menu.exec(self.transactions_table.mapToGlobal(position))
-        try:
-            transaction = self.db_session.get(Transaction, transaction_id)
-        except Exception:
-            transaction = None
+        transaction = next((t for t in self.current_session.transactions if t.id == transaction_id), None)
         
         if not transaction: return
 
@@ -1358,94 +1620,95 @@ class UserDashboard(QMainWindow):
         elif action == delete_action:
             self.delete_transaction(transaction)
 
+    @ui_action("تعديل مصروف")
     def edit_transaction(self, transaction_to_edit):
         dialog = AddTransactionDialog(self, transaction=transaction_to_edit)
         if dialog.exec() == QDialog.DialogCode.Accepted:
             data = dialog.transaction_data
-            transaction_to_edit.amount = data['amount']
-            transaction_to_edit.description = data['description']
-            try:
-                self.db_session.commit()
-            except Exception:
-                if hasattr(self.db_session, 'rollback'):
-                    self.db_session.rollback()
-            # reload current session from DB if possible
             try:
-                if hasattr(self.db_session, 'get'):
-                    self.current_session = self.db_session.get(CashSession, self.current_session.id)
-                elif hasattr(self.db_session, 'get_session_by_id'):
-                    self.current_session = self.db_session.get_session_by_id(self.current_session.id)
-            except Exception:
-                pass
+                with session_scope() as db:
+                    transaction = db.get(Transaction, transaction_to_edit.id)
+                    if transaction is not None:
+                        transaction.amount = data['amount']
+                        transaction.description_id = intern_description(db.connection(), transaction.type, data['description'])
+            except Exception as e:
+                CustomMessageBox.show_critical(self, "خطأ", "حدث خطأ عند تعديل المصروف. حاول مرة أخرى.")
+                print("خطأ عند تعديل مصروف:", e)
+                return
+            # الدفتر يتبع القاعدة: يعدل بعد نجاح الحفظ فقط
+            if transaction is not None and self.ledger:
+                self.ledger.edit_expense(transaction_to_edit.amount, data['amount'], transaction_to_edit.type)
+            self.reload_current_session()
             self.load_transactions(self.current_session)
             self.update_summary_display(self.current_session)
             
+    @ui_action("حذف مصروف")
     def delete_transaction(self, transaction_to_delete):
         if CustomMessageBox.show_question(self, 'تأكيد الحذف', f"هل أنت متأكد من حذف هذا المصروف؟"):
-            self.db_session.delete(transaction_to_delete)
             try:
-                self.db_session.commit()
-            except Exception:
-                if hasattr(self.db_session, 'rollback'):
-                    self.db_session.rollback()
-            # reload current session from DB if possible
-            try:
-                if hasattr(self.db_session, 'get'):
-                    self.current_session = self.db_session.get(CashSession, self.current_session.id)
-                elif hasattr(self.db_session, 'get_session_by_id'):
-                    self.current_session = self.db_session.get_session_by_id(self.current_session.id)
-            except Exception:
-                pass
+                with session_scope() as db:
+                    transaction = db.get(Transaction, transaction_to_delete.id)
+                    if transaction is not None:
+                        db.delete(transaction)
+            except Exception as e:
+                CustomMessageBox.show_critical(self, "خطأ", "حدث خطأ عند حذف المصروف. حاول مرة أخرى.")
+                print("خطأ عند حذف مصروف:", e)
+                return
+            if transaction is not None and self.ledger:
+                self.ledger.remove_expense(transaction_to_delete.amount, transaction_to_delete.type)
+            self.reload_current_session()
             self.load_transactions(self.current_session)
             self.update_summary_display(self.current_session)
 
+    @ui_action("إغلاق الصندوق", max_statements=3)
     def close_cash_session(self):
-        if not self.current_session: return
-        summary = {
-            'start_balance': self.current_session.start_balance, 
-            'total_expense': self.current_session.total_expense,
-            'start_flexi': self.current_session.start_flexi,
-            'total_flexi_additions': self.current_session.total_flexi_additions
-        }
-        dialog = CloseCashDialog(summary, self)
+        if not self.current_session or self.drain_timer.isActive(): return
+        if not self.confirm_session_open(): return
+        # -- إضافة --: لا نغلق الجلسة قبل حفظ كل ما في طابور الكتابة (ننتظره دون حجز الواجهة)
+        if write_queue.pending():
+            self.wait_for_writes(self.close_cash_session, lambda: CustomMessageBox.show_warning(
+                self, "تنبيه", "لا تزال بعض العمليات قيد الحفظ. حاول الإغلاق بعد لحظات."))
+            return
+        # -- تعديل --: الملخص من مجاميع الدفتر الجارية بدل إعادة تحميل الجلسة وجمع عملياتها
+        dialog = CloseCashDialog(self.ledger.summary(), self)
         if dialog.exec() == QDialog.DialogCode.Accepted:
             data = dialog.get_data()
             if data is None:
                 CustomMessageBox.show_warning(self, "خطأ", "الرجاء إدخال قيم صحيحة.")
                 return
             
-            session_to_close = self.current_session
-            session_to_close.end_balance = data["end_balance"]
-            session_to_close.end_flexi = data["end_flexi"]
-            session_to_close.status = 'closed'
-            session_to_close.end_time = datetime.datetime.now(datetime.timezone.utc)
-            try:
-                self.db_session.commit()
-            except Exception:
-                if hasattr(self.db_session, 'rollback'):
-                    self.db_session.rollback()
+            end_time = datetime.datetime.now(datetime.timezone.utc)
             try:
-                if hasattr(self.db_session, 'get'):
-                    session_to_close = self.db_session.get(CashSession, session_to_close.id)
-                elif hasattr(self.db_session, 'get_session_by_id'):
-                    self.current_session = self.db_session.get_session_by_id(session_to_close.id)
-            except Exception:
-                pass
+                with session_scope() as db:
+                    # التقرير والوصل من لقطة الإغلاق المحسوبة من العمليات المحفوظة
+                    closed_session = close_session(db, self.current_session.id, data["end_balance"], data["end_flexi"], end_time)
+            except Exception as e:
+                CustomMessageBox.show_critical(self, "خطأ", "حدث خطأ عند إغلاق الجلسة. حاول مرة أخرى.")
+                print("خطأ عند إغلاق الجلسة:", e)
+                return
+            if closed_session is None: # أغلقها المشرف أثناء الجرد
+                self.confirm_session_open()
+                return
 
-            report_dialog = ClosingReportDialog(session_to_close, self)
+            receipt_printer.print_closing(self.user.username, closed_session)
+            report_dialog = ClosingReportDialog(closed_session, self)
             report_dialog.exec()
             
             self.current_session = None
+            self.ledger = None
             self.load_user_sessions_history()
             self.update_ui_for_session_status()
 
+    @ui_action("حفظ الملاحظات")
     def save_session_notes(self):
         if not self.sessions_history_list.currentItem(): return
         session_id_in_list = self.sessions_history_list.currentItem().data(Qt.ItemDataRole.UserRole)
-        session_to_update = self.db_session.get(CashSession, session_id_in_list)
-        if session_to_update and session_to_update.status == 'open':
-            session_to_update.notes = self.notes_editor.toPlainText()
-            self.db_session.commit()
+        with session_scope() as db:
+            session_to_update = db.get(CashSession, session_id_in_list)
+            is_open = session_to_update is not None and session_to_update.status == 'open'
+            if is_open:
+                session_to_update.notes = self.notes_editor.toPlainText()
+        if is_open:
             CustomMessageBox.show_information(self, "نجاح", "تم حفظ الملاحظات بنجاح.")
             self.load_user_sessions_history()
             # Reselect the same row after reloading
@@ -1458,12 +1721,7 @@ class UserDashboard(QMainWindow):
     def load_transactions(self, session):
         self.transactions_table.setRowCount(0)
         if not session: return
-        transactions = getattr(session, 'transactions', None)
-        if not transactions:
-            try:
-                transactions = self.db_session.query(Transaction).filter_by(session_id=session.id).all()
-            except Exception:
-                transactions = []
+        transactions = getattr(session, 'transactions', None) or []
         transactions = [t for t in transactions if getattr(t, 'type', 'expense') == 'expense']
         transactions.sort(key=lambda x: x.timestamp, reverse=True)
         for idx, transaction in enumerate(transactions, start=1):
@@ -1504,12 +1762,13 @@ class UserDashboard(QMainWindow):
                 amount_item.setForeground(QColor("#dc3545"))
             else:
                 amount_item.setForeground(QColor("#198754"))
+            if transaction.id is None:
+                self.mark_pending_row(self.transactions_table, row_position)
                 
     def load_flexi_transactions(self, session):
         self.flexi_transactions_table.setRowCount(0)
         if not session: return
-        transactions = getattr(session, 'flexi_transactions', [])
-        transactions.sort(key=lambda x: x.timestamp, reverse=True)
+        transactions = sorted(getattr(session, 'flexi_transactions', []), key=lambda x: x.timestamp, reverse=True)
         for idx, transaction in enumerate(transactions, start=1):
             row_position = self.flexi_transactions_table.rowCount()
             self.flexi_transactions_table.insertRow(row_position)
@@ -1535,23 +1794,83 @@ class UserDashboard(QMainWindow):
             self.flexi_transactions_table.setItem(row_position, 2, desc_item)
             self.flexi_transactions_table.setItem(row_position, 3, time_item)
             self.flexi_transactions_table.setRowHeight(row_position, 48)
+            if transaction.id is None:
+                self.mark_pending_row(self.flexi_transactions_table, row_position)
+
+    def mark_pending_row(self, table, row):
+        for col in range(table.columnCount()):
+            item = table.item(row, col)
+            if item is None: continue
+            font = item.font(); font.setItalic(True); item.setFont(font)
+            item.setForeground(QColor("#adb5bd"))
+            item.setToolTip("قيد الحفظ...")
 
 
+    @ui_action("تحديث الجلسة الحالية")
+    def reload_current_session(self):
+        """يعيد تحميل الجلسة الحالية كـ DTO جديد بعد أي تعديل."""
+        if not self.current_session: return
+        with session_scope() as db:
+            self.current_session = fetch_session(db, self.current_session.id)
+
     def update_ui_for_session_status(self):
         has_open_session = self.current_session is not None
         self.open_cash_btn.setEnabled(not has_open_session)
         self.add_expense_btn.setEnabled(has_open_session)
         self.add_flexi_btn.setEnabled(has_open_session)
         self.close_cash_btn.setEnabled(has_open_session)
+        self.rapid_entry_bar.setEnabled(has_open_session)
         if not has_open_session:
             self.sessions_history_list.clearSelection()
             self.display_session_details(None)
 
+    def arm_action_profiler(self, count=5):
+        if action_profiler is None: return
+        action_profiler.arm(count)
+        CustomMessageBox.show_information(self, "تسجيل الأداء",
+            f"سيتم تسجيل أداء الإجراءات الـ {count} التالية في مجلد {action_profiler.output_dir}.")
+
+    def wait_for_writes(self, on_drained, on_timeout):
+        """
+        ينتظر تفريغ طابور الكتابة بمؤقت (خيط الواجهة يبقى حرًا) ثم يستدعي on_drained،
+        أو on_timeout بعد WRITE_DRAIN_TIMEOUT_S ثانية.
+        """
+        self.drain_callbacks = (on_drained, on_timeout)
+        self.drain_deadline = time.monotonic() + WRITE_DRAIN_TIMEOUT_S
+        if not self.drain_timer.isActive():
+            self.close_cash_btn.setEnabled(False)
+            self.rapid_entry_bar.setEnabled(False)
+            QApplication.setOverrideCursor(Qt.CursorShape.WaitCursor)
+            self.drain_timer.start()
+        self.poll_write_drain()
+
+    def poll_write_drain(self):
+        pending = len(write_queue.pending())
+        if pending and time.monotonic() < self.drain_deadline:
+            self.rapid_entry_bar.set_draining(pending)
+            return
+        self.drain_timer.stop()
+        QApplication.restoreOverrideCursor()
+        on_drained, on_timeout = self.drain_callbacks
+        self.drain_callbacks = None
+        self.update_ui_for_session_status()
+        self.rapid_entry_bar.set_pending_count(len(self.pending_writes))
+        (on_timeout if pending else on_drained)()
+
+    def finish_close(self):
+        if write_queue.pending():
+            # ما لم يحفظ يبقى في ملف الانتظار ويطبق عند التشغيل التالي
+            print("Write queue not drained on close; pending operations remain spooled.")
+        self.window_closing = True
+        self.close()
+
     def closeEvent(self, event):
-        try:
-            self.db_session.close()
-        except Exception:
-            pass
+        # -- تعديل --: ننتظر الطابور بمؤقت ثم نغلق النافذة بدل حجز الواجهة حتى يفرغ
+        if not self.window_closing and write_queue.pending():
+            event.ignore()
+            self.wait_for_writes(self.finish_close, self.finish_close)
+            return
+        write_queue.remove_listener(*self.write_listener)
         event.accept()
 
 if __name__ == '__main__':
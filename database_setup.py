@@ -1,21 +1,78 @@
 import os
 import bcrypt
 import datetime
-from sqlalchemy import (create_engine, Column, Integer, String, Float, DateTime, 
-                        ForeignKey, Enum, inspect, text, Boolean)
-from sqlalchemy.orm import sessionmaker, relationship, declarative_base
+import zoneinfo
+from sqlalchemy import (create_engine, Column, Integer, String, Float, DateTime, Date,
+                        ForeignKey, Enum, inspect, text, Boolean, UniqueConstraint, Index, event,
+                        select, tuple_)
+from sqlalchemy.orm import sessionmaker, relationship, declarative_base, column_property
 from sqlalchemy.ext.hybrid import hybrid_property
 
 # --- إعدادات أساسية ---
 DB_FILENAME = "cash_register.db"
 DATABASE_URL = f"sqlite:///{DB_FILENAME}"
-CURRENT_DB_VERSION = 4 # الإصدار الحالي لقاعدة البيانات
+CURRENT_DB_VERSION = 14 # الإصدار الحالي لقاعدة البيانات
 
 # --- إعداد SQLAlchemy ---
 engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+
+# -- إضافة --: وضع WAL (يحفظ في ملف القاعدة): القراءة الطويلة مثل النسخ الاحتياطي تعمل على
+# لقطة ثابتة دون أن تحجز الكتابة، والكتابة لا تحجز القراءة
+@event.listens_for(engine, "connect")
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    dbapi_connection.execute("PRAGMA journal_mode=WAL")
+
+# -- إضافة --: محرك قراءة فقط (mode=ro + query_only) بمجمع اتصالات صغير للقراء المتزامنين؛
+# في وضع WAL لا يحجز أي قارئ كتابة الكاشير
+def create_read_engine(db_path=DB_FILENAME, pool_size=4):
+    read_engine = create_engine(f"sqlite:///file:{db_path}?mode=ro&uri=true",
+                                connect_args={"check_same_thread": False},
+                                pool_size=pool_size, max_overflow=0)
+
+    @event.listens_for(read_engine, "connect")
+    def _set_read_only(dbapi_connection, connection_record):
+        dbapi_connection.execute("PRAGMA query_only=ON")
+    return read_engine
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+# -- إضافة --: اليوم التجاري. start_time مخزن بتوقيت UTC، والتقارير تفلتر بأيام المحل المحلية:
+#   CASH_TIMEZONE        المنطقة الزمنية للمحل (مثل Africa/Algiers؛ افتراضيًا توقيت الجهاز)
+#   CASH_DAY_START_HOUR  ساعة بداية اليوم التجاري (افتراضيًا 0؛ مثلًا 4 لمحل يعمل بعد منتصف الليل،
+#                        فجلسة تفتح 01:30 تحسب على اليوم السابق)
+# القيمة تحسب عند إدراج الجلسة وتخزن في business_day؛ تغيير الإعداد لاحقًا يتطلب backfill_business_days.
+BUSINESS_TIMEZONE = os.environ.get("CASH_TIMEZONE", "")
+DAY_START_HOUR = int(os.environ.get("CASH_DAY_START_HOUR", "0"))
+
+def _business_tz(name):
+    if not name:
+        return None
+    try:
+        return zoneinfo.ZoneInfo(name)
+    except (KeyError, ValueError) as e: # ZoneInfoNotFoundError أو اسم غير صالح
+        print(f"Unknown CASH_TIMEZONE {name!r} ({e}), using the system timezone")
+        return None
+
+_BUSINESS_TZ = _business_tz(BUSINESS_TIMEZONE)
+
+def business_day(moment):
+    """
+    اليوم التجاري المحلي للحظة (بدون منطقة زمنية = UTC كما يخزنها التطبيق).
+    """
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=datetime.timezone.utc)
+    local = moment.astimezone(_BUSINESS_TZ) # None = توقيت الجهاز
+    return (local - datetime.timedelta(hours=DAY_START_HOUR)).date()
+
+def business_today():
+    return business_day(datetime.datetime.now(datetime.timezone.utc))
+
+def _session_business_day(context):
+    # قيمة افتراضية للإدراج (ORM أو Core) محسوبة من start_time في نفس الصف
+    start_time = context.get_current_parameters().get("start_time")
+    return business_day(start_time) if start_time is not None else None
+
 # --- نماذج قاعدة البيانات ---
 class User(Base):
     __tablename__ = 'users'
@@ -36,8 +93,9 @@ class User(Base):
 class CashSession(Base):
     __tablename__ = 'cash_sessions'
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey('users.id'))
+    user_id = Column(Integer, ForeignKey('users.id'), index=True)
     start_time = Column(DateTime, default=lambda: datetime.datetime.now(datetime.timezone.utc))
+    business_day = Column(Date, default=_session_business_day)
     end_time = Column(DateTime, nullable=True)
     start_balance = Column(Float, nullable=False)
     end_balance = Column(Float, nullable=True)
@@ -52,6 +110,12 @@ class CashSession(Base):
     transactions = relationship("Transaction", back_populates="session", cascade="all, delete-orphan")
     flexi_transactions = relationship("FlexiTransaction", back_populates="session", cascade="all, delete-orphan")
 
+    # جلسات العامل مرتبة بـ (start_time, id) دون فرز (سجل الكاشير)،
+    # وصفحات ملف العامل لشهر بالمفتاح (business_day, start_time, id): الفهرس يخدم الشرط والترتيب
+    __table_args__ = (Index('ix_cash_sessions_user_start', 'user_id', 'start_time', 'id'),
+                      Index('ix_cash_sessions_business_day', 'business_day'),
+                      Index('ix_cash_sessions_user_day_start', 'user_id', 'business_day', 'start_time', 'id'))
+
     @hybrid_property
     def total_expense(self):
         return sum(t.amount for t in self.transactions if t.type == 'expense')
@@ -90,13 +154,26 @@ class CashSession(Base):
     def net_profit(self):
         return self.gross_income - self.total_expense
 
+# -- إضافة --: الأوصاف المستعملة، كل نص مرة واحدة لكل نوع (expense/income/flexi) مع عدد
+# مرات استعماله؛ العمليات تشير إليه بـ description_id، ويغذي الإكمال التلقائي (description_index)
+class Description(Base):
+    __tablename__ = 'descriptions'
+    __table_args__ = (UniqueConstraint('kind', 'text'),)
+    id = Column(Integer, primary_key=True)
+    kind = Column(String, nullable=False)
+    text = Column(String, nullable=False)
+    usage_count = Column(Integer, nullable=False, default=0)
+
 class Transaction(Base):
     __tablename__ = 'transactions'
     id = Column(Integer, primary_key=True, index=True)
-    session_id = Column(Integer, ForeignKey('cash_sessions.id'))
+    session_id = Column(Integer, ForeignKey('cash_sessions.id'), index=True)
     type = Column(Enum('income', 'expense', name='transaction_types'), nullable=False)
     amount = Column(Float, nullable=False)
-    description = Column(String)
+    # -- تعديل --: النص مخزن مرة واحدة في descriptions؛ description يقرأ في نفس الاستعلام
+    # (للقراءة فقط، الكتابة بـ intern_descriptions)
+    description_id = Column(Integer, ForeignKey('descriptions.id'), nullable=True)
+    description = column_property(select(Description.text).where(Description.id == description_id).scalar_subquery())
     timestamp = Column(DateTime, default=lambda: datetime.datetime.now(datetime.timezone.utc))
     
     session = relationship("CashSession", back_populates="transactions")
@@ -104,10 +181,11 @@ class Transaction(Base):
 class FlexiTransaction(Base):
     __tablename__ = 'flexi_transactions'
     id = Column(Integer, primary_key=True, index=True)
-    session_id = Column(Integer, ForeignKey('cash_sessions.id'))
+    session_id = Column(Integer, ForeignKey('cash_sessions.id'), index=True)
     user_id = Column(Integer, ForeignKey('users.id'))
     amount = Column(Float, nullable=False)
-    description = Column(String, nullable=True)
+    description_id = Column(Integer, ForeignKey('descriptions.id'), nullable=True)
+    description = column_property(select(Description.text).where(Description.id == description_id).scalar_subquery())
     timestamp = Column(DateTime, default=lambda: datetime.datetime.now(datetime.timezone.utc))
     # -- إضافة --: عمود جديد لتتبع حالة الدفع
     is_paid = Column(Boolean, default=False)
@@ -115,10 +193,400 @@ class FlexiTransaction(Base):
     session = relationship("CashSession", back_populates="flexi_transactions")
     user = relationship("User", back_populates="flexi_transactions")
 
+# -- إضافة --: معرفات عمليات طابور الكتابة المطبقة، تكتب في نفس معاملة الإدراج
+# حتى لا تتكرر العمليات عند إعادة تشغيل ملف الانتظار بعد انقطاع مفاجئ
+class AppliedWrite(Base):
+    __tablename__ = 'write_queue_applied'
+    op_id = Column(String, primary_key=True)
+
+# -- إضافة --: لقطة أرقام الجلسة عند إغلاقها، لا تعدل ولا تحذف (إلا مع حذف الجلسة)؛
+# تعديل جلسة مغلقة لاحقًا يضيف مراجعة جديدة (revision) والتقارير تقرأ آخر مراجعة
+class SessionClosing(Base):
+    __tablename__ = 'session_closings'
+    __table_args__ = (UniqueConstraint('session_id', 'revision'),)
+    id = Column(Integer, primary_key=True)
+    session_id = Column(Integer, ForeignKey('cash_sessions.id'), nullable=False)
+    revision = Column(Integer, nullable=False, default=1)
+    created_at = Column(DateTime, default=lambda: datetime.datetime.now(datetime.timezone.utc))
+    start_balance = Column(Float, nullable=False, default=0.0)
+    end_balance = Column(Float, nullable=True)
+    start_flexi = Column(Float, nullable=True)
+    end_flexi = Column(Float, nullable=True)
+    total_expense = Column(Float, nullable=False, default=0.0)
+    total_flexi_paid = Column(Float, nullable=False, default=0.0)
+    total_flexi_additions = Column(Float, nullable=False, default=0.0)
+    transaction_count = Column(Integer, nullable=False, default=0)
+    flexi_count = Column(Integer, nullable=False, default=0)
+
+# --- فهرس البحث النصي (FTS5) ---
+# كل سجل في الفهرس يحمل rowid مشتقًا من المصدر: id * 4 + نوع المصدر
+# (1 = مصروف/دخل، 2 = فليكسي، 3 = ملاحظات الجلسة) حتى تحذف المشغلات بالـ rowid مباشرة.
+SEARCH_KIND_TRANSACTION = 1
+SEARCH_KIND_FLEXI = 2
+SEARCH_KIND_NOTES = 3
+
+SEARCH_INDEX_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(
+        body, kind UNINDEXED, session_id UNINDEXED,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+    """,
+    # transactions
+    """
+    CREATE TRIGGER IF NOT EXISTS search_transactions_ai AFTER INSERT ON transactions BEGIN
+        INSERT INTO search_index (rowid, body, kind, session_id)
+        SELECT new.id * 4 + 1, d.text, new.type, new.session_id FROM descriptions d WHERE d.id = new.description_id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS search_transactions_ad AFTER DELETE ON transactions BEGIN
+        DELETE FROM search_index WHERE rowid = old.id * 4 + 1;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS search_transactions_au AFTER UPDATE OF description_id, type, session_id ON transactions BEGIN
+        DELETE FROM search_index WHERE rowid = old.id * 4 + 1;
+        INSERT INTO search_index (rowid, body, kind, session_id)
+        SELECT new.id * 4 + 1, d.text, new.type, new.session_id FROM descriptions d WHERE d.id = new.description_id;
+    END
+    """,
+    # flexi_transactions
+    """
+    CREATE TRIGGER IF NOT EXISTS search_flexi_ai AFTER INSERT ON flexi_transactions BEGIN
+        INSERT INTO search_index (rowid, body, kind, session_id)
+        SELECT new.id * 4 + 2, d.text, 'flexi', new.session_id FROM descriptions d WHERE d.id = new.description_id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS search_flexi_ad AFTER DELETE ON flexi_transactions BEGIN
+        DELETE FROM search_index WHERE rowid = old.id * 4 + 2;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS search_flexi_au AFTER UPDATE OF description_id, session_id ON flexi_transactions BEGIN
+        DELETE FROM search_index WHERE rowid = old.id * 4 + 2;
+        INSERT INTO search_index (rowid, body, kind, session_id)
+        SELECT new.id * 4 + 2, d.text, 'flexi', new.session_id FROM descriptions d WHERE d.id = new.description_id;
+    END
+    """,
+    # cash_sessions.notes
+    """
+    CREATE TRIGGER IF NOT EXISTS search_notes_ai AFTER INSERT ON cash_sessions BEGIN
+        INSERT INTO search_index (rowid, body, kind, session_id)
+        SELECT new.id * 4 + 3, new.notes, 'notes', new.id
+        WHERE coalesce(new.notes, '') != '';
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS search_notes_ad AFTER DELETE ON cash_sessions BEGIN
+        DELETE FROM search_index WHERE rowid = old.id * 4 + 3;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS search_notes_au AFTER UPDATE OF notes ON cash_sessions BEGIN
+        DELETE FROM search_index WHERE rowid = old.id * 4 + 3;
+        INSERT INTO search_index (rowid, body, kind, session_id)
+        SELECT new.id * 4 + 3, new.notes, 'notes', new.id
+        WHERE coalesce(new.notes, '') != '';
+    END
+    """,
+]
+
+SEARCH_INSERT_TRIGGERS = ["search_transactions_ai", "search_flexi_ai", "search_notes_ai"]
+
+def create_search_index(connection, backfill=False):
+    """
+    ينشئ جدول FTS5 والمشغلات التي تحافظ عليه، مع تعبئة اختيارية من البيانات الحالية.
+    """
+    for statement in SEARCH_INDEX_DDL:
+        connection.execute(text(statement))
+    if backfill:
+        connection.execute(text("DELETE FROM search_index"))
+        index_search_rows(connection)
+
+def index_search_rows(connection, transactions_after=0, flexi_after=0, sessions_after=0):
+    """
+    يفهرس دفعة واحدة الصفوف ذات المعرف الأكبر من الحدود المعطاة (يستعمل عند الاستيراد الكبير
+    بعد تعطيل مشغلات الإدراج).
+    """
+    connection.execute(text("""
+        INSERT INTO search_index (rowid, body, kind, session_id)
+        SELECT t.id * 4 + 1, d.text, t.type, t.session_id
+        FROM transactions t JOIN descriptions d ON d.id = t.description_id
+        WHERE t.id > :after
+    """), {"after": transactions_after})
+    connection.execute(text("""
+        INSERT INTO search_index (rowid, body, kind, session_id)
+        SELECT f.id * 4 + 2, d.text, 'flexi', f.session_id
+        FROM flexi_transactions f JOIN descriptions d ON d.id = f.description_id
+        WHERE f.id > :after
+    """), {"after": flexi_after})
+    connection.execute(text("""
+        INSERT INTO search_index (rowid, body, kind, session_id)
+        SELECT id * 4 + 3, notes, 'notes', id FROM cash_sessions
+        WHERE id > :after AND coalesce(notes, '') != ''
+    """), {"after": sessions_after})
+
+# --- جدول الأوصاف ---
+# كل مسار كتابة (طابور الكتابة، الاستيراد، تعديل العملية) يحصل على description_id من
+# intern_descriptions قبل الإدراج؛ المشغلات تحدث عدد الاستعمال فقط (جملة على المفتاح الأساسي)
+# ولا تكتب في الصف المدرج نفسه
+DESCRIPTION_TABLE_DDL = """
+    CREATE TABLE IF NOT EXISTS descriptions (
+        id INTEGER NOT NULL PRIMARY KEY,
+        kind VARCHAR NOT NULL,
+        text VARCHAR NOT NULL,
+        usage_count INTEGER NOT NULL DEFAULT 0,
+        UNIQUE (kind, text)
+    )
+    """
+
+_DESCRIPTION_ACQUIRE = """
+        UPDATE descriptions SET usage_count = usage_count + 1 WHERE id = new.description_id;"""
+
+_DESCRIPTION_RELEASE = """
+        UPDATE descriptions SET usage_count = usage_count - 1 WHERE id = old.description_id;
+        DELETE FROM descriptions WHERE id = old.description_id AND usage_count <= 0;"""
+
+def _description_triggers(name, table):
+    return [
+        f"""
+    CREATE TRIGGER IF NOT EXISTS descriptions_{name}_ai AFTER INSERT ON {table}
+    WHEN new.description_id IS NOT NULL BEGIN{_DESCRIPTION_ACQUIRE}
+    END
+    """,
+        f"""
+    CREATE TRIGGER IF NOT EXISTS descriptions_{name}_ad AFTER DELETE ON {table}
+    WHEN old.description_id IS NOT NULL BEGIN{_DESCRIPTION_RELEASE}
+    END
+    """,
+        f"""
+    CREATE TRIGGER IF NOT EXISTS descriptions_{name}_au AFTER UPDATE OF description_id ON {table}
+    WHEN old.description_id IS NOT new.description_id BEGIN{_DESCRIPTION_RELEASE}{_DESCRIPTION_ACQUIRE}
+    END
+    """,
+    ]
+
+DESCRIPTION_INDEX_DDL = [
+    DESCRIPTION_TABLE_DDL,
+    *_description_triggers("transactions", "transactions"),
+    *_description_triggers("flexi", "flexi_transactions"),
+]
+
+DESCRIPTION_INSERT_TRIGGERS = ["descriptions_transactions_ai", "descriptions_flexi_ai"]
+
+# حد أزواج (kind, text) في استعلام واحد (حد معاملات SQLite القديم 999)
+_INTERN_CHUNK = 400
+
+def intern_descriptions(connection, pairs):
+    """
+    يعيد {(kind, text): id} للأوصاف غير الفارغة المعطاة، ويضيف غير الموجود منها إلى descriptions
+    (بعدد استعمال 0، فالمشغلات أو index_descriptions تعده عند إدراج العمليات).
+    """
+    pairs = list({(kind, value) for kind, value in pairs if value})
+    if not pairs:
+        return {}
+    connection.execute(text("""
+        INSERT INTO descriptions (kind, text, usage_count) VALUES (:kind, :text, 0)
+        ON CONFLICT (kind, text) DO NOTHING
+    """), [{"kind": kind, "text": value} for kind, value in pairs])
+    ids = {}
+    for start in range(0, len(pairs), _INTERN_CHUNK):
+        rows = connection.execute(select(Description.id, Description.kind, Description.text)
+                                  .where(tuple_(Description.kind, Description.text).in_(pairs[start:start + _INTERN_CHUNK])))
+        ids.update(((kind, value), description_id) for description_id, kind, value in rows)
+    return ids
+
+def intern_description(connection, kind, value):
+    return intern_descriptions(connection, [(kind, value)]).get((kind, value))
+
+def create_description_index(connection, backfill=False):
+    """
+    ينشئ جدول الأوصاف ومشغلاته، مع إعادة عد اختيارية لاستعمال كل وصف من العمليات الحالية.
+    """
+    for statement in DESCRIPTION_INDEX_DDL:
+        connection.execute(text(statement))
+    if backfill:
+        connection.execute(text("UPDATE descriptions SET usage_count = 0"))
+        index_descriptions(connection)
+        connection.execute(text("DELETE FROM descriptions WHERE usage_count <= 0"))
+
+def index_descriptions(connection, transactions_after=0, flexi_after=0):
+    """
+    يضيف دفعة واحدة استعمال الصفوف ذات المعرف الأكبر من الحدود المعطاة إلى عدد كل وصف
+    (للاستيراد الكبير بعد تعطيل مشغلات الإدراج، وللتعبئة الأولى).
+    """
+    for table, after in (("transactions", transactions_after), ("flexi_transactions", flexi_after)):
+        counts = connection.execute(text(f"""
+            SELECT description_id, COUNT(*) FROM {table}
+            WHERE id > :after AND description_id IS NOT NULL GROUP BY description_id
+        """), {"after": after}).all()
+        if counts:
+            connection.execute(text("UPDATE descriptions SET usage_count = usage_count + :count WHERE id = :id"),
+                               [{"id": description_id, "count": count} for description_id, count in counts])
+
+def _rebuild_with_description_ids(connection):
+    """
+    يحول عمود النص description في العمليات إلى description_id (ترحيل v14). SQLite لا يحذف
+    عمودًا من جدول بقيد FOREIGN KEY، فيعاد بناء الجدولين: إعادة تسمية، إنشاء من النموذج، نسخ، حذف.
+    المشغلات كلها تحذف قبل إعادة التسمية (SQLite يعيد كتابة مراجع الجدول فيها) وتنشأ بعدها.
+    """
+    triggers = connection.execute(text("SELECT name FROM sqlite_master WHERE type = 'trigger'")).scalars().all()
+    for trigger in triggers:
+        connection.execute(text(f"DROP TRIGGER IF EXISTS {trigger}"))
+    connection.execute(text(DESCRIPTION_TABLE_DDL))
+    for model, kind in ((Transaction, "o.type"), (FlexiTransaction, "'flexi'")):
+        table = model.__tablename__
+        legacy = f"{table}_v13"
+        connection.execute(text(f"""
+            INSERT INTO descriptions (kind, text, usage_count)
+            SELECT DISTINCT {kind}, o.description, 0 FROM {table} o WHERE coalesce(o.description, '') != ''
+            ON CONFLICT (kind, text) DO NOTHING
+        """))
+        connection.execute(text(f"ALTER TABLE {table} RENAME TO {legacy}"))
+        indexes = connection.execute(text("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = :table "
+                                          "AND sql IS NOT NULL"), {"table": legacy}).scalars().all()
+        for index in indexes:
+            connection.execute(text(f"DROP INDEX {index}"))
+        model.__table__.create(connection)
+        columns = [c.name for c in model.__table__.columns if c.name != "description_id"]
+        connection.execute(text(f"""
+            INSERT INTO {table} ({", ".join(columns)}, description_id)
+            SELECT {", ".join("o." + c for c in columns)},
+                (SELECT d.id FROM descriptions d WHERE d.kind = {kind} AND d.text = o.description)
+            FROM {legacy} o
+        """))
+        connection.execute(text(f"DROP TABLE {legacy}"))
+    create_search_index(connection, backfill=True)
+    create_description_index(connection, backfill=True)
+    create_closing_snapshots(connection)
+
+# --- لقطات إغلاق الجلسات ---
+# مراجعة جديدة محسوبة من العمليات لكل جلسة مغلقة تحقق الشرط (تستعمل عند الإغلاق وعند تعديل
+# جلسة مغلقة، وللتعبئة الأولى وبعد الاستيراد)
+_CLOSING_SNAPSHOT_INSERT = """
+    INSERT INTO session_closings (session_id, revision, created_at, start_balance, end_balance,
+        start_flexi, end_flexi, total_expense, total_flexi_paid, total_flexi_additions,
+        transaction_count, flexi_count)
+    SELECT s.id,
+        coalesce((SELECT max(c.revision) FROM session_closings c WHERE c.session_id = s.id), 0) + 1,
+        CURRENT_TIMESTAMP, s.start_balance, s.end_balance, s.start_flexi, s.end_flexi,
+        (SELECT coalesce(sum(t.amount), 0.0) FROM transactions t WHERE t.session_id = s.id AND t.type = 'expense'),
+        (SELECT coalesce(sum(f.amount), 0.0) FROM flexi_transactions f WHERE f.session_id = s.id AND f.is_paid),
+        (SELECT coalesce(sum(f.amount), 0.0) FROM flexi_transactions f WHERE f.session_id = s.id),
+        (SELECT count(*) FROM transactions t WHERE t.session_id = s.id),
+        (SELECT count(*) FROM flexi_transactions f WHERE f.session_id = s.id)
+    FROM cash_sessions s
+    WHERE s.status = 'closed' AND ({condition});"""
+
+def _closing_triggers(table, columns):
+    # أي تغيير في عمليات جلسة مغلقة يضيف مراجعة جديدة لها
+    return [
+        f"""
+    CREATE TRIGGER IF NOT EXISTS session_closings_{table}_ai AFTER INSERT ON {table} BEGIN
+        {_CLOSING_SNAPSHOT_INSERT.format(condition="s.id = new.session_id")}
+    END
+    """,
+        f"""
+    CREATE TRIGGER IF NOT EXISTS session_closings_{table}_ad AFTER DELETE ON {table} BEGIN
+        {_CLOSING_SNAPSHOT_INSERT.format(condition="s.id = old.session_id")}
+    END
+    """,
+        f"""
+    CREATE TRIGGER IF NOT EXISTS session_closings_{table}_au AFTER UPDATE OF {columns} ON {table} BEGIN
+        {_CLOSING_SNAPSHOT_INSERT.format(condition="s.id IN (old.session_id, new.session_id)")}
+    END
+    """,
+    ]
+
+CLOSING_SNAPSHOT_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS session_closings (
+        id INTEGER NOT NULL PRIMARY KEY,
+        session_id INTEGER NOT NULL REFERENCES cash_sessions(id),
+        revision INTEGER NOT NULL,
+        created_at DATETIME,
+        start_balance FLOAT NOT NULL,
+        end_balance FLOAT,
+        start_flexi FLOAT,
+        end_flexi FLOAT,
+        total_expense FLOAT NOT NULL,
+        total_flexi_paid FLOAT NOT NULL,
+        total_flexi_additions FLOAT NOT NULL,
+        transaction_count INTEGER NOT NULL,
+        flexi_count INTEGER NOT NULL,
+        UNIQUE (session_id, revision)
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS session_closings_bu BEFORE UPDATE ON session_closings BEGIN
+        SELECT RAISE(ABORT, 'session_closings is append-only');
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS session_closings_bd BEFORE DELETE ON session_closings
+    WHEN EXISTS (SELECT 1 FROM cash_sessions WHERE id = old.session_id) BEGIN
+        SELECT RAISE(ABORT, 'session_closings is append-only');
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS session_closings_sessions_ad AFTER DELETE ON cash_sessions BEGIN
+        DELETE FROM session_closings WHERE session_id = old.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS session_closings_sessions_au
+    AFTER UPDATE OF status, start_balance, end_balance, start_flexi, end_flexi ON cash_sessions
+    WHEN new.status = 'closed' BEGIN
+        {_CLOSING_SNAPSHOT_INSERT.format(condition="s.id = new.id")}
+    END
+    """,
+    *_closing_triggers("transactions", "amount, type, session_id"),
+    *_closing_triggers("flexi_transactions", "amount, is_paid, session_id"),
+]
+CLOSING_INSERT_TRIGGERS = ["session_closings_transactions_ai", "session_closings_flexi_transactions_ai"]
+
+def create_closing_snapshots(connection, backfill=False):
+    """
+    ينشئ جدول لقطات الإغلاق ومشغلاته، مع لقطة أولى اختيارية لكل جلسة مغلقة بدون لقطة.
+    """
+    for statement in CLOSING_SNAPSHOT_DDL:
+        connection.execute(text(statement))
+    if backfill:
+        connection.execute(text(_CLOSING_SNAPSHOT_INSERT.format(
+            condition="NOT EXISTS (SELECT 1 FROM session_closings c WHERE c.session_id = s.id)")))
+
+def snapshot_closed_sessions(connection, sessions_after=0, transactions_after=0, flexi_after=0):
+    """
+    يضيف مراجعة للجلسات المغلقة الجديدة أو التي أضيفت لها عمليات بعد الحدود المعطاة
+    (للاستيراد الكبير بعد تعطيل مشغلات الإدراج).
+    """
+    connection.execute(text(_CLOSING_SNAPSHOT_INSERT.format(condition="""s.id > :sessions_after
+        OR s.id IN (SELECT session_id FROM transactions WHERE id > :transactions_after)
+        OR s.id IN (SELECT session_id FROM flexi_transactions WHERE id > :flexi_after)""")),
+        {"sessions_after": sessions_after, "transactions_after": transactions_after, "flexi_after": flexi_after})
+
+def backfill_business_days(connection, only_missing=False):
+    """
+    يحسب business_day لكل الجلسات (أو الفارغة فقط) بالإعداد الحالي للمنطقة الزمنية وساعة البداية.
+    """
+    where = " WHERE business_day IS NULL" if only_missing else ""
+    rows = connection.execute(text(f"SELECT id, start_time FROM cash_sessions{where}")).all()
+    updates = [{"id": session_id, "day": business_day(datetime.datetime.fromisoformat(start_time)).isoformat()}
+               for session_id, start_time in rows if start_time]
+    if updates:
+        connection.execute(text("UPDATE cash_sessions SET business_day = :day WHERE id = :id"), updates)
+    return len(updates)
+
 # --- دوال إدارة قاعدة البيانات ---
 def init_db():
     print("Initializing database...")
     Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        create_search_index(connection)
+        create_description_index(connection)
+        create_closing_snapshots(connection)
     db = SessionLocal()
     
     # Create and populate db_version table
@@ -155,7 +623,7 @@ def get_db_version(engine):
     
     try:
         with engine.connect() as connection:
-            result = connection.execute(text("SELECT version FROM db_version LIMIT 1"))
+            result = connection.execute(text("SELECT MAX(version) FROM db_version"))
             version = result.scalar_one_or_none()
             return version if version is not None else 1
     except Exception:
@@ -224,6 +692,96 @@ def run_migrations(engine):
                 connection.execute(text("INSERT OR REPLACE INTO db_version (version) VALUES (4)"))
                 current_version = 4
                 print("Migration to v4 successful.")
+
+            # -- إضافة --: الترحيل من v4 إلى v5 (فهرس البحث النصي FTS5؛ مشغلاته وتعبئته في v14
+            # بعد تحويل الأوصاف إلى description_id)
+            if current_version < 5:
+                print("Running migration to version 5...")
+                connection.execute(text(SEARCH_INDEX_DDL[0]))
+                connection.execute(text("INSERT OR REPLACE INTO db_version (version) VALUES (5)"))
+                current_version = 5
+                print("Migration to v5 successful.")
+
+            # -- إضافة --: الترحيل من v5 إلى v6 (فهارس المفاتيح الأجنبية لاستعلامات التجميع)
+            if current_version < 6:
+                print("Running migration to version 6...")
+                connection.execute(text("CREATE INDEX IF NOT EXISTS ix_transactions_session_id ON transactions (session_id)"))
+                connection.execute(text("CREATE INDEX IF NOT EXISTS ix_flexi_transactions_session_id ON flexi_transactions (session_id)"))
+                connection.execute(text("CREATE INDEX IF NOT EXISTS ix_cash_sessions_user_id ON cash_sessions (user_id)"))
+                connection.execute(text("INSERT OR REPLACE INTO db_version (version) VALUES (6)"))
+                current_version = 6
+                print("Migration to v6 successful.")
+
+            # -- إضافة --: الترحيل من v6 إلى v7 (جدول عمليات طابور الكتابة المطبقة)
+            if current_version < 7:
+                print("Running migration to version 7...")
+                connection.execute(text("CREATE TABLE IF NOT EXISTS write_queue_applied (op_id VARCHAR NOT NULL PRIMARY KEY)"))
+                connection.execute(text("INSERT OR REPLACE INTO db_version (version) VALUES (7)"))
+                current_version = 7
+                print("Migration to v7 successful.")
+
+            # -- إضافة --: الترحيل من v7 إلى v8 (جدول الأوصاف؛ تعبئته ومشغلاته في v14)
+            if current_version < 8:
+                print("Running migration to version 8...")
+                connection.execute(text(DESCRIPTION_TABLE_DDL))
+                connection.execute(text("INSERT OR REPLACE INTO db_version (version) VALUES (8)"))
+                current_version = 8
+                print("Migration to v8 successful.")
+
+            # -- إضافة --: الترحيل من v8 إلى v9 (لقطات إغلاق الجلسات)
+            if current_version < 9:
+                print("Running migration to version 9...")
+                create_closing_snapshots(connection, backfill=True)
+                connection.execute(text("INSERT OR REPLACE INTO db_version (version) VALUES (9)"))
+                current_version = 9
+                print("Migration to v9 successful.")
+
+            # -- إضافة --: الترحيل من v9 إلى v10 (فهرس صفحات جلسات العامل)
+            if current_version < 10:
+                print("Running migration to version 10...")
+                connection.execute(text("CREATE INDEX IF NOT EXISTS ix_cash_sessions_user_start ON cash_sessions (user_id, start_time, id)"))
+                connection.execute(text("INSERT OR REPLACE INTO db_version (version) VALUES (10)"))
+                current_version = 10
+                print("Migration to v10 successful.")
+
+            # -- إضافة --: الترحيل من v10 إلى v11 (عمود اليوم التجاري المفهرس)
+            if current_version < 11:
+                print("Running migration to version 11...")
+                columns = [c['name'] for c in inspector.get_columns('cash_sessions')]
+                if 'business_day' not in columns:
+                    connection.execute(text("ALTER TABLE cash_sessions ADD COLUMN business_day DATE"))
+                backfill_business_days(connection)
+                connection.execute(text("CREATE INDEX IF NOT EXISTS ix_cash_sessions_business_day ON cash_sessions (business_day)"))
+                connection.execute(text("CREATE INDEX IF NOT EXISTS ix_cash_sessions_user_day ON cash_sessions (user_id, business_day)"))
+                connection.execute(text("INSERT OR REPLACE INTO db_version (version) VALUES (11)"))
+                current_version = 11
+                print("Migration to v11 successful.")
+
+            # -- إضافة --: الترحيل من v11 إلى v12 (فهرس صفحات ملف العامل بالشهر، يغني عن (user_id, business_day))
+            if current_version < 12:
+                print("Running migration to version 12...")
+                connection.execute(text("CREATE INDEX IF NOT EXISTS ix_cash_sessions_user_day_start "
+                                        "ON cash_sessions (user_id, business_day, start_time, id)"))
+                connection.execute(text("DROP INDEX IF EXISTS ix_cash_sessions_user_day"))
+                connection.execute(text("INSERT OR REPLACE INTO db_version (version) VALUES (12)"))
+                current_version = 12
+                print("Migration to v12 successful.")
+
+            # -- إضافة --: الترحيل من v12 إلى v13 (كان يعيد إنشاء مشغلات الأوصاف؛ يحل محله v14)
+            if current_version < 13:
+                print("Running migration to version 13...")
+                connection.execute(text("INSERT OR REPLACE INTO db_version (version) VALUES (13)"))
+                current_version = 13
+                print("Migration to v13 successful.")
+
+            # -- إضافة --: الترحيل من v13 إلى v14 (العمليات تشير إلى descriptions بـ description_id
+            # بدل تخزين النص في كل صف؛ يعاد بناء الجدولين ومعه عمود description_id القديم من v8)
+            if current_version < 14:
+                print("Running migration to version 14...")
+                _rebuild_with_description_ids(connection)
+                connection.execute(text("INSERT OR REPLACE INTO db_version (version) VALUES (14)"))
+                current_version = 14
+                print("Migration to v14 successful.")
                 
             trans.commit()
             message = "تم تحديث قاعدة البيانات بنجاح!"
@@ -0,0 +1,114 @@
+"""
+فهرس بادئات للأوصاف في الذاكرة يغذي الإكمال التلقائي.
+
+يحمل جدول descriptions مرة واحدة (load)، ويحفظ لكل نوع قائمة مرتبة بالنص المطبع
+(casefold)؛ البحث عن بادئة هو نطاق bisect في القائمة ثم أكثر الأوصاف استعمالًا منه
+(heapq.nsmallest بالترتيب: الاستعمال تنازليًا ثم النص). نطاق البادئات القصيرة (حتى SHORT_PREFIX
+حرفًا) قد يشمل معظم الأوصاف، فتحفظ أفضل نتائجها وتحدث مع كل استعمال بدل إعادة ترتيب النطاق؛
+فيبقى البحث أقل من مللي ثانية حتى مع عشرات الآلاف من الأوصاف.
+record_use() يحدث الفهرس تدريجيًا عند كل إدخال دون إعادة التحميل من القاعدة.
+"""
+import bisect
+import heapq
+import itertools
+import threading
+
+from sqlalchemy import select
+
+from database_setup import Description
+
+DEFAULT_LIMIT = 10
+SHORT_PREFIX = 2
+
+
+def _fold(value):
+    return " ".join(value.split()).casefold()
+
+
+def _short_prefix_tops(kind, entries, usage):
+    # أفضل المدخلات لكل بادئة حتى SHORT_PREFIX حرفًا في مرور واحد: مجموعات البادئة الأطول
+    # (متجاورة في القائمة المرتبة) ثم دمج نتائجها للبادئة الأقصر
+    def rank(entry):
+        return (-usage[(kind, entry[1])],) + entry
+    level = {prefix: heapq.nsmallest(DEFAULT_LIMIT, group, key=rank)
+             for prefix, group in itertools.groupby(entries, key=lambda entry: entry[0][:SHORT_PREFIX])}
+    tops = {}
+    for length in range(SHORT_PREFIX, -1, -1):
+        tops.update(((kind, prefix), best) for prefix, best in level.items() if len(prefix) == length)
+        merged = {}
+        for prefix, best in level.items():
+            merged.setdefault(prefix[:length - 1] if length else prefix, []).extend(best)
+        level = {prefix: heapq.nsmallest(DEFAULT_LIMIT, found, key=rank) for prefix, found in merged.items()}
+    return tops
+
+
+class DescriptionIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._keys = {}  # النوع -> قائمة مرتبة من (النص المطبع، النص)
+        self._usage = {} # (النوع، النص) -> عدد الاستعمال
+        self._top = {}   # (النوع، بادئة قصيرة مطبعة) -> أفضل DEFAULT_LIMIT مدخلًا مرتبة
+        self.loaded = False
+
+    def load(self, db):
+        rows = db.execute(select(Description.kind, Description.text, Description.usage_count)
+                          .where(Description.usage_count > 0)).all()
+        keys, usage = {}, {}
+        for kind, text, count in rows:
+            keys.setdefault(kind, []).append((_fold(text), text))
+            usage[(kind, text)] = count
+        top = {}
+        for kind, entries in keys.items():
+            entries.sort()
+            top.update(_short_prefix_tops(kind, entries, usage))
+        with self._lock:
+            self._keys, self._usage, self._top = keys, usage, top
+            self.loaded = True
+
+    def _rank(self, kind, entry):
+        return (-self._usage[(kind, entry[1])],) + entry
+
+    def record_use(self, kind, text):
+        text = (text or "").strip()
+        if not text:
+            return
+        entry = (_fold(text), text)
+        with self._lock:
+            count = self._usage.get((kind, text))
+            if count is None:
+                bisect.insort(self._keys.setdefault(kind, []), entry)
+                count = 0
+            self._usage[(kind, text)] = count + 1
+            # الاستعمال زاد لهذا المدخل وحده، فيكفي تقديمه في نتائج بادئاته القصيرة المحفوظة
+            for length in range(min(len(entry[0]), SHORT_PREFIX) + 1):
+                top = self._top.get((kind, entry[0][:length]))
+                if top is None:
+                    continue
+                if entry not in top:
+                    if len(top) >= DEFAULT_LIMIT and self._rank(kind, entry) >= self._rank(kind, top[-1]):
+                        continue
+                    top.append(entry)
+                top.sort(key=lambda e: self._rank(kind, e))
+                del top[DEFAULT_LIMIT:]
+
+    def complete(self, kind, prefix, limit=DEFAULT_LIMIT):
+        """
+        أكثر الأوصاف استعمالًا التي تبدأ بـ prefix (دون اعتبار حالة الأحرف).
+        """
+        folded = _fold(prefix or "")
+        cached = len(folded) <= SHORT_PREFIX and limit <= DEFAULT_LIMIT
+        with self._lock:
+            best = self._top.get((kind, folded)) if cached else None
+            if best is None:
+                entries = self._keys.get(kind, ())
+                start = bisect.bisect_left(entries, (folded,))
+                end = bisect.bisect_left(entries, (folded + "\U0010ffff",), start)
+                best = heapq.nsmallest(DEFAULT_LIMIT if cached else limit, entries[start:end],
+                                       key=lambda entry: self._rank(kind, entry))
+                if cached:
+                    self._top[(kind, folded)] = best
+            best = best[:limit]
+        return [text for _, text in best]
+
+
+description_index = DescriptionIndex()
@@ -0,0 +1,111 @@
+"""
+كائنات نقل بيانات (DTO) ثابتة تمرر إلى الواجهات بدل كائنات ORM الحية، حتى لا تبقى
+الواجهة مرتبطة بجلسة قاعدة البيانات ولا تحدث تحميلات كسولة خارجها.
+"""
+import datetime
+from dataclasses import dataclass
+
+from sqlalchemy.orm import selectinload, joinedload
+
+from database_setup import CashSession
+
+
+def hybrid_formula(name):
+    # نعيد استعمال معادلات الخصائص الهجينة في CashSession على الـ DTO مباشرة
+    return property(CashSession.__dict__[name].fget)
+
+
+@dataclass(frozen=True)
+class UserDTO:
+    id: int
+    username: str
+    role: str
+
+    @classmethod
+    def from_orm(cls, user):
+        return cls(id=user.id, username=user.username, role=user.role)
+
+
+@dataclass(frozen=True)
+class TransactionDTO:
+    id: int
+    session_id: int
+    type: str
+    amount: float
+    description: str | None
+    timestamp: datetime.datetime | None
+
+    @classmethod
+    def from_orm(cls, t):
+        return cls(id=t.id, session_id=t.session_id, type=t.type, amount=t.amount,
+                   description=t.description, timestamp=t.timestamp)
+
+
+@dataclass(frozen=True)
+class FlexiTransactionDTO:
+    id: int
+    session_id: int
+    user_id: int | None
+    amount: float
+    description: str | None
+    timestamp: datetime.datetime | None
+    is_paid: bool
+
+    @classmethod
+    def from_orm(cls, t):
+        return cls(id=t.id, session_id=t.session_id, user_id=t.user_id, amount=t.amount,
+                   description=t.description, timestamp=t.timestamp, is_paid=bool(t.is_paid))
+
+
+@dataclass(frozen=True)
+class SessionDTO:
+    id: int
+    user_id: int | None
+    username: str | None # None إذا حذف العامل
+    start_time: datetime.datetime | None
+    end_time: datetime.datetime | None
+    start_balance: float
+    end_balance: float | None
+    start_flexi: float | None
+    end_flexi: float | None
+    status: str
+    notes: str | None
+    transactions: tuple = ()
+    flexi_transactions: tuple = ()
+    total_expense: float = 0.0
+    total_flexi_paid: float = 0.0
+    total_flexi_additions: float = 0.0
+
+    gross_income = hybrid_formula('gross_income')
+    net_cash_difference = hybrid_formula('net_cash_difference')
+    flexi_consumed = hybrid_formula('flexi_consumed')
+    net_profit = hybrid_formula('net_profit')
+
+    @classmethod
+    def from_orm(cls, s):
+        transactions = tuple(TransactionDTO.from_orm(t) for t in s.transactions)
+        flexi_transactions = tuple(FlexiTransactionDTO.from_orm(t) for t in s.flexi_transactions)
+        return cls(
+            id=s.id, user_id=s.user_id, username=s.user.username if s.user else None,
+            start_time=s.start_time, end_time=s.end_time,
+            start_balance=s.start_balance, end_balance=s.end_balance,
+            start_flexi=s.start_flexi, end_flexi=s.end_flexi,
+            status=s.status, notes=s.notes,
+            transactions=transactions, flexi_transactions=flexi_transactions,
+            total_expense=sum(t.amount for t in transactions if t.type == 'expense'),
+            total_flexi_paid=sum(t.amount for t in flexi_transactions if t.is_paid),
+            total_flexi_additions=sum(t.amount for t in flexi_transactions),
+        )
+
+
+# خيارات التحميل المسبق اللازمة لبناء SessionDTO دون استعلامات إضافية لكل صف
+SESSION_LOAD_OPTIONS = (
+    selectinload(CashSession.transactions),
+    selectinload(CashSession.flexi_transactions),
+    joinedload(CashSession.user),
+)
+
+
+def fetch_session(db, session_id):
+    session = db.get(CashSession, session_id, options=SESSION_LOAD_OPTIONS)
+    return SessionDTO.from_orm(session) if session else None
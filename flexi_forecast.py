@@ -0,0 +1,176 @@
+"""
+توقع استهلاك الفليكسي لتجهيز رصيد البداية المناسب (start_flexi) قبل فتح الجلسة.
+
+من تاريخ الجلسات المغلقة (الفليكسي المستهلك في كل جلسة موزعًا بالتساوي على ساعاتها) يبني
+ملفًا موسميًا لمعدل الاستهلاك في الساعة لكل (يوم الأسبوع × ساعة اليوم)، وإجمالي الاستهلاك
+لكل يوم تجاري من أيام الأسبوع. الأوزان تتضاعف كل HALF_LIFE_WEEKS أسبوعًا (الأحدث أثقل)،
+فالمتوسط المرجح هو مجاميع قابلة للجمع: التحديث التدريجي (refresh) يضيف الجلسات المغلقة منذ
+آخر لقطة فقط دون إعادة الملاءمة، وتوزيع الجلسات على الساعات يتم بمصفوفات numpy إن وجدت.
+
+forecast(user_id, start) يعيد الاستهلاك المتوقع للجلسة (بمدة جلسات العامل المعتادة) ولليوم،
+مع قيمة موصى بها = المتوقع + Z_RECOMMENDED انحراف معياري.
+"""
+import collections
+import datetime
+import math
+import threading
+
+from database_setup import business_day
+from read_models import fetch_flexi_closings
+
+try:
+    import numpy as np
+except ImportError: # numpy اختياري
+    np = None
+
+HAS_NUMPY = np is not None
+EPOCH = datetime.datetime(2020, 1, 1)
+EPOCH_WEEKDAY = EPOCH.weekday()
+CELLS = 7 * 24
+HALF_LIFE_WEEKS = 8.0
+MAX_SESSION_HOURS = 24.0 # جلسات أطول (منسية مفتوحة) لا تمثل معدل الاستهلاك
+DEFAULT_SESSION_HOURS = 8.0
+Z_RECOMMENDED = 1.28 # ~90% من الجلسات/الأيام لا تتجاوز القيمة الموصى بها
+MIN_OBSERVATIONS = 5
+
+FlexiForecast = collections.namedtuple("FlexiForecast", (
+    "session_expected", "session_recommended", "session_hours",
+    "day_expected", "day_recommended", "observations",
+))
+
+
+def _hours(moment):
+    return (moment - EPOCH).total_seconds() / 3600.0
+
+
+def _weight(hours):
+    return 2.0 ** (hours / (24 * 7 * HALF_LIFE_WEEKS))
+
+
+def _cell(hour_index):
+    day, hour = divmod(int(hour_index), 24)
+    return ((day + EPOCH_WEEKDAY) % 7) * 24 + hour
+
+
+def _pieces(start_h, end_h):
+    # (الساعة، نسبة التغطية) لكل ساعة تغطيها الفترة
+    hour = math.floor(start_h)
+    while hour < end_h:
+        yield hour, min(hour + 1, end_h) - max(hour, start_h)
+        hour += 1
+
+
+def _spread_numpy(start_h, end_h, rate):
+    """
+    توزيع عدة جلسات على ساعاتها دفعة واحدة؛ يعيد (الخلايا، الوزن×التغطية، المعدل) لكل قطعة.
+    """
+    start_h, end_h, rate = np.asarray(start_h), np.asarray(end_h), np.asarray(rate)
+    first = np.floor(start_h)
+    counts = (np.ceil(end_h) - first).astype(np.int64)
+    owner = np.repeat(np.arange(len(start_h)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    hour = first[owner] + offsets
+    coverage = np.minimum(hour + 1, end_h[owner]) - np.maximum(hour, start_h[owner])
+    day, hour_of_day = np.divmod(hour.astype(np.int64), 24)
+    cells = ((day + EPOCH_WEEKDAY) % 7) * 24 + hour_of_day
+    weight = np.exp2(hour / (24 * 7 * HALF_LIFE_WEEKS)) * coverage
+    return cells, weight, rate[owner]
+
+
+class FlexiForecaster:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._watermark = 0
+        self._w = [0.0] * CELLS  # مجموع الأوزان لكل خلية
+        self._s = [0.0] * CELLS  # مجموع الوزن × المعدل
+        self._q = [0.0] * CELLS  # مجموع الوزن × مربع المعدل
+        self._daily = collections.defaultdict(float) # التاريخ -> الاستهلاك
+        self._durations = {} # العامل -> [مجموع الوزن × المدة، مجموع الأوزان]
+        self.observations = 0
+
+    def refresh(self, db):
+        """
+        يضيف الجلسات المغلقة منذ آخر تحديث (استعلام واحد).
+        """
+        rows = fetch_flexi_closings(db, self._watermark)
+        if rows:
+            self.add_sessions(rows)
+
+    def add_sessions(self, rows):
+        usable = []
+        for row in rows:
+            start_h, end_h = _hours(row.start_time), _hours(row.end_time)
+            duration = end_h - start_h
+            if 0 < duration <= MAX_SESSION_HOURS and row.flexi_consumed >= 0:
+                usable.append((row, start_h, end_h, row.flexi_consumed / duration))
+        with self._lock:
+            self._watermark = max(self._watermark, max(row.closing_id for row in rows))
+            if not usable:
+                return
+            if HAS_NUMPY:
+                cells, weight, rate = _spread_numpy([u[1] for u in usable], [u[2] for u in usable],
+                                                    [u[3] for u in usable])
+                for target, values in ((self._w, weight), (self._s, weight * rate), (self._q, weight * rate * rate)):
+                    sums = np.bincount(cells, weights=values, minlength=CELLS)
+                    for i in np.flatnonzero(sums):
+                        target[i] += float(sums[i])
+            else:
+                for _, start_h, end_h, rate in usable:
+                    for hour, coverage in _pieces(start_h, end_h):
+                        cell, weight = _cell(hour), _weight(hour) * coverage
+                        self._w[cell] += weight
+                        self._s[cell] += weight * rate
+                        self._q[cell] += weight * rate * rate
+            for row, start_h, end_h, _ in usable:
+                self._daily[business_day(row.start_time)] += row.flexi_consumed
+                weight = _weight(start_h)
+                sums = self._durations.setdefault(row.user_id, [0.0, 0.0])
+                sums[0] += weight * (end_h - start_h)
+                sums[1] += weight
+            self.observations += len(usable)
+
+    def _session_hours(self, user_id):
+        sums = self._durations.get(user_id)
+        if sums is None: # عامل جديد: متوسط كل العمال
+            totals = [sum(s[i] for s in self._durations.values()) for i in (0, 1)]
+            sums = totals if totals[1] > 0 else None
+        return sums[0] / sums[1] if sums else DEFAULT_SESSION_HOURS
+
+    def _day_forecast(self, day):
+        # الأيام المكتملة من نفس يوم الأسبوع، بأوزان متناقصة مع القدم
+        weekday = day.weekday()
+        total_w = total_s = total_q = 0.0
+        for past_day, consumed in self._daily.items():
+            if past_day < day and past_day.weekday() == weekday:
+                weight = _weight(_hours(datetime.datetime.combine(past_day, datetime.time())))
+                total_w += weight
+                total_s += weight * consumed
+                total_q += weight * consumed * consumed
+        if total_w == 0:
+            return None, None
+        mean = total_s / total_w
+        std = math.sqrt(max(total_q / total_w - mean * mean, 0.0))
+        return mean, mean + Z_RECOMMENDED * std
+
+    def forecast(self, user_id, start):
+        """
+        FlexiForecast لجلسة تبدأ في start (بنفس توقيت start_time المخزن)، أو None بدون تاريخ كاف.
+        """
+        with self._lock:
+            if self.observations < MIN_OBSERVATIONS:
+                return None
+            hours = self._session_hours(user_id)
+            start_h = _hours(start)
+            expected = recommended = 0.0
+            for hour, coverage in _pieces(start_h, start_h + hours):
+                cell = _cell(hour)
+                if self._w[cell] > 0:
+                    mean = self._s[cell] / self._w[cell]
+                    std = math.sqrt(max(self._q[cell] / self._w[cell] - mean * mean, 0.0))
+                    expected += mean * coverage
+                    recommended += (mean + Z_RECOMMENDED * std) * coverage
+            day_expected, day_recommended = self._day_forecast(business_day(start))
+            return FlexiForecast(expected, recommended, hours, day_expected, day_recommended, self.observations)
+
+
+flexi_forecaster = FlexiForecaster()
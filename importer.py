@@ -0,0 +1,378 @@
+"""
+استيراد الجلسات التاريخية من ملفات CSV/XLSX دفعة واحدة.
+
+كل سطر في الملف سجل واحد يحدده العمود record_type:
+- session: جلسة (session_ref, username, start_time, end_time, start_balance, end_balance,
+  start_flexi, end_flexi, status, notes)
+- expense / income: حركة نقدية (session_ref, amount, description, timestamp)
+- flexi: إضافة فليكسي (session_ref, amount, description, timestamp, is_paid)
+
+يجب أن يسبق سطر الجلسة حركاتها في الملف. الأوقات بدون منطقة زمنية تعتبر بتوقيت المحل
+(CASH_TIMEZONE، أو توقيت الجهاز إذا لم يحدد) وتحول إلى UTC كما يفعل التطبيق. الأسطر المرفوضة تكتب في ملف CSV مع سبب الرفض.
+
+الاستعمال:
+    python importer.py history.xlsx --chunk-size 5000 --chunks-per-commit 20 --rejects rejects.csv
+"""
+import argparse
+import csv
+import datetime
+import os
+import secrets
+import sys
+import time
+
+import bcrypt
+from sqlalchemy import insert, select, func
+
+from database_setup import (engine, User, CashSession, Transaction, FlexiTransaction, business_day,
+                            _BUSINESS_TZ, SEARCH_INSERT_TRIGGERS, create_search_index, index_search_rows,
+                            DESCRIPTION_INSERT_TRIGGERS, create_description_index, index_descriptions, intern_descriptions,
+                            CLOSING_INSERT_TRIGGERS, create_closing_snapshots, snapshot_closed_sessions)
+
+try:
+    from openpyxl import load_workbook
+except ImportError:
+    load_workbook = None
+
+DEFAULT_CHUNK_SIZE = 5000
+# عدد الدفعات في كل معاملة (transaction) قبل الـ commit
+CHUNKS_PER_COMMIT = 20
+
+COLUMNS = ["record_type", "session_ref", "username", "start_time", "end_time",
+           "start_balance", "end_balance", "start_flexi", "end_flexi", "status", "notes",
+           "amount", "description", "timestamp", "is_paid"]
+
+_DATETIME_FORMATS = ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d",
+                     "%d/%m/%Y %H:%M:%S", "%d/%m/%Y %H:%M", "%d/%m/%Y")
+_TRUE_VALUES = {"1", "true", "yes", "y", "نعم"}
+
+
+class RowError(ValueError):
+    pass
+
+
+def _text(value):
+    if value.__class__ is str: # خلايا CSV كلها نصوص
+        return value.strip()
+    if value is None:
+        return ""
+    return str(value).strip()
+
+
+def _parse_float(value, field, required=True):
+    raw = _text(value)
+    if not raw:
+        if required:
+            raise RowError(f"{field} مطلوب")
+        return None
+    try:
+        return float(raw.replace(",", ""))
+    except ValueError:
+        raise RowError(f"{field} ليس رقمًا: {raw}")
+
+
+def _parse_datetime(value, field, required=True):
+    if isinstance(value, datetime.datetime):
+        parsed = value
+    else:
+        raw = _text(value)
+        if not raw:
+            if required:
+                raise RowError(f"{field} مطلوب")
+            return None
+        parsed = None
+        try:
+            parsed = datetime.datetime.fromisoformat(raw)
+        except ValueError:
+            for fmt in _DATETIME_FORMATS:
+                try:
+                    parsed = datetime.datetime.strptime(raw, fmt)
+                    break
+                except ValueError:
+                    continue
+        if parsed is None:
+            raise RowError(f"{field} ليس تاريخًا صالحًا: {raw}")
+    # وقت بدون منطقة زمنية مكتوب بتوقيت المحل لا بتوقيت الجهاز الذي يشغل الاستيراد
+    if parsed.tzinfo is None and _BUSINESS_TZ is not None:
+        parsed = parsed.replace(tzinfo=_BUSINESS_TZ)
+    # التطبيق يخزن التوقيت بصيغة UTC بدون منطقة زمنية
+    return parsed.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+
+
+def iter_csv_rows(path):
+    # csv.reader مع dict(zip) بدل DictReader (نفس الصفوف، أسرع بوضوح في الملفات الكبيرة)
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+        for line_no, values in enumerate(reader, start=2):
+            if values:
+                yield line_no, dict(zip(header, values))
+
+
+def iter_xlsx_rows(path):
+    if load_workbook is None:
+        raise RuntimeError("قراءة ملفات XLSX تتطلب تثبيت openpyxl")
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [_text(h) for h in next(rows, ())]
+        for line_no, values in enumerate(rows, start=2):
+            if values is None or all(v is None for v in values):
+                continue
+            yield line_no, dict(zip(header, values))
+    finally:
+        workbook.close()
+
+
+def iter_rows(path):
+    if path.lower().endswith((".xlsx", ".xlsm")):
+        return iter_xlsx_rows(path)
+    return iter_csv_rows(path)
+
+
+# أعمدة كل جدول بالترتيب المستعمل في الـ tuples المدرجة (نفس ترتيب أعمدة الجدول في جملة insert المترجمة)
+_INSERT_COLUMNS = {
+    "cash_sessions": ("id", "user_id", "start_time", "business_day", "end_time", "start_balance", "end_balance",
+                      "status", "notes", "start_flexi", "end_flexi"),
+    "transactions": ("session_id", "type", "amount", "description_id", "timestamp"),
+    "flexi_transactions": ("session_id", "user_id", "amount", "description_id", "timestamp", "is_paid"),
+}
+# الحركات تحمل نص الوصف في موضع description_id حتى الإدراج، ونوعه في descriptions لكل جدول
+_DESCRIPTION_POSITION = 3
+_DESCRIPTION_KINDS = {"transactions": lambda values: values[1], "flexi_transactions": lambda values: "flexi"}
+_STATS_KEYS = {"cash_sessions": "sessions", "transactions": "transactions", "flexi_transactions": "flexi"}
+
+
+def _db_datetime(value):
+    # نفس صيغة SQLAlchemy لعمود DateTime في SQLite
+    return value.isoformat(" ", "microseconds") if value is not None else None
+
+
+class HistoryImporter:
+    """
+    يقرأ الأسطر بشكل متدفق ويجمعها في دفعات تدرج عبر executemany بجملة insert() مترجمة
+    مرة واحدة لكل جدول، بدل إنشاء كائنات ORM سطرًا بسطر.
+    """
+
+    def __init__(self, connection, chunk_size=DEFAULT_CHUNK_SIZE, reject_writer=None):
+        self.connection = connection
+        self.chunk_size = chunk_size
+        self.reject_writer = reject_writer
+        self.users = dict(connection.execute(select(User.username, User.id)).all())
+        self.session_ids = {}
+        self.description_ids = {} # (kind, text) -> id، صالح داخل المعاملة الحالية
+        self.next_session_id = None # يحدده begin() في كل معاملة
+        self.statements = {
+            name: str(insert(table).compile(dialect=connection.dialect, column_keys=list(_INSERT_COLUMNS[name])))
+            for name, table in (("cash_sessions", CashSession.__table__),
+                                ("transactions", Transaction.__table__),
+                                ("flexi_transactions", FlexiTransaction.__table__))
+        }
+        self.pending = {name: [] for name in _INSERT_COLUMNS}
+        self.stats = {"sessions": 0, "transactions": 0, "flexi": 0, "users": 0, "rejected": 0}
+
+    def begin(self, watermarks):
+        """
+        يهيئ المستورد لمعاملة جديدة: معرفات الجلسات تحجز بعد أكبر معرف في القاعدة الآن (التطبيق
+        قد يفتح جلسات بين معاملتين)، والأوصاف تطلب من جديد (وصف بلا استعمال قد يحذف بينهما).
+        """
+        self.next_session_id = watermarks["sessions_after"] + 1
+        self.description_ids.clear()
+
+    def _user_id(self, username):
+        user_id = self.users.get(username)
+        if user_id is None:
+            # العامل غير موجود: ينشأ بكلمة مرور عشوائية لا يعرفها أحد، ويعينها المشرف لاحقًا
+            hashed = bcrypt.hashpw(secrets.token_urlsafe(16).encode("utf-8"), bcrypt.gensalt(rounds=4)).decode("utf-8")
+            user_id = self.connection.execute(
+                insert(User.__table__).values(username=username, hashed_password=hashed, role="user")
+            ).inserted_primary_key[0]
+            self.users[username] = user_id
+            self.stats["users"] += 1
+        return user_id
+
+    def _session_row(self, row):
+        ref = _text(row.get("session_ref"))
+        if not ref:
+            raise RowError("session_ref مطلوب")
+        if ref in self.session_ids:
+            raise RowError(f"الجلسة {ref} مكررة")
+        username = _text(row.get("username"))
+        if not username:
+            raise RowError("username مطلوب")
+        start_balance = _parse_float(row.get("start_balance"), "start_balance")
+        end_balance = _parse_float(row.get("end_balance"), "end_balance", required=False)
+        status = _text(row.get("status")).lower() or ("closed" if end_balance is not None else "open")
+        if status not in ("open", "closed"):
+            raise RowError(f"status غير معروف: {status}")
+        start_time = _parse_datetime(row.get("start_time"), "start_time")
+        end_time = _parse_datetime(row.get("end_time"), "end_time", required=False)
+        start_flexi = _parse_float(row.get("start_flexi"), "start_flexi", required=False) or 0.0
+        end_flexi = _parse_float(row.get("end_flexi"), "end_flexi", required=False)
+        session_id = self.next_session_id
+        user_id = self._user_id(username)
+        self.session_ids[ref] = (session_id, user_id)
+        self.next_session_id += 1
+        return "cash_sessions", (session_id, user_id, _db_datetime(start_time), business_day(start_time).isoformat(),
+                                 _db_datetime(end_time), start_balance, end_balance, status,
+                                 _text(row.get("notes")) or None, start_flexi, end_flexi)
+
+    def _movement_row(self, row, record_type):
+        ref = _text(row.get("session_ref"))
+        if ref not in self.session_ids:
+            raise RowError(f"الجلسة {ref or '?'} غير معرفة قبل هذا السطر")
+        session_id, user_id = self.session_ids[ref]
+        amount = _parse_float(row.get("amount"), "amount")
+        if amount < 0:
+            raise RowError("amount سالب")
+        description = _text(row.get("description")) or None
+        timestamp = _db_datetime(_parse_datetime(row.get("timestamp"), "timestamp"))
+        if record_type == "flexi":
+            is_paid = _text(row.get("is_paid")).lower() in _TRUE_VALUES
+            return "flexi_transactions", (session_id, user_id, amount, description, timestamp, is_paid)
+        return "transactions", (session_id, record_type, amount, description, timestamp)
+
+    def add(self, line_no, row):
+        """يضيف سطرًا إلى دفعته، ويعيد 1 إذا أدت إضافته إلى إدراج دفعة كاملة."""
+        record_type = _text(row.get("record_type")).lower()
+        try:
+            if record_type == "session":
+                table, values = self._session_row(row)
+            elif record_type in ("expense", "income", "flexi"):
+                table, values = self._movement_row(row, record_type)
+            else:
+                raise RowError(f"record_type غير معروف: {record_type or '?'}")
+        except RowError as e:
+            self.reject(line_no, row, str(e))
+            return 0
+        batch = self.pending[table]
+        batch.append(values)
+        if len(batch) >= self.chunk_size:
+            self.flush(table)
+            return 1
+        return 0
+
+    def reject(self, line_no, row, reason):
+        self.stats["rejected"] += 1
+        if self.reject_writer is not None:
+            self.reject_writer.writerow([line_no, reason] + [_text(row.get(c)) for c in COLUMNS])
+
+    def flush(self, table=None):
+        # الجلسات تدرج دائمًا قبل حركاتها (معرفاتها محجوزة مسبقًا)
+        tables = ["cash_sessions", table] if table is not None else list(self.pending)
+        for name in tables:
+            batch = self.pending[name]
+            if not batch:
+                continue
+            if name in _DESCRIPTION_KINDS:
+                batch = self._with_description_ids(batch, _DESCRIPTION_KINDS[name])
+            self.connection.exec_driver_sql(self.statements[name], batch)
+            self.stats[_STATS_KEYS[name]] += len(batch)
+            self.pending[name] = []
+
+    def _with_description_ids(self, batch, kind_of):
+        # النصوص الجديدة فقط تطلب من descriptions (جملتان لكل دفعة على الأكثر)
+        ids, at = self.description_ids, _DESCRIPTION_POSITION
+        missing = {(kind_of(values), values[at]) for values in batch if values[at] is not None} - ids.keys()
+        if missing:
+            ids.update(intern_descriptions(self.connection, missing))
+        return [values[:at] + (ids.get((kind_of(values), values[at])),) + values[at + 1:] for values in batch]
+
+
+def _begin_import_transaction(connection):
+    """
+    يبدأ معاملة ويعطل مشغلات الإدراج فيها (فهرس البحث، الأوصاف، لقطات الإغلاق). يعيد حدود
+    المعرفات الحالية لمعالجة الصفوف الجديدة دفعة واحدة عند الـ commit. (في SQLite تعديلات المخطط جزء من المعاملة،
+    فالتراجع يعيد المشغلات تلقائيًا.)
+    """
+    trans = connection.begin()
+    # الكتابة الأولى (حذف المشغلات) تحجز قفل الكتابة قبل قراءة الحدود، فلا يدرج التطبيق
+    # جلسة أو عملية بين قراءتها ونهاية المعاملة
+    for trigger in SEARCH_INSERT_TRIGGERS + DESCRIPTION_INSERT_TRIGGERS + CLOSING_INSERT_TRIGGERS:
+        connection.exec_driver_sql(f"DROP TRIGGER IF EXISTS {trigger}")
+    watermarks = {
+        "transactions_after": connection.execute(select(func.max(Transaction.id))).scalar() or 0,
+        "flexi_after": connection.execute(select(func.max(FlexiTransaction.id))).scalar() or 0,
+        "sessions_after": connection.execute(select(func.max(CashSession.id))).scalar() or 0,
+    }
+    return trans, watermarks
+
+
+def _commit_import_transaction(connection, trans, watermarks):
+    index_search_rows(connection, **watermarks)
+    index_descriptions(connection, watermarks["transactions_after"], watermarks["flexi_after"])
+    snapshot_closed_sessions(connection, **watermarks)
+    create_search_index(connection)
+    create_description_index(connection)
+    create_closing_snapshots(connection)
+    trans.commit()
+
+
+def import_file(path, chunk_size=DEFAULT_CHUNK_SIZE, rejects_path=None, chunks_per_commit=CHUNKS_PER_COMMIT, db_engine=engine):
+    """
+    يستورد الملف ويعيد إحصائيات الاستيراد. الأسطر المرفوضة تكتب في rejects_path إن وجد.
+    """
+    reject_file = open(rejects_path, "w", newline="", encoding="utf-8-sig") if rejects_path else None
+    reject_writer = None
+    if reject_file is not None:
+        reject_writer = csv.writer(reject_file)
+        reject_writer.writerow(["line", "reject_reason"] + COLUMNS)
+
+    started = time.perf_counter()
+    rows_read = 0
+    try:
+        connection = db_engine.connect()
+        try:
+            trans, watermarks = _begin_import_transaction(connection)
+            importer = HistoryImporter(connection, chunk_size, reject_writer)
+            importer.begin(watermarks)
+            flushed_chunks = 0
+            for line_no, row in iter_rows(path):
+                rows_read += 1
+                flushed_chunks += importer.add(line_no, row)
+                if flushed_chunks >= chunks_per_commit:
+                    importer.flush()
+                    _commit_import_transaction(connection, trans, watermarks)
+                    trans, watermarks = _begin_import_transaction(connection)
+                    importer.begin(watermarks)
+                    flushed_chunks = 0
+            importer.flush()
+            _commit_import_transaction(connection, trans, watermarks)
+        except Exception:
+            trans.rollback()
+            raise
+        finally:
+            connection.close()
+    finally:
+        if reject_file is not None:
+            reject_file.close()
+
+    elapsed = time.perf_counter() - started
+    stats = dict(importer.stats)
+    stats["rows"] = rows_read
+    stats["seconds"] = round(elapsed, 3)
+    stats["rows_per_second"] = round(rows_read / elapsed) if elapsed > 0 else rows_read
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="استيراد الجلسات التاريخية من CSV/XLSX")
+    parser.add_argument("path")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--chunks-per-commit", type=int, default=CHUNKS_PER_COMMIT)
+    parser.add_argument("--rejects", default=None, help="ملف CSV للأسطر المرفوضة")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.path):
+        print(f"File not found: {args.path}")
+        return 1
+    rejects_path = args.rejects or os.path.splitext(args.path)[0] + "_rejects.csv"
+    stats = import_file(args.path, args.chunk_size, rejects_path, args.chunks_per_commit)
+    print(f"Import finished: {stats}")
+    if stats["rejected"]:
+        print(f"Rejected rows written to {rejects_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
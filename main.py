@@ -9,6 +9,11 @@ from dashboard_ui import UserDashboard
 from admin_dashboard_ui import AdminDashboard
 from database_setup import (User, SessionLocal, engine, init_db, 
                               get_db_version, run_migrations, CURRENT_DB_VERSION, DB_FILENAME)
+from query_stats import ui_action
+from stall_watchdog import start_watchdog
+from write_queue import replay_spool
+from backup_service import start_backup_service
+from read_api import start_read_api_thread
 
 # --- نافذة تسجيل الدخول ---
 class LoginWindow(QMainWindow):
@@ -144,6 +149,7 @@ class LoginWindow(QMainWindow):
             }
         """)
 
+    @ui_action("تسجيل الدخول")
     def handle_login(self):
         username = self.username_input.text()
         password = self.password_input.text()
@@ -190,7 +196,19 @@ def main():
 
     if not check_database_migration():
         sys.exit()
+
+    # -- إضافة --: تطبيق عمليات طابور الكتابة المتبقية من تشغيل سابق انقطع فجأة
+    replay_spool()
         
+    # -- إضافة --: نسخ احتياطي مجدول في الخلفية (backups/)
+    start_backup_service()
+
+    # -- إضافة --: واجهة القراءة HTTP (فقط إذا حدد CASH_READ_API_PORT)
+    start_read_api_thread()
+
+    # -- إضافة --: مراقبة تجمد الواجهة وتسجيل مكدس الخيط الرئيسي
+    start_watchdog()
+
     login_window = LoginWindow()
     login_window.show()
     
@@ -0,0 +1,294 @@
+"""
+تقارير PDF قابلة للطباعة: تقرير إغلاق لكل جلسة وكشف شهري لكل عامل.
+
+التوليد يتم في خيوط QThreadPool (QTextDocument + QPdfWriter مدعومان خارج خيط الواجهة)،
+وكل مهمة تقرأ بياناتها بجلسة قاعدة بيانات خاصة بها، فلا تتوقف الواجهة أثناء التوليد.
+القوالب (HTML + CSS) تُجهز مرة واحدة عند الاستيراد (string.Template)، وكشوف كل العمال لشهر
+واحد تولد بالتوازي (مهمة لكل عامل) ثم يبلغ batch_finished عند انتهاء الدفعة.
+
+    pdf_renderer.closing_report(session_id)
+    pdf_renderer.monthly_statements(year, month)            # كل العمال
+    pdf_renderer.monthly_statements(year, month, [user_id]) # عامل واحد
+
+الملفات تحفظ في مجلد reports/ والنتائج تصل عبر إشارات file_ready / file_failed / batch_finished.
+"""
+import datetime
+import html
+import itertools
+import os
+import re
+from string import Template
+
+from PyQt6.QtCore import Qt, QObject, QRunnable, QThreadPool, QMarginsF, pyqtSignal
+from PyQt6.QtGui import QTextDocument, QPdfWriter, QPageSize, QPageLayout, QTextOption
+from sqlalchemy import select
+
+from database_setup import User, CashSession
+from read_models import fetch_session_rows, fetch_session_totals, month_criteria
+from unit_of_work import read_snapshot
+
+REPORTS_DIR = "reports"
+PDF_RESOLUTION = 300
+
+_STYLE = """
+body { font-family: 'Segoe UI', Arial, sans-serif; font-size: 10pt; color: #111; }
+h1 { font-size: 16pt; margin-bottom: 2px; }
+.meta { color: #555; font-size: 9pt; }
+table { border-collapse: collapse; margin-top: 10px; }
+.statement { font-size: 8pt; }
+th { background-color: #e9ecef; font-weight: bold; }
+td, th { border: 1px solid #adb5bd; padding: 4px; }
+.num { text-align: left; }
+.neg { color: #dc3545; }
+.pos { color: #198754; }
+.total td { font-weight: bold; background-color: #f8f9fa; }
+"""
+
+_PAGE = Template("""<html dir="rtl"><head><style>$style</style></head><body>
+<h1>$title</h1><div class="meta">$meta</div>
+$body
+<p class="meta">أنشئ في $generated</p>
+</body></html>""")
+
+_CLOSING_BODY = Template("""
+<table width="100%">
+<tr><th colspan="2">ملخص النقد</th></tr>
+<tr><td>رصيد البداية</td><td class="num">$start_balance</td></tr>
+<tr><td>مجموع المصاريف</td><td class="num">$total_expense</td></tr>
+<tr><td>الرصيد النظري</td><td class="num">$theoretical_cash</td></tr>
+<tr><td>الرصيد الفعلي (النهاية)</td><td class="num">$end_balance</td></tr>
+<tr class="total"><td>الفرق (عجز/زيادة)</td><td class="num $diff_class">$net_cash_difference</td></tr>
+</table>
+<table width="100%">
+<tr><th colspan="2">ملخص الفليكسي</th></tr>
+<tr><td>رصيد البداية</td><td class="num">$start_flexi</td></tr>
+<tr><td>مجموع الإضافات</td><td class="num">$total_flexi_additions</td></tr>
+<tr><td>الرصيد النظري</td><td class="num">$theoretical_flexi</td></tr>
+<tr><td>الرصيد الفعلي (النهاية)</td><td class="num">$end_flexi</td></tr>
+<tr class="total"><td>الفليكسي المستهلك</td><td class="num">$flexi_consumed</td></tr>
+</table>
+$notes
+""")
+
+_STATEMENT_HEADER = ("<table width=\"100%\" class=\"statement\"><tr><th>وقت الفتح</th><th>وقت الإغلاق</th><th>رصيد البداية</th><th>رصيد النهاية</th>"
+                     "<th>المصاريف</th><th>الفرق (النقد)</th><th>إضافات الفليكسي</th><th>الفليكسي المستهلك</th></tr>")
+_STATEMENT_ROW = Template("<tr><td>$start_time</td><td>$end_time</td><td class=\"num\">$start_balance</td>"
+                          "<td class=\"num\">$end_balance</td><td class=\"num\">$total_expense</td>"
+                          "<td class=\"num $diff_class\">$net_cash_difference</td><td class=\"num\">$total_flexi_additions</td>"
+                          "<td class=\"num\">$flexi_consumed</td></tr>")
+_STATEMENT_TOTAL = Template("<tr class=\"total\"><td colspan=\"4\">المجموع ($sessions جلسة)</td>"
+                            "<td class=\"num\">$total_expense</td><td class=\"num $diff_class\">$net_cash_difference</td>"
+                            "<td class=\"num\">$total_flexi_additions</td><td class=\"num\">$flexi_consumed</td></tr></table>")
+
+
+def _money(value, signed=False):
+    if value is None:
+        return "N/A"
+    # تضمين LTR حتى تبقى الإشارة قبل الرقم داخل فقرة عربية
+    return f"\u202a{value:+,.2f}\u202c" if signed else f"\u202a{value:,.2f}\u202c"
+
+
+def _time(value):
+    return value.strftime("%Y-%m-%d %H:%M") if value else "N/A"
+
+
+def _diff_class(value):
+    return "neg" if value < 0 else "pos" if value > 0 else ""
+
+
+def _page(title, meta, body):
+    return _PAGE.substitute(style=_STYLE, title=html.escape(title), meta=meta, body=body,
+                            generated=datetime.datetime.now().strftime("%Y-%m-%d %H:%M"))
+
+
+def closing_report_html(session):
+    """
+    HTML تقرير الإغلاق لصف SessionRow (نفس أرقام ClosingReportDialog).
+    """
+    flexi_consumed = session.flexi_consumed if session.end_flexi is not None else 0.0
+    body = _CLOSING_BODY.substitute(
+        start_balance=_money(session.start_balance),
+        total_expense=_money(session.total_expense),
+        theoretical_cash=_money(session.start_balance - session.total_expense + session.total_flexi_paid),
+        end_balance=_money(session.end_balance),
+        net_cash_difference=_money(session.net_cash_difference, signed=True),
+        diff_class=_diff_class(session.net_cash_difference),
+        start_flexi=_money(session.start_flexi),
+        total_flexi_additions=_money(session.total_flexi_additions),
+        theoretical_flexi=_money((session.start_flexi or 0.0) + session.total_flexi_additions),
+        end_flexi=_money(session.end_flexi),
+        flexi_consumed=_money(flexi_consumed),
+        notes=f"<p><b>ملاحظات:</b> {html.escape(session.notes)}</p>" if session.notes else "",
+    )
+    meta = (f"العامل: {html.escape(session.username or '(مستخدم محذوف)')} — الجلسة رقم {session.id}<br>"
+            f"من {_time(session.start_time)} إلى {_time(session.end_time)}")
+    return _page("تقرير إغلاق الجلسة", meta, body)
+
+
+def monthly_statement_html(username, year, month, sessions, totals):
+    rows = [_STATEMENT_ROW.substitute(
+        start_time=_time(s.start_time), end_time=_time(s.end_time),
+        start_balance=_money(s.start_balance), end_balance=_money(s.end_balance),
+        total_expense=_money(s.total_expense),
+        net_cash_difference=_money(s.net_cash_difference, signed=True), diff_class=_diff_class(s.net_cash_difference),
+        total_flexi_additions=_money(s.total_flexi_additions),
+        flexi_consumed=_money(s.flexi_consumed if s.end_flexi is not None else 0.0),
+    ) for s in sessions]
+    total_row = _STATEMENT_TOTAL.substitute(
+        sessions=totals.sessions, total_expense=_money(totals.total_expense),
+        net_cash_difference=_money(totals.net_cash_difference, signed=True),
+        diff_class=_diff_class(totals.net_cash_difference),
+        total_flexi_additions=_money(totals.total_flexi_additions),
+        flexi_consumed=_money(totals.flexi_consumed),
+    )
+    meta = f"العامل: {html.escape(username)} — الشهر: {year}-{month:02d}"
+    return _page("الكشف الشهري", meta, _STATEMENT_HEADER + "".join(rows) + total_row)
+
+
+def render_pdf(html_text, path):
+    """
+    يكتب HTML إلى ملف PDF (A4). آمن للاستدعاء من خيط عامل.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    writer = QPdfWriter(path)
+    writer.setResolution(PDF_RESOLUTION)
+    writer.setPageLayout(QPageLayout(QPageSize(QPageSize.PageSizeId.A4), QPageLayout.Orientation.Portrait,
+                                     QMarginsF(15, 15, 15, 15), QPageLayout.Unit.Millimeter))
+    document = QTextDocument()
+    option = QTextOption()
+    option.setTextDirection(Qt.LayoutDirection.RightToLeft)
+    document.setDefaultTextOption(option)
+    document.setHtml(html_text)
+    document.print(writer)
+    return path
+
+
+def _file_name(value):
+    return re.sub(r"[^\w.-]+", "_", value).strip("_") or "report"
+
+
+class _Signals(QObject):
+    # من خيوط العمل إلى كائن PdfRenderer في خيط الواجهة (اتصال مصفوف تلقائيًا)
+    job_done = pyqtSignal(int, str, str, str) # الدفعة، الاسم، المسار، الخطأ
+    batch_planned = pyqtSignal(int, int)      # الدفعة، عدد المهام
+
+
+class _Job(QRunnable):
+    def __init__(self, signals, batch_id, name, build):
+        super().__init__()
+        self.signals, self.batch_id, self.name, self.build = signals, batch_id, name, build
+
+    def run(self):
+        try:
+            path = self.build()
+            self.signals.job_done.emit(self.batch_id, self.name, path, "")
+        except Exception as e:
+            print(f"PDF report '{self.name}' failed: {e}")
+            self.signals.job_done.emit(self.batch_id, self.name, "", str(e))
+
+
+class PdfRenderer(QObject):
+    file_ready = pyqtSignal(str)             # المسار
+    file_failed = pyqtSignal(str, str)       # الاسم، الرسالة
+    batch_finished = pyqtSignal(int, str, list, list) # الدفعة، المجلد، المسارات، الأخطاء
+
+    def __init__(self, output_dir=REPORTS_DIR, parent=None):
+        super().__init__(parent)
+        self.output_dir = output_dir
+        self.pool = QThreadPool(self)
+        self._signals = _Signals()
+        self._signals.job_done.connect(self._on_job_done)
+        self._signals.batch_planned.connect(self._on_batch_planned)
+        self._batch_ids = itertools.count(1)
+        self._batches = {} # الدفعة -> {"dir", "total", "paths", "errors"}
+
+    # --- الطلبات (من خيط الواجهة) ---
+    def closing_report(self, session_id):
+        batch_id = self._new_batch(self.output_dir, total=1)
+        self.pool.start(_Job(self._signals, batch_id, f"session {session_id}",
+                             lambda: self._build_closing(session_id)))
+        return batch_id
+
+    def monthly_statements(self, year, month, user_ids=None):
+        """
+        كشف لكل عامل (أو للعمال المحددين) في مجلد reports/YYYY-MM، مهمة مستقلة لكل عامل.
+        """
+        directory = os.path.join(self.output_dir, f"{year}-{month:02d}")
+        batch_id = self._new_batch(directory, total=None)
+        self.pool.start(_Job(self._signals, batch_id, "plan",
+                             lambda: self._plan_statements(batch_id, directory, year, month, user_ids)))
+        return batch_id
+
+    @property
+    def busy(self):
+        return bool(self._batches)
+
+    # --- خيوط العمل ---
+    def _build_closing(self, session_id):
+        with read_snapshot() as db:
+            rows = fetch_session_rows(db, CashSession.id == session_id)
+        if not rows:
+            raise LookupError(f"session {session_id} not found")
+        session = rows[0]
+        path = os.path.join(self.output_dir, f"closing_{session.id}_{_file_name(session.username or 'deleted')}.pdf")
+        return render_pdf(closing_report_html(session), path)
+
+    def _plan_statements(self, batch_id, directory, year, month, user_ids):
+        with read_snapshot() as db:
+            stmt = select(User.id, User.username).where(User.role == 'user').order_by(User.username)
+            if user_ids is not None:
+                stmt = stmt.where(User.id.in_(user_ids))
+            users = db.execute(stmt).all()
+        self._signals.batch_planned.emit(batch_id, len(users))
+        for user_id, username in users:
+            self.pool.start(_Job(self._signals, batch_id, username,
+                                 lambda u=user_id, n=username: self._build_statement(directory, year, month, u, n)))
+        return "" # مهمة التخطيط لا تنتج ملفًا
+
+    def _build_statement(self, directory, year, month, user_id, username):
+        criteria = month_criteria(year, month, user_id)
+        with read_snapshot() as db:
+            sessions = fetch_session_rows(db, *criteria, order_by=(CashSession.start_time,))
+            totals = fetch_session_totals(db, *criteria)
+        path = os.path.join(directory, f"statement_{year}-{month:02d}_{_file_name(username)}.pdf")
+        return render_pdf(monthly_statement_html(username, year, month, sessions, totals), path)
+
+    # --- النتائج (في خيط الواجهة) ---
+    def _new_batch(self, directory, total):
+        batch_id = next(self._batch_ids)
+        self._batches[batch_id] = {"dir": directory, "total": total, "paths": [], "errors": []}
+        return batch_id
+
+    def _on_batch_planned(self, batch_id, total):
+        self._batches[batch_id]["total"] = total
+        self._finish_if_done(batch_id)
+
+    def _on_job_done(self, batch_id, name, path, error):
+        batch = self._batches.get(batch_id)
+        if batch is None: # دفعة بلا عمال انتهت عند التخطيط
+            return
+        if error:
+            batch["errors"].append(f"{name}: {error}")
+            self.file_failed.emit(name, error)
+            if batch["total"] is None: # فشل التخطيط: لا مهام بعده
+                batch["total"] = 0
+        elif path:
+            batch["paths"].append(path)
+            self.file_ready.emit(path)
+        self._finish_if_done(batch_id)
+
+    def _finish_if_done(self, batch_id):
+        batch = self._batches[batch_id]
+        if batch["total"] is not None and len(batch["paths"]) + len(batch["errors"]) >= batch["total"]:
+            del self._batches[batch_id]
+            self.batch_finished.emit(batch_id, batch["dir"], batch["paths"], batch["errors"])
+
+
+pdf_renderer = None
+
+
+def get_pdf_renderer():
+    global pdf_renderer
+    if pdf_renderer is None:
+        pdf_renderer = PdfRenderer()
+    return pdf_renderer
@@ -0,0 +1,269 @@
+"""
+قياس استعلامات SQL لكل إجراء في الواجهة (اختياري، معطل افتراضيًا).
+
+    with ui_action("تقرير الجلسات"): ...      أو      @ui_action("تقرير الجلسات")
+
+عند التفعيل (enable() أو متغير البيئة CASH_QUERY_STATS=1) تربط أحداث المحرك
+before_cursor_execute/after_cursor_execute، وتجمع لكل إجراء: عدد الاستدعاءات،
+عدد الاستعلامات، مدرج زمني للتأخير، وأكثر الاستعلامات تكرارًا/كلفة.
+
+ui_action(name, max_statements=N) يحدد ميزانية ثابتة لعدد الاستعلامات في الاستدعاء
+الواحد (لا تتغير بعدد الصفوف)؛ تجاوزها يطبع تحذيرًا، أو يرفع StatementBudgetExceeded
+إذا كان CASH_QUERY_BUDGET_STRICT=1، حتى تظهر عودة مشاكل N+1 مباشرة.
+
+add_action_hook(hook) يسمح لوحدات أخرى (مثل action_profiler) بتغليف الإجراءات:
+hook(name, qualname) يعيد مدير سياق يحيط بتنفيذ الإجراء، أو None لتجاهله.
+"""
+import contextlib
+import datetime
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+
+# حدود المدرج الزمني بالمللي ثانية (آخر خانة لما يتجاوز الحد الأخير)
+LATENCY_BUCKETS_MS = (1, 5, 10, 50, 100, 500)
+NO_ACTION = "(خارج إجراء)"
+STRICT_BUDGETS = os.environ.get("CASH_QUERY_BUDGET_STRICT") == "1"
+
+
+class StatementBudgetExceeded(AssertionError):
+    pass
+
+
+def _bucket_labels():
+    labels = [f"<{b}ms" for b in LATENCY_BUCKETS_MS]
+    labels.append(f">={LATENCY_BUCKETS_MS[-1]}ms")
+    return labels
+
+
+def _bucket_index(elapsed_ms):
+    for i, bound in enumerate(LATENCY_BUCKETS_MS):
+        if elapsed_ms < bound:
+            return i
+    return len(LATENCY_BUCKETS_MS)
+
+
+def _normalize_statement(statement):
+    return " ".join(statement.split())
+
+
+class ActionStats:
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.statements = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.budget_violations = 0
+        self.histogram = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.by_statement = {} # نص الاستعلام -> [العدد، الزمن الكلي]
+
+    def record(self, statement, elapsed_ms):
+        self.statements += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        self.histogram[_bucket_index(elapsed_ms)] += 1
+        entry = self.by_statement.setdefault(_normalize_statement(statement), [0, 0.0])
+        entry[0] += 1
+        entry[1] += elapsed_ms
+
+    def top_statements(self, limit=10):
+        ranked = sorted(self.by_statement.items(), key=lambda kv: (kv[1][0], kv[1][1]), reverse=True)
+        return [{"sql": sql, "count": count, "total_ms": round(total, 3)} for sql, (count, total) in ranked[:limit]]
+
+    def as_dict(self, top=10):
+        return {
+            "action": self.name,
+            "calls": self.calls,
+            "statements": self.statements,
+            "statements_per_call": round(self.statements / self.calls, 2) if self.calls else None,
+            "total_ms": round(self.total_ms, 3),
+            "max_ms": round(self.max_ms, 3),
+            "budget_violations": self.budget_violations,
+            "histogram": dict(zip(_bucket_labels(), self.histogram)),
+            "top_statements": self.top_statements(top),
+        }
+
+
+class QueryStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stacks = {} # معرف الخيط -> مكدس الإجراءات (مقروء من خيوط أخرى مثل المراقب)
+        self._engines = []
+        self._watched = [] # محركات إضافية تقاس مع المحرك الرئيسي (مثل محرك لقطات القراءة)
+        self.enabled = False
+        self.actions = {}
+        self.action_hooks = []
+
+    # --- الإجراء الحالي (مكدس لكل خيط حتى تتداخل الإجراءات) ---
+    # كل عنصر [الاسم، عدد الاستعلامات في هذا الاستدعاء، مدراء سياق الخطافات]
+    def _stack(self):
+        ident = threading.get_ident()
+        stack = self._stacks.get(ident)
+        if stack is None:
+            stack = self._stacks[ident] = []
+        return stack
+
+    def action_for_thread(self, ident):
+        try:
+            return self._stacks[ident][-1][0]
+        except (KeyError, IndexError): # الخيط لا ينفذ أي إجراء الآن
+            return None
+
+    def current_action(self):
+        stack = self._stack()
+        return stack[-1][0] if stack else None
+
+    def push_action(self, name, qualname=None):
+        hooks = []
+        for hook in self.action_hooks:
+            cm = hook(name, qualname)
+            if cm is not None:
+                cm.__enter__()
+                hooks.append(cm)
+        self._stack().append([name, 0, hooks])
+        if self.enabled:
+            with self._lock:
+                self._action(name).calls += 1
+
+    def pop_action(self, exc_info=(None, None, None)):
+        # يعيد عدد استعلامات الإجراء نفسه (الإجراءات المتداخلة تحسب لنفسها بميزانيتها)
+        name, executed, hooks = self._stack().pop()
+        for cm in reversed(hooks):
+            cm.__exit__(*exc_info)
+        return executed
+
+    def add_action_hook(self, hook):
+        if hook not in self.action_hooks:
+            self.action_hooks.append(hook)
+
+    def check_budget(self, name, executed, max_statements):
+        if not self.enabled or executed <= max_statements:
+            return
+        with self._lock:
+            self._action(name).budget_violations += 1
+        message = f"تجاوز ميزانية الاستعلامات في '{name}': {executed} > {max_statements}"
+        if STRICT_BUDGETS:
+            raise StatementBudgetExceeded(message)
+        print(f"Warning: {message}")
+
+    def _action(self, name):
+        stats = self.actions.get(name)
+        if stats is None:
+            stats = self.actions[name] = ActionStats(name)
+        return stats
+
+    # --- ربط أحداث المحرك ---
+    def enable(self, engine=None):
+        from sqlalchemy import event
+        if engine is None:
+            from database_setup import engine as main_engine
+            engines = [main_engine] + self._watched
+        else:
+            engines = [engine]
+        for engine in engines:
+            if engine not in self._engines:
+                event.listen(engine, "before_cursor_execute", self._before_cursor_execute)
+                event.listen(engine, "after_cursor_execute", self._after_cursor_execute)
+                self._engines.append(engine)
+        self.enabled = True
+
+    def watch(self, engine):
+        # المحرك يربط الآن إن كان القياس مفعلًا، ومع كل تفعيل لاحق
+        if engine not in self._watched:
+            self._watched.append(engine)
+        if self.enabled:
+            self.enable(engine)
+
+    def disable(self):
+        from sqlalchemy import event
+        for engine in self._engines:
+            event.remove(engine, "before_cursor_execute", self._before_cursor_execute)
+            event.remove(engine, "after_cursor_execute", self._after_cursor_execute)
+        self._engines = []
+        self.enabled = False
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get("query_start_time")
+        if not starts:
+            return
+        elapsed_ms = (time.perf_counter() - starts.pop()) * 1000.0
+        stack = self._stack()
+        if stack:
+            stack[-1][1] += 1
+        name = stack[-1][0] if stack else NO_ACTION
+        with self._lock:
+            self._action(name).record(statement, elapsed_ms)
+
+    # --- القراءة والتصدير ---
+    def reset(self):
+        with self._lock:
+            self.actions = {}
+
+    def snapshot(self, top=10):
+        with self._lock:
+            rows = [stats.as_dict(top) for stats in self.actions.values()]
+        rows.sort(key=lambda r: r["total_ms"], reverse=True)
+        return rows
+
+    def dump_json(self, path, top=20):
+        data = {
+            "generated_at": datetime.datetime.now().isoformat(timespec="seconds"),
+            "latency_buckets_ms": list(LATENCY_BUCKETS_MS),
+            "actions": self.snapshot(top),
+        }
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        return path
+
+
+query_stats = QueryStats()
+
+
+class ui_action(contextlib.ContextDecorator):
+    """
+    يحدد اسم إجراء الواجهة الذي تنسب إليه الاستعلامات المنفذة داخله.
+    """
+    def __init__(self, name, max_statements=None):
+        self.name = name
+        self.max_statements = max_statements
+        self.qualname = None
+
+    def __call__(self, func):
+        # إشارات Qt (مثل clicked) تمرر وسائط إضافية؛ نقص ما لا تقبله الدالة الأصلية
+        code = func.__code__
+        accepts_varargs = bool(code.co_flags & inspect.CO_VARARGS)
+        max_args = code.co_argcount
+        self.qualname = func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not accepts_varargs:
+                args = args[:max_args]
+            with self._recreate_cm():
+                return func(*args, **kwargs)
+        return wrapper
+
+    def __enter__(self):
+        query_stats.push_action(self.name, self.qualname)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        executed = query_stats.pop_action((exc_type, exc, tb))
+        if exc_type is None and self.max_statements is not None:
+            query_stats.check_budget(self.name, executed, self.max_statements)
+        return False
+
+
+def current_action():
+    return query_stats.current_action()
+
+
+if os.environ.get("CASH_QUERY_STATS") == "1":
+    query_stats.enable()
@@ -0,0 +1,366 @@
+"""
+واجهة قراءة HTTP محلية (asyncio، بدون مكتبات خارجية) لمتابعة الأرقام من الهاتف على شبكة المحل.
+
+    python -m read_api --port 8765
+    أو مع التطبيق: CASH_READ_API_PORT=8765 python main.py
+
+النقاط (GET فقط، JSON):
+    /api/status                       الجلسات المفتوحة الآن ومجاميعها الجارية
+    /api/totals?period=last-7-days    مجاميع لوحة المشرف لفترة (أو from=&to=)
+    /api/users?from=2024-01-01&to=... ملخص كل عامل لكل شهر
+    /api/sessions?period=...&user=ali قائمة الجلسات
+    /health
+
+الاستعلامات تعمل في خيوط (بعدد اتصالات مجمع القراءة) على محرك قراءة فقط (create_read_engine)،
+فلا تحجز كتابة الكاشير في وضع WAL. الردود تحفظ مؤقتًا لمدة قصيرة (TTL) والطلبات المتزامنة لنفس
+الرد تنتظر استعلامًا واحدًا، فكثرة العملاء لا تعني كثرة الاستعلامات.
+
+    CASH_READ_API_PORT    منفذ الخدمة عند تشغيلها مع التطبيق (بدونه لا تعمل)
+    CASH_READ_API_HOST    عنوان الاستماع (افتراضيًا 127.0.0.1، أو 0.0.0.0 إذا حدد رمز)
+    CASH_READ_API_TOKEN   إذا حدد، يجب إرساله في ?token= أو الترويسة X-Api-Token؛
+                          بدونه ترفض الخدمة الاستماع على عنوان غير محلي
+"""
+import argparse
+import asyncio
+import concurrent.futures
+import datetime
+import hmac
+import ipaddress
+import json
+import os
+import threading
+import time
+import urllib.parse
+
+from sqlalchemy.orm import Session
+from sqlalchemy import select
+
+from database_setup import create_read_engine, CashSession, User, DB_FILENAME, business_today
+from read_models import fetch_session_rows
+from reporting import period_range, PERIODS, REPORT_BUILDERS
+
+API_TOKEN = os.environ.get("CASH_READ_API_TOKEN") or None
+# بيانات الصندوق لا تفتح لأجهزة الشبكة إلا برمز
+DEFAULT_HOST = os.environ.get("CASH_READ_API_HOST") or ("0.0.0.0" if API_TOKEN else "127.0.0.1")
+DEFAULT_PORT = int(os.environ.get("CASH_READ_API_PORT", "0") or 0)
+READ_POOL_SIZE = 4
+MAX_REQUEST_LINE = 8192 # حد السطر الواحد (سطر الطلب أو ترويسة) في قارئ الاتصال
+MAX_HEADERS = 64
+MAX_HEADER_BYTES = 16384
+
+# النقطة -> مدة صلاحية الرد بالثواني
+ROUTE_TTLS = {
+    "/api/status": 2.0,
+    "/api/totals": 30.0,
+    "/api/users": 60.0,
+    "/api/sessions": 30.0,
+}
+
+STATUS_TEXT = {200: "OK", 400: "Bad Request", 401: "Unauthorized", 404: "Not Found",
+               405: "Method Not Allowed", 431: "Request Header Fields Too Large",
+               500: "Internal Server Error"}
+
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def is_loopback(host):
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError: # اسم مضيف أو عنوان غير صالح: لا نعتبره محليًا
+        return False
+
+
+def _error_body(error):
+    return json.dumps({"error": str(error)}, ensure_ascii=False).encode("utf-8")
+
+
+def _json_default(value):
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    raise TypeError(f"not JSON serializable: {type(value).__name__}")
+
+
+def _date_range(params):
+    try:
+        if "from" in params:
+            start = datetime.date.fromisoformat(params["from"])
+            end = datetime.date.fromisoformat(params["to"]) if "to" in params else business_today()
+            return start, end
+        period = params.get("period", "current-month")
+        if period not in PERIODS:
+            raise ApiError(400, f"period must be one of {', '.join(PERIODS)}")
+        return period_range(period)
+    except ValueError:
+        raise ApiError(400, "dates must be YYYY-MM-DD")
+
+
+def _user_id(db, username):
+    if not username:
+        return None
+    user_id = db.execute(select(User.id).where(User.username == username)).scalar()
+    if user_id is None:
+        raise ApiError(404, f"unknown user: {username}")
+    return user_id
+
+
+# --- النقاط (تعمل في خيط من مجمع القراءة) ---
+def live_status(db, params):
+    rows = fetch_session_rows(db, CashSession.status == 'open')
+    return {"open_sessions": [
+        {"id": r.id, "username": r.username, "start_time": r.start_time,
+         "start_balance": r.start_balance, "start_flexi": r.start_flexi,
+         "total_expense": r.total_expense, "total_flexi_additions": r.total_flexi_additions,
+         "expected_cash": r.start_balance - r.total_expense + r.total_flexi_paid}
+        for r in rows]}
+
+
+def _report_route(report):
+    build = REPORT_BUILDERS[report][0]
+
+    def route(db, params):
+        start, end = _date_range(params)
+        rows = build(db, start, end, _user_id(db, params.get("user")))
+        return {"from": start, "to": end, "rows": rows}
+    return route
+
+
+ROUTES = {
+    "/api/status": live_status,
+    "/api/totals": _report_route("dashboard"),
+    "/api/users": _report_route("users"),
+    "/api/sessions": _report_route("sessions"),
+}
+
+
+class ResponseCache:
+    """
+    ذاكرة مؤقتة بمدة صلاحية، وطلب واحد للقاعدة لكل مفتاح مهما تزامن العملاء (single flight).
+    تستعمل من حلقة asyncio فقط فلا تحتاج قفلًا.
+    """
+    def __init__(self):
+        self._entries = {} # المفتاح -> (وقت الانتهاء، الرد)
+        self._inflight = {} # المفتاح -> Future
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, key, ttl, compute):
+        entry = self._entries.get(key)
+        now = time.monotonic()
+        if entry and entry[0] > now:
+            self.hits += 1
+            return entry[1]
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.hits += 1
+            return await asyncio.shield(inflight)
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await compute()
+            self._entries[key] = (time.monotonic() + ttl, value)
+            future.set_result(value)
+            return value
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception() # لا تحذير "exception was never retrieved" إذا لم ينتظرها أحد
+            raise
+        finally:
+            del self._inflight[key]
+            if len(self._entries) > 256:
+                self._entries = {k: v for k, v in self._entries.items() if v[0] > now}
+
+
+class ReadApiServer:
+    def __init__(self, db_path=DB_FILENAME, host=DEFAULT_HOST, port=DEFAULT_PORT,
+                 token=API_TOKEN, pool_size=READ_POOL_SIZE):
+        if not token and not is_loopback(host):
+            raise ValueError(f"refusing to listen on {host} without CASH_READ_API_TOKEN")
+        self.host = host
+        self.port = port
+        self.token = token
+        self.engine = create_read_engine(db_path, pool_size)
+        # خيط لكل اتصال في المجمع: لا ينتظر أي استعلام اتصالًا
+        self.executor = concurrent.futures.ThreadPoolExecutor(pool_size, thread_name_prefix="ReadApi")
+        self.cache = ResponseCache()
+        self.requests = 0
+        self._server = None
+        self._loop = None
+
+    def _query(self, route, params):
+        with Session(self.engine) as db:
+            return json.dumps(route(db, params), default=_json_default, ensure_ascii=False).encode("utf-8")
+
+    async def handle_request(self, path, params, headers):
+        if path == "/health":
+            return 200, json.dumps({"ok": True, "requests": self.requests, "cache_hits": self.cache.hits,
+                                    "cache_misses": self.cache.misses}).encode("utf-8")
+        route = ROUTES.get(path)
+        if route is None:
+            raise ApiError(404, f"no such endpoint: {path}")
+        supplied = params.pop("token", None) or headers.get("x-api-token", "")
+        if self.token and not hmac.compare_digest(supplied.encode("utf-8"), self.token.encode("utf-8")):
+            raise ApiError(401, "invalid token")
+        key = (path, tuple(sorted(params.items())))
+        loop = asyncio.get_running_loop()
+        body = await self.cache.get(key, ROUTE_TTLS[path],
+                                    lambda: loop.run_in_executor(self.executor, self._query, route, params))
+        return 200, body
+
+    async def _read_head(self, reader):
+        """
+        يقرأ سطر الطلب والترويسات؛ يعيد None إذا أغلق العميل الاتصال، ويرفع ApiError إذا
+        تجاوز سطر حد القارئ أو تجاوزت الترويسات عددها أو حجمها المسموح.
+        """
+        try:
+            request_line = await reader.readline()
+            if not request_line:
+                return None
+            headers = {}
+            size = 0
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    return request_line, headers
+                size += len(line)
+                if len(headers) >= MAX_HEADERS or size > MAX_HEADER_BYTES:
+                    raise ApiError(431, "request headers too large")
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+        except (ValueError, asyncio.LimitOverrunError): # سطر أطول من حد القارئ
+            raise ApiError(400, "request line or header too long")
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True: # keep-alive: نفس الاتصال لعدة طلبات (تحديث دوري من الهاتف)
+                try:
+                    head = await self._read_head(reader)
+                except ApiError as e:
+                    await self._respond(writer, e.status, _error_body(e), close=True)
+                    break
+                if head is None:
+                    break
+                request_line, headers = head
+                self.requests += 1
+                close = headers.get("connection", "").lower() == "close"
+                try:
+                    method, target, _ = request_line.decode("latin-1").split(" ", 2)
+                    if method != "GET":
+                        raise ApiError(405, "read-only API: GET only")
+                    url = urllib.parse.urlsplit(target)
+                    params = dict(urllib.parse.parse_qsl(url.query))
+                    status, body = await self.handle_request(url.path, params, headers)
+                except ApiError as e:
+                    status, body = e.status, _error_body(e)
+                except ValueError:
+                    status, body, close = 400, b'{"error": "malformed request"}', True
+                except Exception as e:
+                    print(f"Read API: request failed: {e}")
+                    status, body = 500, b'{"error": "internal error"}'
+                await self._respond(writer, status, body, close)
+                if close:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, writer, status, body, close=False):
+        head = (f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+                "Content-Type: application/json; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                "Cache-Control: no-store\r\n"
+                f"Connection: {'close' if close else 'keep-alive'}\r\n\r\n")
+        writer.write(head.encode("latin-1") + body)
+        await writer.drain()
+
+    async def serve(self):
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port,
+                                                  limit=MAX_REQUEST_LINE)
+        self._loop = asyncio.get_running_loop()
+        self.port = self._server.sockets[0].getsockname()[1]
+        print(f"Read API listening on http://{self.host}:{self.port}")
+        async with self._server:
+            await self._server.serve_forever()
+
+    def close(self):
+        if self._server is not None:
+            self._server.close()
+        self.executor.shutdown(wait=False)
+        self.engine.dispose()
+
+    def stop(self):
+        """
+        يوقف الخدمة من خيط آخر: يغلق المنفذ، ينتظر الاستعلامات الجارية ثم يغلق اتصالات القراءة.
+        """
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            try:
+                loop.call_soon_threadsafe(self._server.close)
+            except RuntimeError: # انتهت الحلقة بين الفحص والطلب
+                pass
+        self.executor.shutdown(wait=True)
+        self.engine.dispose()
+
+
+read_api_server = None
+
+
+def start_read_api_thread(port=DEFAULT_PORT, host=DEFAULT_HOST):
+    """
+    يشغل الخدمة في خيط خلفي مع التطبيق إذا حدد منفذ (CASH_READ_API_PORT)؛ يعيد الخادم أو None.
+    """
+    global read_api_server
+    if not port:
+        return None
+    try:
+        server = ReadApiServer(host=host, port=port)
+    except ValueError as e:
+        print(f"Read API could not start: {e}")
+        return None
+
+    def run():
+        try:
+            asyncio.run(server.serve())
+        except OSError as e:
+            print(f"Read API could not start: {e}")
+        except asyncio.CancelledError: # أوقفها stop()
+            pass
+    threading.Thread(target=run, name="ReadApi", daemon=True).start()
+    read_api_server = server
+    return server
+
+
+def stop_read_api():
+    global read_api_server
+    if read_api_server is not None:
+        read_api_server.stop()
+        read_api_server = None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="واجهة قراءة HTTP لأرقام الصندوق")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT or 8765)
+    parser.add_argument("--db", default=DB_FILENAME, help="ملف قاعدة البيانات")
+    args = parser.parse_args(argv)
+    try:
+        server = ReadApiServer(args.db, args.host, args.port)
+    except ValueError as e:
+        parser.error(str(e))
+    try:
+        asyncio.run(server.serve())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+"""
+نماذج القراءة: صفوف خفيفة (namedtuple بدون __dict__) تجلب الأعمدة اللازمة للعرض فقط،
+مع مجاميع كل جلسة محسوبة في نفس الاستعلام (أو مقروءة من لقطة الإغلاق للجلسات المغلقة)،
+بدل تحميل كائنات CashSession مع علاقاتها.
+"""
+import datetime
+from collections import namedtuple
+
+from sqlalchemy import select, func, case, extract, and_, tuple_
+
+from database_setup import User, CashSession, Transaction, FlexiTransaction, SessionClosing
+from dto import hybrid_formula
+
+SESSION_ROW_FIELDS = (
+    "id", "user_id", "username", "start_time", "end_time",
+    "start_balance", "end_balance", "start_flexi", "end_flexi", "status", "notes",
+    "total_expense", "total_flexi_paid", "total_flexi_additions",
+)
+
+
+class SessionRow(namedtuple("SessionRowBase", SESSION_ROW_FIELDS)):
+    __slots__ = ()
+
+    gross_income = hybrid_formula('gross_income')
+    net_cash_difference = hybrid_formula('net_cash_difference')
+    flexi_consumed = hybrid_formula('flexi_consumed')
+    net_profit = hybrid_formula('net_profit')
+
+
+def _session_total(column, model, condition=None):
+    # مجموع مرتبط بالجلسة (correlated) يستعمل فهرس session_id
+    amount = case((condition, column), else_=0.0) if condition is not None else column
+    return (select(func.coalesce(func.sum(amount), 0.0))
+            .where(model.session_id == CashSession.id)
+            .correlate(CashSession)
+            .scalar_subquery())
+
+
+def _latest_closing():
+    # آخر مراجعة من لقطة الإغلاق (فهرس session_id, revision الفريد)
+    latest_revision = (select(func.max(SessionClosing.revision))
+                       .where(SessionClosing.session_id == CashSession.id)
+                       .correlate(CashSession)
+                       .scalar_subquery())
+    return and_(SessionClosing.session_id == CashSession.id, SessionClosing.revision == latest_revision)
+
+
+def _closed_or_computed(snapshot_column, computed):
+    # الجلسات المغلقة تقرأ أرقامها من اللقطة؛ coalesce في SQLite لا يقيم المجموع المرتبط
+    # إلا إذا لم توجد لقطة (جلسة مفتوحة)
+    return func.coalesce(snapshot_column, computed)
+
+
+def session_rows_statement(*criteria):
+    return (
+        select(
+            CashSession.id, CashSession.user_id, User.username,
+            CashSession.start_time, CashSession.end_time,
+            CashSession.start_balance, CashSession.end_balance,
+            CashSession.start_flexi, CashSession.end_flexi,
+            CashSession.status, CashSession.notes,
+            _closed_or_computed(SessionClosing.total_expense,
+                _session_total(Transaction.amount, Transaction, Transaction.type == 'expense')).label("total_expense"),
+            _closed_or_computed(SessionClosing.total_flexi_paid,
+                _session_total(FlexiTransaction.amount, FlexiTransaction, FlexiTransaction.is_paid == True)).label("total_flexi_paid"),
+            _closed_or_computed(SessionClosing.total_flexi_additions,
+                _session_total(FlexiTransaction.amount, FlexiTransaction)).label("total_flexi_additions"),
+        )
+        .outerjoin(User, User.id == CashSession.user_id)
+        .outerjoin(SessionClosing, _latest_closing())
+        .where(*criteria)
+    )
+
+
+def fetch_session_rows(db, *criteria, order_by=None, limit=None):
+    """
+    يعيد قائمة SessionRow للجلسات المطابقة للشروط في استعلام واحد.
+    """
+    stmt = session_rows_statement(*criteria)
+    stmt = stmt.order_by(*(order_by if order_by is not None else (CashSession.start_time.desc(),)))
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    return [SessionRow._make(row) for row in db.execute(stmt)]
+
+
+def fetch_session_page(db, *criteria, after=None, page_size=50):
+    """
+    صفحة من الجلسات الأحدث أولًا بترقيم المفتاح (business_day, start_time, id) بدل OFFSET:
+    after هو مؤشر آخر صف في الصفحة السابقة. يعيد (الصفوف، مؤشر الصفحة التالية أو None).
+    اليوم التجاري يتبع start_time فالترتيب نفسه، لكن بدءه به يجعل الفهرس
+    (user_id, business_day, start_time, id) يخدم شرط الفترة والترتيب معًا دون فرز.
+    """
+    key = (CashSession.business_day, CashSession.start_time, CashSession.id)
+    if after is not None:
+        criteria = (*criteria, tuple_(*key) < tuple_(*after))
+    stmt = (session_rows_statement(*criteria).add_columns(CashSession.business_day.label("page_day"))
+            .order_by(*(column.desc() for column in key)).limit(page_size + 1))
+    rows = db.execute(stmt).all()
+    page = [SessionRow._make(row[:-1]) for row in rows[:page_size]]
+    if len(rows) <= page_size:
+        return page, None
+    last = rows[page_size - 1]
+    return page, (last.page_day, last.start_time, last.id)
+
+
+def fetch_user_session_rows(db, user_id):
+    return fetch_session_rows(db, CashSession.user_id == user_id)
+
+
+def fetch_session_status(db, session_id):
+    return db.scalar(select(CashSession.status).where(CashSession.id == session_id))
+
+
+SessionTotals = namedtuple("SessionTotals", (
+    "sessions", "total_expense", "total_flexi_additions", "net_cash_difference", "flexi_consumed",
+))
+
+
+def _derived_columns(sub):
+    # نفس معادلات CashSession (الفرق النقدي والفليكسي المستهلك) فوق صفوف الجلسات
+    net_cash = case(
+        (sub.c.end_balance.is_not(None),
+         sub.c.end_balance - (sub.c.start_balance - sub.c.total_expense + sub.c.total_flexi_paid)),
+        else_=0.0)
+    consumed = case(
+        (sub.c.end_flexi.is_not(None),
+         func.coalesce(sub.c.start_flexi, 0.0) + sub.c.total_flexi_additions - sub.c.end_flexi),
+        else_=0.0)
+    return net_cash, consumed
+
+
+def _summary_columns(sub):
+    net_cash, consumed = _derived_columns(sub)
+    return (
+        func.count(sub.c.id),
+        func.coalesce(func.sum(sub.c.total_expense), 0.0),
+        func.coalesce(func.sum(sub.c.total_flexi_additions), 0.0),
+        func.coalesce(func.sum(net_cash), 0.0),
+        func.coalesce(func.sum(consumed), 0.0),
+    )
+
+
+def fetch_session_totals(db, *criteria):
+    """
+    مجاميع بطاقات الملخص محسوبة في SQL بنفس معادلات CashSession (استعلام واحد).
+    """
+    sub = session_rows_statement(*criteria).subquery()
+    row = db.execute(select(*_summary_columns(sub))).one()
+    return SessionTotals._make(row)
+
+
+UserMonthSummary = namedtuple("UserMonthSummary", ("username", "month") + SessionTotals._fields)
+
+
+def fetch_user_monthly_summaries(db, *criteria):
+    """
+    مجاميع كل عامل لكل شهر (YYYY-MM) في استعلام واحد.
+    """
+    month = func.strftime('%Y-%m', CashSession.business_day).label("month")
+    sub = session_rows_statement(*criteria).add_columns(month).subquery()
+    stmt = (select(sub.c.username, sub.c.month, *_summary_columns(sub))
+            .group_by(sub.c.user_id, sub.c.month)
+            .order_by(sub.c.username, sub.c.month))
+    return [UserMonthSummary._make(row) for row in db.execute(stmt)]
+
+
+SessionMetrics = namedtuple("SessionMetrics", (
+    "id", "user_id", "net_cash_difference", "total_expense", "flexi_consumed",
+))
+
+
+def fetch_closed_session_metrics(db, user_ids=None):
+    """
+    مقاييس الجلسات المغلقة لكل عامل مرتبة زمنيًا (لكشف الشذوذ)، في استعلام واحد.
+    """
+    criteria = [CashSession.status == 'closed']
+    if user_ids is not None:
+        criteria.append(CashSession.user_id.in_(user_ids))
+    sub = session_rows_statement(*criteria).subquery()
+    net_cash, consumed = _derived_columns(sub)
+    stmt = (select(sub.c.id, sub.c.user_id, net_cash, sub.c.total_expense, consumed)
+            .order_by(sub.c.user_id, sub.c.start_time, sub.c.id))
+    return [SessionMetrics._make(row) for row in db.execute(stmt)]
+
+
+def fetch_closings_after(db, closing_id):
+    """
+    {العامل: أكبر معرف لقطة} للقطات الإغلاق الأحدث من closing_id.
+    اللقطات لا تعدل ولا تحذف (إلا مع جلستها)، فمعرفها علامة مائية لكل إغلاق أو تعديل جديد.
+    """
+    stmt = (select(CashSession.user_id, func.max(SessionClosing.id))
+            .join(CashSession, CashSession.id == SessionClosing.session_id)
+            .where(SessionClosing.id > closing_id)
+            .group_by(CashSession.user_id))
+    return dict(db.execute(stmt).all())
+
+
+FlexiClosing = namedtuple("FlexiClosing", ("closing_id", "user_id", "start_time", "end_time", "flexi_consumed"))
+
+
+def fetch_flexi_closings(db, after_id=0):
+    """
+    الفليكسي المستهلك في كل جلسة عند إغلاقها الأول (revision 1) بعد لقطة after_id، بترتيب الإغلاق.
+    """
+    consumed = (func.coalesce(SessionClosing.start_flexi, 0.0) + SessionClosing.total_flexi_additions
+                - SessionClosing.end_flexi)
+    stmt = (select(SessionClosing.id, CashSession.user_id, CashSession.start_time,
+                   func.coalesce(CashSession.end_time, SessionClosing.created_at), consumed)
+            .join(CashSession, CashSession.id == SessionClosing.session_id)
+            .where(SessionClosing.id > after_id, SessionClosing.revision == 1,
+                   SessionClosing.end_flexi.is_not(None))
+            .order_by(SessionClosing.id))
+    return [FlexiClosing._make(row) for row in db.execute(stmt)]
+
+
+def date_range_criteria(start_date, end_date, user_id=None):
+    """
+    شروط الجلسات التي بدأت بين يومين تجاريين (شاملين)، ولعامل محدد اختياريًا.
+    """
+    criteria = [CashSession.business_day >= start_date, CashSession.business_day <= end_date]
+    if user_id:
+        criteria.insert(0, CashSession.user_id == user_id)
+    return criteria
+
+
+def month_criteria(year, month, user_id=None):
+    """
+    شروط جلسات شهر محدد (بالأيام التجارية)، ولعامل محدد اختياريًا.
+    """
+    first_day = datetime.date(year, month, 1)
+    next_month = datetime.date(year + month // 12, month % 12 + 1, 1)
+    criteria = [CashSession.business_day >= first_day, CashSession.business_day < next_month]
+    if user_id:
+        criteria.insert(0, CashSession.user_id == user_id)
+    return criteria
+
+
+def fetch_daily_expenses(db, *criteria):
+    """
+    مجموع المصاريف لكل يوم من الشهر {اليوم: المبلغ} للأيام التي فيها مصاريف.
+    """
+    day = extract('day', CashSession.business_day)
+    stmt = (select(day, func.sum(Transaction.amount))
+            .join(Transaction, Transaction.session_id == CashSession.id)
+            .where(Transaction.type == 'expense', *criteria)
+            .group_by(day))
+    return {int(d): total for d, total in db.execute(stmt) if total}
+
@@ -0,0 +1,260 @@
+"""
+طباعة وصولات حرارية (ESC/POS) بعد كل مصروف وعند إغلاق الجلسة، دون أن ينتظر الكاشير الطابعة.
+
+الواجهة تضع (القالب، القيم) في طابور فقط؛ خيط الطباعة يولد البايتات ويكتبها إلى الطابعة،
+ويعيد المحاولة عند الفشل (طابعة مطفأة أو بلا ورق) مع مهلة متزايدة. القوالب تترجم مرة واحدة
+عند الاستيراد إلى أجزاء جاهزة: أوامر ESC/POS كبايتات ثابتة ونص format جاهز، فتوليد الوصل هو
+format ثم encode فقط.
+
+    CASH_PRINTER           وجهة الطابعة (بدونها الطباعة معطلة):
+                               tcp://192.168.1.50:9100   طابعة شبكة (منفذ RAW)
+                               file:///dev/usb/lp0       جهاز USB/تسلسلي أو ملف (للاختبار)
+    CASH_PRINTER_WIDTH     عدد الأحرف في السطر (افتراضيًا 42 لورق 80 مم، و 32 لورق 58 مم)
+    CASH_PRINTER_CODEPAGE  ترميز النص (افتراضيًا cp1256؛ الطابعة يجب أن تدعم العربية)
+
+للاختبار بدون طابعة: CASH_PRINTER=file:///tmp/slips.bin أو خادم TCP محلي يستقبل البايتات.
+"""
+import datetime
+import os
+import queue
+import socket
+import threading
+import time
+import urllib.parse
+
+DEFAULT_TARGET = os.environ.get("CASH_PRINTER", "")
+DEFAULT_WIDTH = int(os.environ.get("CASH_PRINTER_WIDTH", "42"))
+DEFAULT_CODEPAGE = os.environ.get("CASH_PRINTER_CODEPAGE", "cp1256")
+MAX_ATTEMPTS = 5
+RETRY_DELAY_SECONDS = 2.0
+TCP_TIMEOUT_SECONDS = 5.0
+
+# --- أوامر ESC/POS ---
+ESC, GS = b"\x1b", b"\x1d"
+INIT = ESC + b"@"
+ALIGN_LEFT, ALIGN_CENTER, ALIGN_RIGHT = ESC + b"a\x00", ESC + b"a\x01", ESC + b"a\x02"
+BOLD_ON, BOLD_OFF = ESC + b"E\x01", ESC + b"E\x00"
+DOUBLE_ON, DOUBLE_OFF = GS + b"!\x11", GS + b"!\x00"
+FEED_AND_CUT = ESC + b"d\x04" + GS + b"V\x01"
+# رقم صفحة الترميز في أمر ESC t حسب جدول Epson
+CODEPAGE_IDS = {"cp437": 0, "cp850": 2, "cp1252": 16, "cp864": 37, "cp1256": 50}
+
+
+class SlipTemplate:
+    """
+    قالب وصل مترجم مسبقًا. كل سطر واحد من:
+        ("title", نص)               عنوان بخط مضاعف في الوسط
+        ("center", نص) / ("text", نص)
+        ("pair", تسمية, "{حقل}")    تسمية ثم القيمة محاذاة إلى طرف السطر
+        ("rule",)                   خط فاصل
+    النصوص تقبل حقول format مثل {username}.
+    """
+    def __init__(self, lines, width=DEFAULT_WIDTH, codepage=DEFAULT_CODEPAGE):
+        self.codepage = codepage
+        header = INIT + ESC + b"t" + bytes([CODEPAGE_IDS.get(codepage, 0)])
+        self._parts = [] # (بايتات ثابتة، نص format)
+        pending = header
+        for kind, *args in lines:
+            if kind == "title":
+                prefix, text, suffix = ALIGN_CENTER + BOLD_ON + DOUBLE_ON, args[0], DOUBLE_OFF + BOLD_OFF + ALIGN_LEFT
+            elif kind == "center":
+                prefix, text, suffix = ALIGN_CENTER, args[0], ALIGN_LEFT
+            elif kind == "text":
+                prefix, text, suffix = b"", args[0], b""
+            elif kind == "pair":
+                label, field = args
+                # القيمة تحاذى بعرض ثابت = عرض السطر - طول التسمية (معروف عند الترجمة)
+                prefix, text, suffix = b"", label + "{" + field.strip("{}") + ":>" + str(max(width - len(label), 1)) + "}", b""
+            elif kind == "rule":
+                prefix, text, suffix = b"", "-" * width, b""
+            else:
+                raise ValueError(f"unknown slip line: {kind}")
+            self._parts.append((pending + prefix, text + "\n"))
+            pending = suffix
+        self._tail = pending + FEED_AND_CUT
+
+    def render(self, values):
+        return b"".join(prefix + text.format_map(values).encode(self.codepage, "replace")
+                        for prefix, text in self._parts) + self._tail
+
+
+def _money(value):
+    return f"{value:,.2f}" if value is not None else "N/A"
+
+
+EXPENSE_LINES = [
+    ("title", "وصل مصروف"),
+    ("center", "{time}"),
+    ("rule",),
+    ("pair", "العامل:", "{username}"),
+    ("pair", "الجلسة:", "{session_id}"),
+    ("pair", "المبلغ:", "{amount}"),
+    ("text", "{description}"),
+    ("rule",),
+]
+
+CLOSING_LINES = [
+    ("title", "إغلاق الصندوق"),
+    ("center", "{time}"),
+    ("rule",),
+    ("pair", "العامل:", "{username}"),
+    ("pair", "الجلسة:", "{session_id}"),
+    ("rule",),
+    ("pair", "رصيد البداية:", "{start_balance}"),
+    ("pair", "المصاريف:", "{total_expense}"),
+    ("pair", "الرصيد النظري:", "{theoretical_cash}"),
+    ("pair", "الرصيد الفعلي:", "{end_balance}"),
+    ("pair", "الفرق:", "{net_cash_difference}"),
+    ("rule",),
+    ("pair", "فليكسي البداية:", "{start_flexi}"),
+    ("pair", "الإضافات:", "{total_flexi_additions}"),
+    ("pair", "فليكسي النهاية:", "{end_flexi}"),
+    ("pair", "المستهلك:", "{flexi_consumed}"),
+    ("rule",),
+]
+
+
+# --- وجهات الطباعة ---
+class FileTarget:
+    def __init__(self, path):
+        self.path = path
+
+    def write(self, data):
+        with open(self.path, "ab") as device:
+            device.write(data)
+
+    def __str__(self):
+        return self.path
+
+
+class TcpTarget:
+    def __init__(self, host, port=9100, timeout=TCP_TIMEOUT_SECONDS):
+        self.host, self.port, self.timeout = host, port, timeout
+
+    def write(self, data):
+        with socket.create_connection((self.host, self.port), timeout=self.timeout) as conn:
+            conn.sendall(data)
+
+    def __str__(self):
+        return f"{self.host}:{self.port}"
+
+
+def target_from_url(url):
+    if not url:
+        return None
+    parsed = urllib.parse.urlsplit(url)
+    if parsed.scheme == "tcp":
+        return TcpTarget(parsed.hostname, parsed.port or 9100)
+    if parsed.scheme == "file":
+        path = parsed.path
+        if len(path) > 2 and path[0] == "/" and path[2] == ":": # file:///C:/... في ويندوز
+            path = path[1:]
+        return FileTarget(path)
+    if not parsed.scheme:
+        return FileTarget(url)
+    raise ValueError(f"unsupported printer target: {url}")
+
+
+class ReceiptPrinter:
+    def __init__(self, target=None, width=DEFAULT_WIDTH, codepage=DEFAULT_CODEPAGE,
+                 max_attempts=MAX_ATTEMPTS, retry_delay=RETRY_DELAY_SECONDS):
+        self.target = target
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.expense_template = SlipTemplate(EXPENSE_LINES, width, codepage)
+        self.closing_template = SlipTemplate(CLOSING_LINES, width, codepage)
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.printed = 0
+        self.dropped = 0
+        self.last_error = None
+
+    @property
+    def enabled(self):
+        return self.target is not None
+
+    # --- واجهة الاستعمال (خيط الواجهة: وضع في الطابور فقط) ---
+    def submit(self, template, values):
+        if self.target is None:
+            return False
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="ReceiptPrinter", daemon=True)
+                self._thread.start()
+        self._queue.put((template, values))
+        return True
+
+    def print_expense(self, username, values):
+        # values: قيم سجل طابور الكتابة (write_queue.expense_write)
+        return self.submit(self.expense_template, {
+            "time": _now_text(), "username": username, "session_id": values["session_id"],
+            "amount": _money(values["amount"]), "description": values.get("description") or "",
+        })
+
+    def print_closing(self, username, session):
+        return self.submit(self.closing_template, {
+            "time": _now_text(), "username": username, "session_id": session.id,
+            "start_balance": _money(session.start_balance), "total_expense": _money(session.total_expense),
+            "theoretical_cash": _money(session.start_balance - session.total_expense + session.total_flexi_paid),
+            "end_balance": _money(session.end_balance), "net_cash_difference": f"{session.net_cash_difference:+,.2f}",
+            "start_flexi": _money(session.start_flexi), "total_flexi_additions": _money(session.total_flexi_additions),
+            "end_flexi": _money(session.end_flexi), "flexi_consumed": _money(session.flexi_consumed),
+        })
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def join(self, timeout=5.0):
+        """
+        ينتظر انتهاء كل المهام (للاختبار والإغلاق)؛ يعيد False إذا انتهت المهلة.
+        """
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    # --- خيط الطباعة ---
+    def _run(self):
+        while True:
+            template, values = self._queue.get()
+            try:
+                self._print(template.render(values))
+            except Exception as e: # قالب أو قيم خاطئة: لا فائدة من إعادة المحاولة
+                self.dropped += 1
+                self.last_error = str(e)
+                print(f"Receipt printer: could not render slip: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _print(self, data):
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                self.target.write(data)
+                self.printed += 1
+                self.last_error = None
+                return
+            except OSError as e:
+                self.last_error = str(e)
+                print(f"Receipt printer: {self.target} failed ({e}), attempt {attempt}/{self.max_attempts}")
+                if attempt < self.max_attempts:
+                    time.sleep(self.retry_delay * attempt)
+        self.dropped += 1
+        print(f"Receipt printer: slip dropped after {self.max_attempts} attempts")
+
+
+def _now_text():
+    return datetime.datetime.now().strftime("%Y-%m-%d %H:%M")
+
+
+def _default_target():
+    try:
+        return target_from_url(DEFAULT_TARGET)
+    except ValueError as e:
+        print(f"Receipt printer disabled: {e}")
+        return None
+
+
+receipt_printer = ReceiptPrinter(_default_target())
@@ -0,0 +1,153 @@
+"""
+تقارير بدون واجهة رسومية (لا تستورد PyQt6) لتشغيلها من cron على كل جهاز.
+
+    python -m reporting dashboard --period current-month
+    python -m reporting users --from 2024-01-01 --to 2024-03-31 --format csv -o users.csv
+    python -m reporting sessions --period last-7-days --user ali --db /path/cash_register.db
+
+كل التقارير تستعمل نفس استعلامات التجميع في read_models التي تعرضها لوحة المشرف،
+فكل تقرير استعلام SQL واحد مهما كان عدد الجلسات.
+"""
+import argparse
+import csv
+import datetime
+import json
+import os
+import sys
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from database_setup import create_read_engine, User, DB_FILENAME, business_today
+from read_models import (fetch_session_rows, fetch_session_totals, fetch_user_monthly_summaries,
+                         date_range_criteria, SESSION_ROW_FIELDS, SessionTotals, UserMonthSummary)
+
+PERIODS = ("current-month", "last-month", "last-7-days", "last-30-days")
+REPORTS = ("dashboard", "users", "sessions")
+SESSION_FIELDS = SESSION_ROW_FIELDS + ("net_cash_difference", "flexi_consumed")
+
+
+def period_range(period, today=None):
+    """
+    (البداية، النهاية) لفترات لوحة المشرف.
+    """
+    today = today or business_today()
+    if period == "current-month":
+        return today.replace(day=1), today
+    if period == "last-month":
+        end = today.replace(day=1) - datetime.timedelta(days=1)
+        return end.replace(day=1), end
+    if period == "last-7-days":
+        return today - datetime.timedelta(days=6), today
+    if period == "last-30-days":
+        return today - datetime.timedelta(days=29), today
+    raise ValueError(f"unknown period: {period}")
+
+
+def dashboard_metrics(db, start_date, end_date, user_id=None):
+    totals = fetch_session_totals(db, *date_range_criteria(start_date, end_date, user_id))
+    return [totals._asdict()]
+
+
+def user_monthly_summaries(db, start_date, end_date, user_id=None):
+    return [row._asdict() for row in
+            fetch_user_monthly_summaries(db, *date_range_criteria(start_date, end_date, user_id))]
+
+
+def session_listing(db, start_date, end_date, user_id=None):
+    rows = fetch_session_rows(db, *date_range_criteria(start_date, end_date, user_id))
+    return [{field: getattr(row, field) for field in SESSION_FIELDS} for row in rows]
+
+
+# التقرير -> (الدالة، أعمدة CSV)
+REPORT_BUILDERS = {
+    "dashboard": (dashboard_metrics, SessionTotals._fields),
+    "users": (user_monthly_summaries, UserMonthSummary._fields),
+    "sessions": (session_listing, SESSION_FIELDS),
+}
+
+
+def _plain(value):
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    if isinstance(value, float):
+        return round(value, 2)
+    return value
+
+
+def write_json(records, out, meta):
+    json.dump({**meta, "rows": [{k: _plain(v) for k, v in r.items()} for r in records]},
+              out, ensure_ascii=False, indent=2)
+    out.write("\n")
+
+
+def write_csv(records, out, fieldnames):
+    writer = csv.DictWriter(out, fieldnames=fieldnames)
+    writer.writeheader()
+    for record in records:
+        writer.writerow({k: _plain(v) for k, v in record.items()})
+
+
+def _parse_date(value):
+    try:
+        return datetime.date.fromisoformat(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"تاريخ غير صالح (YYYY-MM-DD): {value}")
+
+
+def run_report(report, start_date, end_date, username=None, db_path=DB_FILENAME):
+    # اتصال قراءة فقط: تقرير cron لا يفتح القاعدة للكتابة ولا ينشئ ملفًا إذا كان المسار خاطئًا
+    read_engine = create_read_engine(db_path, pool_size=1)
+    try:
+        with Session(read_engine) as db:
+            user_id = None
+            if username:
+                user_id = db.execute(select(User.id).where(User.username == username)).scalar()
+                if user_id is None:
+                    raise LookupError(f"unknown user: {username}")
+            return REPORT_BUILDERS[report][0](db, start_date, end_date, user_id)
+    finally:
+        read_engine.dispose()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="تقارير الصندوق بدون واجهة (JSON/CSV)")
+    parser.add_argument("report", choices=REPORTS)
+    parser.add_argument("--period", choices=PERIODS, default="current-month")
+    parser.add_argument("--from", dest="start", type=_parse_date, help="بداية الفترة YYYY-MM-DD (بدل --period)")
+    parser.add_argument("--to", dest="end", type=_parse_date, help="نهاية الفترة YYYY-MM-DD (افتراضيًا اليوم)")
+    parser.add_argument("--user", help="اسم العامل")
+    parser.add_argument("--format", choices=("json", "csv"), default="json")
+    parser.add_argument("-o", "--output", help="ملف الناتج (افتراضيًا المخرج القياسي)")
+    parser.add_argument("--db", default=DB_FILENAME, help="ملف قاعدة البيانات")
+    args = parser.parse_args(argv)
+    if not os.path.exists(args.db):
+        parser.error(f"database file not found: {args.db}")
+
+    if args.start:
+        start_date, end_date = args.start, args.end or business_today()
+    else:
+        start_date, end_date = period_range(args.period)
+
+    try:
+        records = run_report(args.report, start_date, end_date, args.user, args.db)
+    except LookupError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+    out = open(args.output, "w", encoding="utf-8", newline="") if args.output else sys.stdout
+    try:
+        if args.format == "json":
+            meta = {"report": args.report, "from": start_date.isoformat(), "to": end_date.isoformat(),
+                    "user": args.user, "generated_at": datetime.datetime.now().isoformat(timespec="seconds")}
+            write_json(records, out, meta)
+        else:
+            write_csv(records, out, REPORT_BUILDERS[args.report][1])
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,64 @@
+import html
+import re
+from sqlalchemy import text
+
+from database_setup import SEARCH_KIND_TRANSACTION, SEARCH_KIND_FLEXI
+
+# علامات مؤقتة لتمييز الكلمات المطابقة قبل تهريب HTML
+_HIGHLIGHT_START = "\x02"
+_HIGHLIGHT_END = "\x03"
+
+_SEARCH_SQL = text(f"""
+    SELECT
+        s.rowid AS entry_id,
+        s.kind AS kind,
+        s.session_id AS session_id,
+        snippet(search_index, 0, char(2), char(3), '…', 12) AS snippet,
+        bm25(search_index) AS rank,
+        cs.start_time AS start_time,
+        u.username AS username,
+        coalesce(t.amount, f.amount) AS amount
+    FROM search_index s
+    JOIN cash_sessions cs ON cs.id = s.session_id
+    LEFT JOIN users u ON u.id = cs.user_id
+    LEFT JOIN transactions t ON s.rowid % 4 = {SEARCH_KIND_TRANSACTION} AND t.id = s.rowid / 4
+    LEFT JOIN flexi_transactions f ON s.rowid % 4 = {SEARCH_KIND_FLEXI} AND f.id = s.rowid / 4
+    WHERE search_index MATCH :match
+    ORDER BY rank
+    LIMIT :limit OFFSET :offset
+""")
+
+_COUNT_SQL = text("SELECT count(*) FROM search_index WHERE search_index MATCH :match")
+
+
+def build_match_query(user_text):
+    """
+    يحول نص المستخدم إلى تعبير MATCH آمن: كل كلمة بين علامتي تنصيص، والكلمة الأخيرة كبادئة.
+    """
+    terms = [t for t in re.split(r"\s+", user_text.strip()) if t]
+    if not terms:
+        return None
+    quoted = ['"' + t.replace('"', '""') + '"' for t in terms]
+    quoted[-1] += "*"
+    return " ".join(quoted)
+
+
+def highlight_snippet(snippet):
+    """يهرب نص المقتطف ويحول علامات التمييز إلى <b> لعرضه في QLabel."""
+    escaped = html.escape(snippet or "")
+    return escaped.replace(_HIGHLIGHT_START, "<b>").replace(_HIGHLIGHT_END, "</b>")
+
+
+def search_transactions(db, user_text, page=0, page_size=25):
+    """
+    يبحث في المصاريف والفليكسي وملاحظات الجلسات عبر فهرس FTS5.
+    - يعيد (النتائج، العدد الكلي) مرتبة حسب bm25 ومقسمة إلى صفحات.
+    """
+    match = build_match_query(user_text)
+    if match is None:
+        return [], 0
+    total = db.execute(_COUNT_SQL, {"match": match}).scalar_one()
+    if total == 0:
+        return [], 0
+    rows = db.execute(_SEARCH_SQL, {"match": match, "limit": page_size, "offset": page * page_size}).all()
+    return rows, total
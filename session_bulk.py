@@ -0,0 +1,69 @@
+"""
+عمليات المشرف المجمعة على الجلسات المحددة في تقرير الجلسات: حذف، نقل إلى عامل آخر، وإغلاق
+الجلسات المفتوحة المتروكة؛ وإغلاق الكاشير لجلسته (close_session).
+
+كل عملية جمل Core قليلة ثابتة العدد (WHERE id IN ...) داخل معاملة واحدة، مهما كان عدد الجلسات،
+بدل تحميل كل جلسة وحذفها أو تعديلها كائنًا بكائن. المشغلات تبقى كما هي: فهرس البحث، الأوصاف،
+ولقطات الإغلاق (الإغلاق بتحديث status ينشئ لقطة كل جلسة).
+"""
+import datetime
+import os
+
+from sqlalchemy import delete, update, func
+
+from database_setup import CashSession, Transaction, FlexiTransaction
+from read_models import fetch_session_rows
+
+# الجلسة المفتوحة تعتبر متروكة بعد هذه المدة (حتى لا تغلق جلسة كاشير يعمل الآن)
+STALE_SESSION_HOURS = float(os.environ.get("CASH_STALE_SESSION_HOURS", "24"))
+STALE_CLOSE_NOTE = "أغلقت من المشرف (جلسة متروكة بدون جرد)"
+
+
+def delete_sessions(db, session_ids):
+    """
+    يحذف الجلسات مع عملياتها؛ يعيد عدد الجلسات المحذوفة.
+    """
+    # الجلسات أولًا: مشغل حذف العمليات لا يضيف لقطات إغلاق لجلسة لم تعد موجودة
+    deleted = db.execute(delete(CashSession).where(CashSession.id.in_(session_ids))).rowcount
+    db.execute(delete(Transaction).where(Transaction.session_id.in_(session_ids)))
+    db.execute(delete(FlexiTransaction).where(FlexiTransaction.session_id.in_(session_ids)))
+    return deleted
+
+
+def reassign_sessions(db, session_ids, user_id):
+    """
+    ينقل الجلسات (وعمليات الفليكسي المسجلة باسم العامل) إلى عامل آخر؛ يعيد عدد الجلسات.
+    """
+    moved = db.execute(update(CashSession).where(CashSession.id.in_(session_ids))
+                       .values(user_id=user_id)).rowcount
+    db.execute(update(FlexiTransaction).where(FlexiTransaction.session_id.in_(session_ids))
+               .values(user_id=user_id))
+    return moved
+
+
+def close_stale_sessions(db, session_ids, stale_hours=STALE_SESSION_HOURS, now=None):
+    """
+    يغلق الجلسات المفتوحة منذ أكثر من stale_hours ساعة من بين المحددة، دون أرصدة نهاية
+    (لم يتم جرد)؛ يعيد عدد الجلسات المغلقة.
+    """
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    cutoff = now - datetime.timedelta(hours=stale_hours)
+    stmt = (update(CashSession)
+            .where(CashSession.id.in_(session_ids), CashSession.status == 'open', CashSession.start_time < cutoff)
+            .values(status='closed', end_time=now,
+                    notes=func.coalesce(CashSession.notes + "\n", "") + STALE_CLOSE_NOTE))
+    return db.execute(stmt).rowcount
+
+
+def close_session(db, session_id, end_balance, end_flexi, end_time):
+    """
+    يغلق جلسة الكاشير بأرصدة النهاية إن كانت لا تزال مفتوحة، ويعيد صفها بعد الإغلاق (SessionRow
+    بأرقام لقطة الإغلاق)، أو None إذا أغلقت قبل ذلك (من المشرف مثلًا). اللقطة يضيفها مشغل الإغلاق
+    من العمليات المحفوظة في نفس المعاملة (مراجعة max(revision)+1)، لا من أرقام الواجهة.
+    """
+    stmt = (update(CashSession)
+            .where(CashSession.id == session_id, CashSession.status == 'open')
+            .values(end_balance=end_balance, end_flexi=end_flexi, status='closed', end_time=end_time))
+    if not db.execute(stmt).rowcount:
+        return None
+    return fetch_session_rows(db, CashSession.id == session_id)[0]
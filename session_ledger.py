@@ -0,0 +1,86 @@
+"""
+دفتر الجلسة المفتوحة: مجاميع جارية تحدث مع كل إضافة/تعديل/حذف بدل جمع كل العمليات
+عند الإغلاق. ملخص CloseCashDialog يؤخذ منه مباشرة دون أي استعلام (لقطة الإغلاق نفسها
+يحسبها مشغل الإغلاق من العمليات المحفوظة).
+
+يبنى مرة واحدة من SessionDTO المحمل (مجاميعه محسوبة مسبقًا)، ثم:
+    apply_write(record) / discard_write(record)   لعمليات طابور الكتابة
+    edit_expense(...) / remove_expense(...)        بعد نجاح التعديل أو الحذف في القاعدة
+"""
+class SessionLedger:
+    def __init__(self, session_id, start_balance=0.0, start_flexi=None):
+        self.session_id = session_id
+        self.start_balance = start_balance or 0.0
+        self.start_flexi = start_flexi
+        self.total_expense = 0.0
+        self.total_flexi_paid = 0.0
+        self.total_flexi_additions = 0.0
+        self.transaction_count = 0
+        self.flexi_count = 0
+
+    @classmethod
+    def from_session(cls, session):
+        ledger = cls(session.id, session.start_balance, session.start_flexi)
+        ledger.total_expense = session.total_expense
+        ledger.total_flexi_paid = session.total_flexi_paid
+        ledger.total_flexi_additions = session.total_flexi_additions
+        ledger.transaction_count = len(session.transactions)
+        ledger.flexi_count = len(session.flexi_transactions)
+        return ledger
+
+    # --- المصاريف ---
+    def add_expense(self, amount, type='expense'):
+        self.transaction_count += 1
+        if type == 'expense':
+            self.total_expense += amount
+
+    def edit_expense(self, old_amount, new_amount, type='expense'):
+        if type == 'expense':
+            self.total_expense += new_amount - old_amount
+
+    def remove_expense(self, amount, type='expense'):
+        self.transaction_count -= 1
+        if type == 'expense':
+            self.total_expense -= amount
+
+    # --- الفليكسي ---
+    def add_flexi(self, amount, is_paid):
+        self.flexi_count += 1
+        self.total_flexi_additions += amount
+        if is_paid:
+            self.total_flexi_paid += amount
+
+    def remove_flexi(self, amount, is_paid):
+        self.flexi_count -= 1
+        self.total_flexi_additions -= amount
+        if is_paid:
+            self.total_flexi_paid -= amount
+
+    # --- عمليات طابور الكتابة ---
+    def apply_write(self, record):
+        values = record["values"]
+        if values.get("session_id") != self.session_id:
+            return
+        if record["kind"] == "expense":
+            self.add_expense(values["amount"], values.get("type", "expense"))
+        else:
+            self.add_flexi(values["amount"], values.get("is_paid", False))
+
+    def discard_write(self, record):
+        # عملية رفضها الطابور: نلغي أثرها المتفائل
+        values = record["values"]
+        if values.get("session_id") != self.session_id:
+            return
+        if record["kind"] == "expense":
+            self.remove_expense(values["amount"], values.get("type", "expense"))
+        else:
+            self.remove_flexi(values["amount"], values.get("is_paid", False))
+
+    # --- الإغلاق ---
+    def summary(self):
+        return {
+            "start_balance": self.start_balance,
+            "total_expense": self.total_expense,
+            "start_flexi": self.start_flexi or 0.0,
+            "total_flexi_additions": self.total_flexi_additions,
+        }
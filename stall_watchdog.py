@@ -0,0 +1,118 @@
+"""
+مراقب تجمد الواجهة: مؤقت QTimer في الخيط الرئيسي يسجل نبضة دورية، وخيط مراقب
+يفحص عمر آخر نبضة. إذا تجاوز الحد (CASH_STALL_THRESHOLD_MS، افتراضيًا 1000)
+يلتقط مكدس بايثون للخيط الرئيسي عبر sys._current_frames مع اسم إجراء الواجهة
+الجاري (ui_action)، ويكتبه في سجل دوار stall_log.txt.
+"""
+import collections
+import datetime
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from logging.handlers import RotatingFileHandler
+
+from PyQt6.QtCore import QTimer
+
+from query_stats import query_stats
+
+STALL_LOG_FILENAME = "stall_log.txt"
+HEARTBEAT_INTERVAL_MS = 100
+DEFAULT_THRESHOLD_MS = int(os.environ.get("CASH_STALL_THRESHOLD_MS", "1000"))
+
+StallRecord = collections.namedtuple("StallRecord", "started_at duration_ms action stack")
+
+
+def _stall_logger(path):
+    logger = logging.getLogger("cash_register.stalls")
+    if not logger.handlers:
+        handler = RotatingFileHandler(path, maxBytes=512 * 1024, backupCount=3, encoding="utf-8", delay=True)
+        handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+    return logger
+
+
+class StallWatchdog:
+    def __init__(self, threshold_ms=DEFAULT_THRESHOLD_MS, log_path=STALL_LOG_FILENAME):
+        self.threshold = threshold_ms / 1000.0
+        self.log_path = log_path
+        self.logger = _stall_logger(log_path)
+        self.recent = collections.deque(maxlen=50)
+        self._main_ident = threading.main_thread().ident
+        self._last_beat = time.monotonic()
+        self._stop = threading.Event()
+        self._timer = None
+        self._thread = None
+
+    def start(self):
+        # يجب استدعاؤها من الخيط الرئيسي بعد إنشاء QApplication
+        self._timer = QTimer()
+        self._timer.timeout.connect(self._beat)
+        self._timer.start(HEARTBEAT_INTERVAL_MS)
+        self._last_beat = time.monotonic()
+        self._thread = threading.Thread(target=self._watch, name="StallWatchdog", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._timer is not None:
+            self._timer.stop()
+
+    def _beat(self):
+        self._last_beat = time.monotonic()
+
+    def _watch(self):
+        stalled_since = None
+        record = None
+        while not self._stop.wait(HEARTBEAT_INTERVAL_MS / 1000.0):
+            last_beat = self._last_beat
+            blocked = time.monotonic() - last_beat
+            if blocked < self.threshold:
+                if record is not None:
+                    # انتهى التجمد: نسجل مدته الكاملة
+                    self._log_recovery(record, (self._last_beat - stalled_since) * 1000.0)
+                    record = None
+                continue
+            if record is None:
+                stalled_since = last_beat
+                record = self._capture(last_beat, blocked)
+
+    def _capture(self, last_beat, blocked):
+        frame = sys._current_frames().get(self._main_ident)
+        stack = "".join(traceback.format_stack(frame)) if frame is not None else "(المكدس غير متاح)\n"
+        action = query_stats.action_for_thread(self._main_ident) or "-"
+        started_at = datetime.datetime.now() - datetime.timedelta(seconds=time.monotonic() - last_beat)
+        record = StallRecord(started_at, blocked * 1000.0, action, stack)
+        self.recent.append(record)
+        self.logger.warning("STALL action=%s blocked>=%.0fms since=%s\n%s",
+                            action, blocked * 1000.0, started_at.strftime("%H:%M:%S"), stack)
+        return record
+
+    def _log_recovery(self, record, duration_ms):
+        if self.recent and self.recent[-1] is record:
+            self.recent[-1] = record._replace(duration_ms=duration_ms)
+        self.logger.warning("RECOVERED action=%s total=%.0fms", record.action, duration_ms)
+
+
+watchdog = None
+
+
+def start_watchdog(threshold_ms=DEFAULT_THRESHOLD_MS):
+    global watchdog
+    if watchdog is None:
+        watchdog = StallWatchdog(threshold_ms)
+        watchdog.start()
+    return watchdog
+
+
+def read_stall_log(max_chars=200_000):
+    path = watchdog.log_path if watchdog is not None else STALL_LOG_FILENAME
+    try:
+        with open(path, encoding="utf-8") as f:
+            return f.read()[-max_chars:]
+    except FileNotFoundError:
+        return ""
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# وحدات التطبيق في جذر المستودع (بدون حزمة)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,115 @@
+"""
+عدد الاستعلامات في كل استدعاء لنماذج القراءة يجب ألا يتغير بعدد الصفوف: نقيسه على قاعدة
+مؤقتة بـ N جلسة ثم بـ 10×N جلسة ونقارن، حتى تفشل عودة مشاكل N+1 في الاختبار لا في الإنتاج.
+"""
+import datetime
+
+import pytest
+from sqlalchemy import create_engine, update
+from sqlalchemy.orm import sessionmaker
+
+import dto
+import read_models
+from database_setup import (Base, User, CashSession, Transaction, FlexiTransaction, intern_descriptions,
+                            create_search_index, create_description_index, create_closing_snapshots)
+from query_stats import query_stats
+
+SESSIONS = 5
+
+
+@pytest.fixture
+def db(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'cash_register.db'}")
+    Base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        create_search_index(connection)
+        create_description_index(connection)
+        create_closing_snapshots(connection)
+    session = sessionmaker(bind=engine)()
+    user = User(username="worker", role="user")
+    user.set_password("worker")
+    session.add(user)
+    session.commit()
+    query_stats.enable(engine)
+    try:
+        yield session
+    finally:
+        query_stats.disable()
+        query_stats.reset()
+        session.close()
+        engine.dispose()
+
+
+def seed_sessions(db, count):
+    # نصف الجلسات تغلق بتحديث status حتى تقرأ التقارير من لقطات الإغلاق أيضًا
+    user = db.query(User).filter_by(username="worker").one()
+    start = datetime.datetime(2026, 1, 1, 8, 0)
+    first = db.query(CashSession).count()
+    descriptions = intern_descriptions(db.connection(), [("expense", f"مصروف {n}") for n in range(3)] + [("flexi", "فليكسي")])
+    sessions = []
+    for i in range(first, first + count):
+        session = CashSession(user_id=user.id, start_balance=1000.0, start_flexi=500.0,
+                              start_time=start + datetime.timedelta(hours=i))
+        session.transactions = [Transaction(type='expense', amount=10.0 + n,
+                                            description_id=descriptions[("expense", f"مصروف {n}")])
+                                for n in range(3)]
+        session.flexi_transactions = [FlexiTransaction(user_id=user.id, amount=50.0, is_paid=n == 0,
+                                                       description_id=descriptions[("flexi", "فليكسي")])
+                                      for n in range(2)]
+        sessions.append(session)
+    db.add_all(sessions)
+    db.flush()
+    closed = [s.id for s in sessions[::2]]
+    last_id = sessions[-1].id
+    db.execute(update(CashSession).where(CashSession.id.in_(closed))
+               .values(status='closed', end_balance=1200.0, end_flexi=400.0))
+    db.commit()
+    db.expunge_all()
+    return last_id
+
+
+def count_statements(call):
+    query_stats.push_action("test")
+    try:
+        call()
+    finally:
+        executed = query_stats.pop_action()
+    return executed
+
+
+def read_calls(db, session_id):
+    user_id = db.query(User.id).filter_by(username="worker").scalar()
+    return {
+        "fetch_session_rows": lambda: read_models.fetch_session_rows(db),
+        "fetch_session_totals": lambda: read_models.fetch_session_totals(db),
+        "fetch_user_session_rows": lambda: read_models.fetch_user_session_rows(db, user_id),
+        "dto.fetch_session": lambda: dto.fetch_session(db, session_id),
+    }
+
+
+def measure(db, session_id):
+    counts = {}
+    for name, call in read_calls(db, session_id).items():
+        db.expunge_all() # بدون كائنات محملة مسبقًا في خريطة الهوية
+        counts[name] = count_statements(call)
+    return counts
+
+
+def test_statement_counts_do_not_grow_with_rows(db):
+    small = measure(db, seed_sessions(db, SESSIONS))
+    assert all(small.values())
+    large = measure(db, seed_sessions(db, SESSIONS * 9))
+    assert db.query(CashSession).count() == SESSIONS * 10
+    assert large == small
+
+
+def test_rows_match_orm_formulas(db):
+    session_id = seed_sessions(db, SESSIONS)
+    rows = {row.id: row for row in read_models.fetch_session_rows(db)}
+    assert len(rows) == SESSIONS
+    session = dto.fetch_session(db, session_id)
+    assert rows[session_id].total_expense == session.total_expense
+    assert sorted(t.description for t in session.transactions) == ["مصروف 0", "مصروف 1", "مصروف 2"]
+    totals = read_models.fetch_session_totals(db)
+    assert totals.sessions == SESSIONS
+    assert totals.total_expense == pytest.approx(sum(r.total_expense for r in rows.values()))
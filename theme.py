@@ -0,0 +1,19 @@
+"""
+أدوات التنسيق: ورقة أنماط واحدة تطبق على النافذة في apply_styles، وتغييرات الحالة
+(تحديد، مرور الفأرة، ...) تعبر عنها خصائص ديناميكية تطابقها قواعد مثل
+QFrame#HistoryCard[selected="true"] بدل استدعاء setStyleSheet لكل عنصر.
+"""
+
+
+def set_dynamic_property(widget, name, value):
+    """
+    يغير خاصية ديناميكية ويعيد تلميع العنصر وحده، فقط إذا تغيرت القيمة.
+    """
+    if widget.property(name) == value:
+        return False
+    widget.setProperty(name, value)
+    style = widget.style()
+    style.unpolish(widget)
+    style.polish(widget)
+    widget.update()
+    return True
@@ -0,0 +1,183 @@
+"""
+وحدة العمل: جلسة SQLAlchemy قصيرة العمر لكل عملية بدل جلسة واحدة طوال عمر النافذة.
+
+    with session_scope() as db:
+        db.add(...)
+
+الجلسة تُعتمد (commit) عند الخروج الطبيعي، ويتم التراجع عند الخطأ، وتغلق دائمًا.
+session_stats() يعرض عدد الجلسات المفتوحة وحجم خريطة الهوية (identity map) للمراقبة.
+
+تقارير المشرف تقرأ عبر read_snapshot(): اتصال قراءة فقط (mode=ro + query_only) داخل معاملة
+واحدة، فكل استعلامات التقرير ترى نفس حالة القاعدة حتى لو أغلق كاشير جلسة في منتصفه، وفي وضع
+WAL لا تحجز القراءة كتابة الكاشير ولا تحجزها. snapshot_stats() يعرض زمن انتظار قفل القراءة.
+"""
+import contextlib
+import sqlite3
+import threading
+import time
+import weakref
+
+from sqlalchemy.orm import Session
+
+from database_setup import SessionLocal, create_read_engine, DB_FILENAME
+from query_stats import query_stats
+
+READ_POOL_SIZE = 4
+
+
+class SessionTracker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._open = weakref.WeakSet()
+        self.opened_total = 0
+        self.peak_open = 0
+        self.last_identity_map = 0
+        self.peak_identity_map = 0
+
+    def opened(self, db):
+        with self._lock:
+            self._open.add(db)
+            self.opened_total += 1
+            self.peak_open = max(self.peak_open, len(self._open))
+
+    def closed(self, db):
+        size = len(db.identity_map)
+        with self._lock:
+            self._open.discard(db)
+            self.last_identity_map = size
+            self.peak_identity_map = max(self.peak_identity_map, size)
+
+    def snapshot(self):
+        with self._lock:
+            open_sessions = list(self._open)
+            return {
+                "open_sessions": len(open_sessions),
+                "open_identity_map": sum(len(db.identity_map) for db in open_sessions),
+                "opened_total": self.opened_total,
+                "peak_open_sessions": self.peak_open,
+                "last_identity_map": self.last_identity_map,
+                "peak_identity_map": self.peak_identity_map,
+            }
+
+
+tracker = SessionTracker()
+
+
+@contextlib.contextmanager
+def session_scope():
+    db = SessionLocal()
+    tracker.opened(db)
+    try:
+        yield db
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        tracker.closed(db)
+        db.close()
+
+
+def session_stats():
+    return tracker.snapshot()
+
+
+# -- إضافة --: لقطات القراءة لتقارير المشرف
+class SnapshotStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.snapshots = 0
+        self.open = 0
+        self.busy_errors = 0
+        self.total_wait_ms = 0.0
+        self.last_wait_ms = 0.0
+        self.max_wait_ms = 0.0
+        self.last_hold_ms = 0.0
+        self.max_hold_ms = 0.0
+
+    def started(self, wait_ms):
+        with self._lock:
+            self.snapshots += 1
+            self.open += 1
+            self.total_wait_ms += wait_ms
+            self.last_wait_ms = wait_ms
+            self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+
+    def finished(self, hold_ms):
+        # اللقطة الطويلة تؤخر دمج WAL في القاعدة (checkpoint)، فمدتها تستحق المراقبة
+        with self._lock:
+            self.open -= 1
+            self.last_hold_ms = hold_ms
+            self.max_hold_ms = max(self.max_hold_ms, hold_ms)
+
+    def busy(self):
+        with self._lock:
+            self.busy_errors += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "snapshots": self.snapshots,
+                "open_snapshots": self.open,
+                "busy_errors": self.busy_errors,
+                "avg_wait_ms": self.total_wait_ms / self.snapshots if self.snapshots else 0.0,
+                "last_wait_ms": self.last_wait_ms,
+                "max_wait_ms": self.max_wait_ms,
+                "last_hold_ms": self.last_hold_ms,
+                "max_hold_ms": self.max_hold_ms,
+            }
+
+
+snapshot_tracker = SnapshotStats()
+_read_engine = None
+_read_engine_lock = threading.Lock()
+
+
+def get_read_engine():
+    global _read_engine
+    with _read_engine_lock:
+        if _read_engine is None:
+            _read_engine = create_read_engine(DB_FILENAME, pool_size=READ_POOL_SIZE)
+            query_stats.watch(_read_engine)
+        return _read_engine
+
+
+def dispose_read_engine():
+    # قبل استبدال ملف القاعدة (استعادة نسخة): تغلق اتصالات القراءة المجمعة، والتالية تفتح من جديد
+    with _read_engine_lock:
+        if _read_engine is not None:
+            _read_engine.dispose()
+
+
+@contextlib.contextmanager
+def read_snapshot():
+    """
+    جلسة قراءة فقط على لقطة ثابتة من القاعدة طوال الكتلة؛ التراجع عند الخروج ينهي اللقطة.
+    """
+    db = Session(get_read_engine())
+    tracker.opened(db)
+    started = None
+    try:
+        # BEGIN وأول قراءة على اتصال DBAPI مباشرة (لا تحسب ضمن ميزانية استعلامات الإجراء):
+        # أول قراءة تأخذ قفل القراءة، ومنها تبدأ اللقطة
+        dbapi_connection = db.connection().connection.dbapi_connection
+        requested = time.perf_counter()
+        try:
+            dbapi_connection.execute("BEGIN")
+            dbapi_connection.execute("SELECT count(*) FROM sqlite_master").fetchone()
+        except sqlite3.OperationalError:
+            snapshot_tracker.busy()
+            raise
+        started = time.perf_counter()
+        snapshot_tracker.started((started - requested) * 1000.0)
+        yield db
+    finally:
+        db.rollback()
+        if started is not None:
+            snapshot_tracker.finished((time.perf_counter() - started) * 1000.0)
+        tracker.closed(db)
+        db.close()
+
+
+def snapshot_stats():
+    return snapshot_tracker.snapshot()
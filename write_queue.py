@@ -0,0 +1,301 @@
+"""
+طابور كتابة لإدخال المصاريف والفليكسي بسرعة.
+
+submit() يكتب العملية أولًا في ملف انتظار (pending_writes.jsonl، مع fsync) ثم يضعها
+في طابور يفرغه خيط عامل في معاملات مجمعة (group commit): ينتظر حتى MAX_LATENCY_MS
+أو MAX_BATCH عملية، ثم يدرج الكل في معاملة واحدة. معرف كل عملية يكتب في جدول
+write_queue_applied في نفس المعاملة، فإعادة تشغيل ملف الانتظار بعد انقطاع مفاجئ
+(replay_spool) لا تكرر أي عملية.
+
+الواجهة تعرض العملية فورًا (overlay_pending) وتستقبل نتيجتها عبر add_listener:
+committed(records) عند الحفظ، و failed(record, message) لإزالة الصف المتفائل.
+"""
+import dataclasses
+import datetime
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+
+from sqlalchemy import insert, select, delete
+from sqlalchemy.exc import OperationalError
+
+from database_setup import engine, Transaction, FlexiTransaction, AppliedWrite, intern_descriptions
+from dto import TransactionDTO, FlexiTransactionDTO
+
+SPOOL_FILENAME = "pending_writes.jsonl"
+MAX_BATCH = 200
+MAX_LATENCY_MS = 100
+MAX_RETRIES = 3 # لأخطاء القفل المؤقتة (database is locked)
+
+KIND_TABLES = {"expense": Transaction.__table__, "flexi": FlexiTransaction.__table__}
+
+
+def _now_iso():
+    return datetime.datetime.now(datetime.timezone.utc).isoformat()
+
+
+def expense_write(session_id, amount, description):
+    return {"op_id": uuid.uuid4().hex, "kind": "expense",
+            "values": {"session_id": session_id, "type": "expense", "amount": amount,
+                       "description": description, "timestamp": _now_iso()}}
+
+
+def flexi_write(session_id, user_id, amount, description, is_paid):
+    return {"op_id": uuid.uuid4().hex, "kind": "flexi",
+            "values": {"session_id": session_id, "user_id": user_id, "amount": amount,
+                       "description": description, "timestamp": _now_iso(), "is_paid": bool(is_paid)}}
+
+
+def _row_values(record):
+    values = dict(record["values"])
+    values["timestamp"] = datetime.datetime.fromisoformat(values["timestamp"])
+    return values
+
+
+def _insert_values(record, description_ids):
+    # نوع العملية (expense/flexi) هو نوع الوصف في descriptions
+    values = _row_values(record)
+    values["description_id"] = description_ids.get((record["kind"], values.pop("description", None)))
+    return values
+
+
+def pending_dto(record):
+    """
+    DTO مؤقت (id=None) للعرض المتفائل قبل الحفظ.
+    """
+    values = _row_values(record)
+    # SQLite يعيد التواريخ بدون منطقة زمنية (UTC)؛ نطابقها حتى يصح الترتيب مع الصفوف المحفوظة
+    values["timestamp"] = values["timestamp"].replace(tzinfo=None)
+    if record["kind"] == "expense":
+        return TransactionDTO(id=None, session_id=values["session_id"], type="expense", amount=values["amount"],
+                              description=values["description"], timestamp=values["timestamp"])
+    return FlexiTransactionDTO(id=None, session_id=values["session_id"], user_id=values["user_id"], amount=values["amount"],
+                               description=values["description"], timestamp=values["timestamp"], is_paid=values["is_paid"])
+
+
+def overlay_pending(session, records):
+    """
+    يعيد نسخة من SessionDTO تتضمن العمليات غير المحفوظة بعد ومجاميعها.
+    """
+    records = [r for r in records if r["values"]["session_id"] == session.id]
+    if not records:
+        return session
+    expenses = tuple(pending_dto(r) for r in records if r["kind"] == "expense")
+    flexis = tuple(pending_dto(r) for r in records if r["kind"] == "flexi")
+    return dataclasses.replace(
+        session,
+        transactions=session.transactions + expenses,
+        flexi_transactions=session.flexi_transactions + flexis,
+        total_expense=session.total_expense + sum(t.amount for t in expenses),
+        total_flexi_paid=session.total_flexi_paid + sum(t.amount for t in flexis if t.is_paid),
+        total_flexi_additions=session.total_flexi_additions + sum(t.amount for t in flexis),
+    )
+
+
+class WriteQueue:
+    def __init__(self, db_engine=engine, spool_path=SPOOL_FILENAME,
+                 max_batch=MAX_BATCH, max_latency_ms=MAX_LATENCY_MS):
+        self.engine = db_engine
+        self.spool_path = spool_path
+        self.max_batch = max_batch
+        self.max_latency = max_latency_ms / 1000.0
+        self._queue = queue.Queue()
+        self._lock = threading.Condition()
+        self._pending = {} # op_id -> record (مرسلة ولم تحفظ أو تفشل بعد)
+        self._applied_since_truncate = []
+        self._spool = None
+        self._thread = None
+        self._listeners = []
+        self.batches = 0
+        self.committed = 0
+
+    # --- واجهة الاستعمال ---
+    def add_listener(self, on_committed, on_failed):
+        self._listeners.append((on_committed, on_failed))
+
+    def remove_listener(self, on_committed, on_failed):
+        if (on_committed, on_failed) in self._listeners:
+            self._listeners.remove((on_committed, on_failed))
+
+    def submit(self, record):
+        with self._lock:
+            self._append_spool(record)
+            self._pending[record["op_id"]] = record
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="WriteQueue", daemon=True)
+                self._thread.start()
+        self._queue.put(record)
+        return record["op_id"]
+
+    def pending(self):
+        with self._lock:
+            return list(self._pending.values())
+
+    def flush(self, timeout=5.0):
+        """
+        ينتظر حفظ كل العمليات المرسلة؛ يعيد False إذا انتهت المهلة.
+        """
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            while self._pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._lock.wait(remaining)
+        return True
+
+    # --- ملف الانتظار ---
+    def _append_spool(self, record):
+        if self._spool is None:
+            self._spool = open(self.spool_path, "a", encoding="utf-8")
+        self._spool.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._spool.flush()
+        os.fsync(self._spool.fileno())
+
+    def _truncate_spool(self):
+        if self._spool is not None:
+            self._spool.seek(0)
+            self._spool.truncate()
+            self._spool.flush()
+            os.fsync(self._spool.fileno())
+
+    # --- الخيط العامل ---
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_latency
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            # الخيط العامل لا يموت بخطأ غير متوقع: العمليات تعتبر فاشلة ويستمر الطابور
+            try:
+                committed, failed = self._write_with_retry(batch)
+            except Exception as e:
+                print(f"Write queue: batch of {len(batch)} failed unexpectedly ({e})")
+                committed, failed = [], [(record, str(e)) for record in batch]
+            try:
+                self._finish(committed, failed)
+            except Exception as e:
+                print(f"Write queue: could not finish batch of {len(batch)} ({e})")
+
+    def _write(self, conn, records):
+        description_ids = intern_descriptions(conn, [(r["kind"], r["values"].get("description")) for r in records])
+        for kind, table in KIND_TABLES.items():
+            rows = [_insert_values(r, description_ids) for r in records if r["kind"] == kind]
+            if rows:
+                conn.execute(insert(table), rows)
+        conn.execute(insert(AppliedWrite.__table__), [{"op_id": r["op_id"]} for r in records])
+
+    def _write_with_retry(self, batch):
+        for attempt in range(MAX_RETRIES):
+            try:
+                with self.engine.begin() as conn:
+                    self._write(conn, batch)
+                self.batches += 1
+                return batch, []
+            except OperationalError as e:
+                print(f"Write queue: batch of {len(batch)} failed ({e}), retrying...")
+                time.sleep(0.2 * (attempt + 1))
+            except Exception as e:
+                print(f"Write queue: batch of {len(batch)} rejected ({e}), isolating rows...")
+                break
+        # عزل العمليات واحدة واحدة حتى لا تسقط عملية خاطئة بقية الدفعة
+        committed, failed = [], []
+        for record in batch:
+            try:
+                with self.engine.begin() as conn:
+                    self._write(conn, [record])
+                committed.append(record)
+            except Exception as e:
+                failed.append((record, str(e)))
+        return committed, failed
+
+    @staticmethod
+    def _notify(listener, *args):
+        try:
+            listener(*args)
+        except Exception as e: # مستمع معطوب لا يوقف الطابور ولا بقية المستمعين
+            print(f"Write queue: listener {getattr(listener, '__qualname__', listener)} failed: {e}")
+
+    def _finish(self, committed, failed):
+        # نبلغ المستمعين قبل إزالة العمليات من _pending حتى لا يعود flush() قبل وصول النتيجة
+        applied_ids = None
+        try:
+            for on_committed, on_failed in list(self._listeners):
+                if committed:
+                    self._notify(on_committed, committed)
+                for record, message in failed:
+                    self._notify(on_failed, record, message)
+        finally:
+            with self._lock:
+                for record in committed:
+                    self._pending.pop(record["op_id"], None)
+                    self._applied_since_truncate.append(record["op_id"])
+                for record, _ in failed:
+                    self._pending.pop(record["op_id"], None)
+                self.committed += len(committed)
+                if not self._pending:
+                    # كل ما في ملف الانتظار حفظ أو رفض: نفرغه ثم نحذف معرفاته من الجدول
+                    try:
+                        self._truncate_spool()
+                        applied_ids, self._applied_since_truncate = self._applied_since_truncate, []
+                    except OSError as e: # المعرفات تبقى حتى لا تتكرر العمليات عند إعادة التشغيل
+                        print(f"Write queue: could not truncate spool: {e}")
+                self._lock.notify_all()
+        if applied_ids:
+            _forget_applied(self.engine, applied_ids)
+
+
+def _forget_applied(db_engine, op_ids):
+    try:
+        with db_engine.begin() as conn:
+            conn.execute(delete(AppliedWrite.__table__).where(AppliedWrite.op_id.in_(op_ids)))
+    except Exception as e:
+        print(f"Write queue: could not prune applied ids: {e}")
+
+
+def _read_spool(path):
+    records = []
+    try:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError: # آخر سطر قد يكون ناقصًا بعد انقطاع
+                    continue
+    except FileNotFoundError:
+        pass
+    return records
+
+
+def replay_spool(db_engine=engine, spool_path=SPOOL_FILENAME):
+    """
+    يطبق العمليات المتبقية في ملف الانتظار من تشغيل سابق (مرة واحدة لكل عملية).
+    يستدعى عند بدء التطبيق قبل فتح أي واجهة. يعيد عدد العمليات المطبقة.
+    """
+    records = _read_spool(spool_path)
+    if not records:
+        return 0
+    with db_engine.connect() as conn:
+        applied = set(conn.execute(select(AppliedWrite.op_id).where(
+            AppliedWrite.op_id.in_([r["op_id"] for r in records]))).scalars())
+    remaining = [r for r in records if r["op_id"] not in applied]
+    replayer = WriteQueue(db_engine, spool_path)
+    committed, failed = replayer._write_with_retry(remaining) if remaining else ([], [])
+    for record, message in failed:
+        print(f"Write queue: dropped unrecoverable operation {record['op_id']}: {message}")
+    open(spool_path, "w").close()
+    _forget_applied(db_engine, [r["op_id"] for r in records])
+    print(f"Write queue: replayed {len(committed)} pending operation(s).")
+    return len(committed)
+
+
+write_queue = WriteQueue()